@@ -17,6 +17,7 @@ from OpenOversight.app.email_client import EmailClient
 from OpenOversight.app.filters import instantiate_filters
 from OpenOversight.app.models.config import config
 from OpenOversight.app.models.database import db
+from OpenOversight.app.models.database_cache import init_database_cache
 from OpenOversight.app.models.users import AnonymousUser
 from OpenOversight.app.utils.constants import MEGABYTE
 
@@ -45,6 +46,7 @@ def create_app(config_name="default"):
     bootstrap.init_app(app)
     csrf.init_app(app)
     db.init_app(app)
+    init_database_cache(app)
     with app.app_context():
         EmailClient()
     limiter.init_app(app)
@@ -131,6 +133,8 @@ def create_app(config_name="default"):
         link_images_to_department,
         link_officers_to_department,
         make_admin_user,
+        refresh_department_stats_command,
+        render_exports_command,
     )
 
     app.cli.add_command(make_admin_user)
@@ -140,6 +144,8 @@ def create_app(config_name="default"):
     app.cli.add_command(add_department)
     app.cli.add_command(add_job_title)
     app.cli.add_command(advanced_csv_import)
+    app.cli.add_command(render_exports_command)
+    app.cli.add_command(refresh_department_stats_command)
 
     return app
 
@@ -1,17 +1,24 @@
 import csv
 import sys
 from builtins import input
+from collections import defaultdict
 from datetime import date, datetime
 from getpass import getpass
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
 import click
 import us
 from dateutil.parser import parse
 from flask import current_app
 from flask.cli import with_appcontext
+from sqlalchemy.orm.exc import MultipleResultsFound
 
-from OpenOversight.app.csv_imports import import_csv_files
+from OpenOversight.app.csv_imports import (
+    DEFAULT_CHECKPOINT,
+    bulk_import_csv_files,
+    import_csv_files,
+)
+from OpenOversight.app.main.downloads import render_exports
 from OpenOversight.app.models.database import (
     Assignment,
     Department,
@@ -22,14 +29,15 @@ from OpenOversight.app.models.database import (
     Unit,
     User,
     db,
+    refresh_department_stats,
 )
 from OpenOversight.app.utils.constants import (
     ENCODING_UTF_8,
     KEY_ENV,
     KEY_ENV_PROD,
     KEY_ENV_TESTING,
+    KEY_EXPORTS_DIR,
 )
-from OpenOversight.app.utils.db import get_officer
 from OpenOversight.app.utils.general import normalize_gender, prompt_yes_no, str_is_true
 
 
@@ -155,6 +163,91 @@ class ImportLog:
         cls.created_officers = {}
 
 
+class OfficerIndex:
+    """The officers of a department, indexed by unique internal identifier, by badge
+    number and name and by name, so that the rows of a csv are matched without a
+    query each. The assignments and salaries of the officers are loaded along with
+    them, to compare the rows to.
+    """
+
+    def __init__(self, department_id: int):
+        self.by_uid: Dict[str, List[Officer]] = defaultdict(list)
+        self.by_badge_and_name: Dict[Tuple[str, str, str], List[Officer]] = defaultdict(
+            list
+        )
+        self.by_name: Dict[Tuple[str, str], List[Officer]] = defaultdict(list)
+        self.assignments: Dict[int, List[Tuple[Assignment, Job]]] = defaultdict(list)
+        self.salaries: Dict[int, List[Salary]] = defaultdict(list)
+        self.star_nos: Dict[int, List[str]] = defaultdict(list)
+
+        officers = Officer.query.filter_by(department_id=department_id).all()
+        for assignment, job in (
+            db.session.query(Assignment, Job)
+            .join(Assignment.base_officer)
+            .outerjoin(Job, Assignment.job_id == Job.id)
+            .filter(Officer.department_id == department_id)
+            .order_by(Assignment.id)
+        ):
+            if job is not None:
+                self.assignments[assignment.officer_id].append((assignment, job))
+            if assignment.star_no:
+                self.star_nos[assignment.officer_id].append(assignment.star_no)
+        for salary in (
+            Salary.query.join(Salary.officer)
+            .filter(Officer.department_id == department_id)
+            .order_by(Salary.id)
+        ):
+            self.salaries[salary.officer_id].append(salary)
+        for officer in officers:
+            self.add(officer)
+
+    def _keys(self, officer):
+        name = (officer.first_name, officer.last_name)
+        if officer.unique_internal_identifier:
+            yield self.by_uid, officer.unique_internal_identifier
+        for star_no in self.star_nos[officer.id]:
+            yield self.by_badge_and_name, (str(star_no), *name)
+        yield self.by_name, name
+
+    def add(self, officer: Officer) -> None:
+        """Index the officer by its current fields and badge numbers."""
+        for index, key in self._keys(officer):
+            if officer not in index[key]:
+                index[key].append(officer)
+
+    def remove(self, officer: Officer) -> None:
+        """Drop the officer from the indexes, before its fields are changed."""
+        for index, key in self._keys(officer):
+            if officer in index.get(key, []):
+                index[key].remove(officer)
+
+    def add_star_no(self, officer: Officer, star_no: Optional[str]) -> None:
+        if star_no:
+            self.star_nos[officer.id].append(star_no)
+            self.add(officer)
+
+    @staticmethod
+    def _one_or_none(officers: List[Officer]) -> Optional[Officer]:
+        if len(officers) > 1:
+            raise MultipleResultsFound(
+                "Multiple rows were found when one or none was required"
+            )
+        return officers[0] if officers else None
+
+    def get_by_uid(self, unique_internal_identifier: str) -> Optional[Officer]:
+        return self._one_or_none(self.by_uid.get(unique_internal_identifier, []))
+
+    def get_by_badge_and_name(
+        self, star_no: str, first_name: str, last_name: str
+    ) -> Optional[Officer]:
+        """Return the first officer with the given name and badge number."""
+        officers = self.by_badge_and_name.get((str(star_no), first_name, last_name))
+        return officers[0] if officers else None
+
+    def get_by_name(self, first_name: str, last_name: str) -> Optional[Officer]:
+        return self._one_or_none(self.by_name.get((first_name, last_name), []))
+
+
 def row_has_data(row, required_fields, optional_fields):
     for field in required_fields:
         if field not in row or not row[field]:
@@ -180,7 +273,10 @@ def set_field_from_row(row, obj, attribute, allow_blank=True, field_name=None):
         setattr(obj, attribute, val)
 
 
-def update_officer_from_row(row, officer, update_static_fields=False):
+def update_officer_from_row(row, officer, update_static_fields=False, index=None):
+    if index:
+        index.remove(officer)
+
     def update_officer_field(officer_field_name):
         if officer_field_name not in row:
             return
@@ -250,11 +346,13 @@ def update_officer_from_row(row, officer, update_static_fields=False):
                 else:
                     raise Exception(msg)
 
-    process_assignment(row, officer, compare=True)
-    process_salary(row, officer, compare=True)
+    process_assignment(row, officer, compare=True, index=index)
+    process_salary(row, officer, compare=True, index=index)
+    if index:
+        index.add(officer)
 
 
-def create_officer_from_row(row, department_id):
+def create_officer_from_row(row, department_id, index=None):
     officer = Officer()
     officer.department_id = department_id
 
@@ -271,9 +369,11 @@ def create_officer_from_row(row, department_id):
     db.session.flush()
 
     ImportLog.log_new_officer(officer)
+    if index:
+        index.add(officer)
 
-    process_assignment(row, officer, compare=False)
-    process_salary(row, officer, compare=False)
+    process_assignment(row, officer, compare=False, index=index)
+    process_salary(row, officer, compare=False, index=index)
 
 
 def is_equal(a, b):
@@ -309,7 +409,7 @@ def is_equal(a, b):
     )
 
 
-def process_assignment(row, officer, compare=False):
+def process_assignment(row, officer, compare=False, index=None):
     assignment_fields = {
         "required": [],
         "optional": ["job_title", "star_no", "unit_id", "start_date", "resign_date"],
@@ -320,12 +420,15 @@ def process_assignment(row, officer, compare=False):
         add_assignment = True
         if compare:
             # Get existing assignments for officer and compare to row data
-            assignments = (
-                db.session.query(Assignment, Job)
-                .filter(Assignment.job_id == Job.id)
-                .filter_by(officer_id=officer.id)
-                .all()
-            )
+            if index:
+                assignments = index.assignments[officer.id]
+            else:
+                assignments = (
+                    db.session.query(Assignment, Job)
+                    .filter(Assignment.job_id == Job.id)
+                    .filter_by(officer_id=officer.id)
+                    .all()
+                )
             for assignment, job in assignments:
                 assignment_field_names = [
                     "star_no",
@@ -387,11 +490,14 @@ def process_assignment(row, officer, compare=False):
             set_field_from_row(row, assignment, "resign_date", allow_blank=False)
             db.session.add(assignment)
             db.session.flush()
+            if index:
+                index.assignments[officer.id].append((assignment, job))
+                index.add_star_no(officer, assignment.star_no)
 
             ImportLog.log_change(officer, f"Added assignment: {assignment}")
 
 
-def process_salary(row, officer, compare=False):
+def process_salary(row, officer, compare=False, index=None):
     salary_fields = {
         "required": ["salary", "salary_year", "salary_is_fiscal_year"],
         "optional": ["overtime_pay"],
@@ -404,7 +510,10 @@ def process_salary(row, officer, compare=False):
         add_salary = True
         if compare:
             # Get existing salaries for officer and compare to row data
-            salaries = Salary.query.filter_by(officer_id=officer.id).all()
+            if index:
+                salaries = index.salaries[officer.id]
+            else:
+                salaries = Salary.query.filter_by(officer_id=officer.id).all()
             for salary in salaries:
                 from decimal import Decimal
 
@@ -443,6 +552,8 @@ def process_salary(row, officer, compare=False):
                 salary.overtime_pay = float(row["overtime_pay"])
             db.session.add(salary)
             db.session.flush()
+            if index:
+                index.salaries[officer.id].append(salary)
 
             ImportLog.log_change(officer, f"Added salary: {salary}")
 
@@ -478,6 +589,7 @@ def bulk_add_officers(filename, no_create, update_by_name, update_static_fields)
         ImportLog.clear_logs()
         csvfile = csv.DictReader(f)
         departments = {}
+        officer_indexes: Dict[str, OfficerIndex] = {}
 
         required_fields = [
             "department_id",
@@ -505,8 +617,10 @@ def bulk_add_officers(filename, no_create, update_by_name, update_static_fields)
                 department = db.session.get(Department, department_id)
                 if department:
                     departments[department_id] = department
+                    officer_indexes[department_id] = OfficerIndex(department.id)
                 else:
                     raise Exception(f"Department ID {department_id} not found")
+            index = officer_indexes[department_id]
 
             if not update_by_name:
                 # Check for existing officer based on unique ID or name/badge
@@ -514,16 +628,10 @@ def bulk_add_officers(filename, no_create, update_by_name, update_static_fields)
                     "unique_internal_identifier" in csvfile.fieldnames
                     and row["unique_internal_identifier"]
                 ):
-                    officer = Officer.query.filter_by(
-                        department_id=department_id,
-                        unique_internal_identifier=row["unique_internal_identifier"],
-                    ).one_or_none()
+                    officer = index.get_by_uid(row["unique_internal_identifier"])
                 elif "star_no" in csvfile.fieldnames and row["star_no"]:
-                    officer = get_officer(
-                        department_id,
-                        row["star_no"],
-                        row["first_name"],
-                        row["last_name"],
+                    officer = index.get_by_badge_and_name(
+                        row["star_no"], row["first_name"], row["last_name"]
                     )
                 else:
                     raise Exception(
@@ -531,16 +639,12 @@ def bulk_add_officers(filename, no_create, update_by_name, update_static_fields)
                         "missing badge number and unique identifier"
                     )
             else:
-                officer = Officer.query.filter_by(
-                    department_id=department_id,
-                    last_name=row["last_name"],
-                    first_name=row["first_name"],
-                ).one_or_none()
+                officer = index.get_by_name(row["first_name"], row["last_name"])
 
             if officer:
-                update_officer_from_row(row, officer, update_static_fields)
+                update_officer_from_row(row, officer, update_static_fields, index)
             elif not no_create:
-                create_officer_from_row(row, department_id)
+                create_officer_from_row(row, department_id, index)
 
         ImportLog.print_logs()
         if current_app.config[KEY_ENV] == KEY_ENV_TESTING or prompt_yes_no(
@@ -570,6 +674,34 @@ def bulk_add_officers(filename, no_create, update_by_name, update_static_fields)
 @click.option("--incidents-csv", type=click.Path(exists=True))
 @click.option("--force-create", is_flag=True, help="Only for development/testing!")
 @click.option("--overwrite-assignments", is_flag=True)
+@click.option(
+    "--bulk",
+    is_flag=True,
+    help="Load the rows with set-based statements, which is much faster for large files",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of processes that parse and check the rows of the csv files",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    help="Commit every CHUNK_SIZE rows and record the progress in the checkpoint file",
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False),
+    default=DEFAULT_CHECKPOINT,
+    show_default=True,
+    help="File that records the progress of a chunked import",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Continue a chunked import from the checkpoint file",
+)
 @with_appcontext
 def advanced_csv_import(
     department_name,
@@ -581,6 +713,11 @@ def advanced_csv_import(
     incidents_csv,
     force_create,
     overwrite_assignments,
+    bulk,
+    workers,
+    chunk_size,
+    checkpoint,
+    resume,
 ):
     """
     Add or update officers, assignments, salaries, links and incidents from
@@ -589,13 +726,32 @@ def advanced_csv_import(
     The csv files are treated as the source of truth.
     Existing entries might be overwritten as a result, backing up the
     database and running the command locally first is highly recommended.
+    Nothing is changed if any row is invalid, and the errors of all invalid
+    rows of a file are reported together.
+
+    With --bulk the rows are staged in temporary tables and merged with a few
+    statements per table instead of one object at a time. Each id may only be
+    listed once per file then.
+
+    With --chunk-size the rows are committed in chunks, and the progress is
+    recorded in the checkpoint file. The chunks before an invalid row are kept
+    then, and an interrupted import can be continued with --resume.
 
     See the documentation before running the command.
     """
     if force_create and current_app.config[KEY_ENV] == KEY_ENV_PROD:
         raise Exception("--force-create cannot be used in production!")
 
-    import_csv_files(
+    if bulk and (chunk_size or resume):
+        raise Exception("--chunk-size and --resume cannot be used with --bulk!")
+
+    chunk_options = (
+        {}
+        if bulk
+        else {"chunk_size": chunk_size, "checkpoint_path": checkpoint, "resume": resume}
+    )
+    import_files = bulk_import_csv_files if bulk else import_csv_files
+    import_files(
         department_name,
         department_state,
         officers_csv,
@@ -605,6 +761,8 @@ def advanced_csv_import(
         incidents_csv,
         force_create,
         overwrite_assignments,
+        workers,
+        **chunk_options,
     )
 
 
@@ -650,3 +808,41 @@ def add_job_title(department_id, job_title, is_sworn_officer, order):
     db.session.add(job)
     print(f"Added {job.job_title} to {department.name}")
     db.session.commit()
+
+
+@click.command("render-exports")
+@click.option(
+    "--department-id",
+    "department_ids",
+    type=int,
+    multiple=True,
+    help="Only render the exports of this department, can be repeated",
+)
+@click.option(
+    "--force", is_flag=True, help="Render exports that are already up to date too"
+)
+@with_appcontext
+def render_exports_command(department_ids, force):
+    """Render the CSV downloads of departments whose data changed to EXPORTS_DIR."""
+    if not current_app.config[KEY_EXPORTS_DIR]:
+        raise click.UsageError(f"Set {KEY_EXPORTS_DIR} to render exports")
+    rendered = render_exports(list(department_ids) or None, force)
+    print(f"Rendered the exports of {len(rendered)} departments")
+
+
+@click.command("refresh-department-stats")
+@click.option(
+    "--department-id",
+    "department_ids",
+    type=int,
+    multiple=True,
+    help="Only recount the stats of this department, can be repeated",
+)
+@with_appcontext
+def refresh_department_stats_command(department_ids):
+    """Recount the officer, assignment and incident totals of departments, in case
+    changes made outside of the application have left them off.
+    """
+    refresh_department_stats(db.session.connection(), list(department_ids) or None)
+    db.session.commit()
+    print("Recounted the department stats")
@@ -1,35 +1,98 @@
 import csv
+import io
+import json
+import os
+from collections import deque
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
-from typing import Dict, Optional
+from datetime import date, datetime, time
+from itertools import chain, islice
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
-from sqlalchemy import sql
+from sqlalchemy import (
+    Column,
+    MetaData,
+    Table,
+    and_,
+    delete,
+    exists,
+    func,
+    insert,
+    literal,
+    select,
+    sql,
+    true,
+    union,
+)
 from sqlalchemy.exc import SQLAlchemyError
 
 from OpenOversight.app.models.database import (
     Assignment,
     Department,
     Incident,
-    Job,
+    LicensePlate,
     Link,
+    Location,
     Officer,
     Salary,
-    Unit,
+    Tombstone,
+    add_tombstones,
+    bump_department_generations,
     db,
+    incident_license_plates,
+    incident_links,
+    normalize_star_no,
+    officer_incidents,
+    officer_links,
+    refresh_department_stats,
+    update_current_assignments,
+    upsert,
 )
 from OpenOversight.app.models.database_imports import (
+    ImportContext,
+    assignment_values_from_dict,
     create_assignment_from_dict,
     create_incident_from_dict,
     create_link_from_dict,
     create_officer_from_dict,
     create_salary_from_dict,
-    get_or_create_license_plate_from_dict,
-    get_or_create_location_from_dict,
+    incident_values_from_dict,
+    license_plate_values_from_dict,
+    link_values_from_dict,
+    location_values_from_dict,
+    officer_values_from_dict,
+    parse_bool,
+    parse_date,
+    parse_float,
+    parse_int,
+    parse_str,
+    parse_time,
+    salary_values_from_dict,
     update_assignment_from_dict,
     update_incident_from_dict,
     update_link_from_dict,
     update_officer_from_dict,
     update_salary_from_dict,
 )
+from OpenOversight.app.validators import (
+    state_validator,
+    url_validator,
+    zip_code_validator,
+)
 
 
 def _create_or_update_model(
@@ -37,22 +100,25 @@ def _create_or_update_model(
     existing_model_lookup,
     create_method,
     update_method,
+    context,
     force_create=False,
     model=None,
     always_create=False,
 ):
     if (always_create and not force_create) or not row["id"]:
-        return create_method(row)
+        return create_method(row, context=context)
     else:
         if not force_create:
-            return update_method(row, existing_model_lookup[int(row["id"])])
+            return update_method(
+                row, existing_model_lookup[int(row["id"])], context=context
+            )
         else:
             if model is not None:
                 existing = db.session.get(model, int(row["id"]))
                 if existing:
                     db.session.delete(existing)
                     db.session.flush()
-            return create_method(row, force_id=True)
+            return create_method(row, force_id=True, context=context)
 
 
 def _check_provided_fields(dict_reader, required_fields, optional_fields, csv_name):
@@ -76,80 +142,643 @@ def _objects_from_split_field(field, model_lookup):
     return []
 
 
+def _department_error(
+    row, department_name: str, department_state: str
+) -> Optional[str]:
+    if (row.get("department_name"), row.get("department_state")) == (
+        department_name,
+        department_state,
+    ):
+        return None
+    return (
+        f"department {row.get('department_name')} ({row.get('department_state')}) "
+        f"is not {department_name} ({department_state})"
+    )
+
+
+def _officer_error(row, all_officers) -> Optional[str]:
+    if row["officer_id"] in all_officers:
+        return None
+    return f"Officer with id {row['officer_id']} does not exist (in this department)"
+
+
+def _unit_error(row, unit_ids: Collection[int]) -> Optional[str]:
+    if int(row["unit_id"]) in unit_ids:
+        return None
+    return f"unit_id: unit {row['unit_id']} does not exist (in this department)"
+
+
+def _split_field_error(row, field: str, model_lookup) -> Optional[str]:
+    if not row.get(field):
+        return None
+    missing = [
+        object_id
+        for object_id in row[field].split("|")
+        if object_id not in model_lookup
+    ]
+    if not missing:
+        return None
+    return f"{field}: {', '.join(missing)} not found (in this department)"
+
+
 def _unify_field_names(fieldnames):
     return [field_name.lower().replace(" ", "_") for field_name in fieldnames]
 
 
+class _CsvLines:
+    """The lines of a csv file, which keeps track of the byte offset after the last
+    line read. The lines after the header can start at an offset of an earlier read.
+    """
+
+    def __init__(self, f, start: int = 0):
+        self.f = f
+        self.start = start
+        self.offset = 0
+
+    def __iter__(self) -> Iterator[str]:
+        header = self.f.readline()
+        self.offset = len(header)
+        yield header.decode()
+        if self.start > self.offset:
+            self.f.seek(self.start)
+            self.offset = self.start
+        for line in self.f:
+            self.offset += len(line)
+            yield line.decode()
+
+
+class _CsvReader(csv.DictReader):
+    """A csv.DictReader that knows the byte offset and the line number after the
+    last row it read, counting the lines that were skipped by starting at an offset.
+    """
+
+    def __init__(self, lines: _CsvLines, skipped_lines: int = 0):
+        super().__init__(lines)
+        self.lines = lines
+        self.skipped_lines = skipped_lines
+
+    def __next__(self) -> Dict[str, Any]:
+        row = super().__next__()
+        self.line_num += self.skipped_lines
+        return row
+
+    @property
+    def offset(self) -> int:
+        return self.lines.offset
+
+
 @contextmanager
-def _csv_reader(csv_filename):
-    with open(csv_filename) as f:
-        csv_reader = csv.DictReader(f)
+def _csv_reader(csv_filename, offset: int = 0, line_num: int = 0):
+    with open(csv_filename, "rb") as f:
+        # the reader counts the header again when it starts at an offset
+        csv_reader = _CsvReader(_CsvLines(f, offset), line_num - 1 if offset else 0)
         csv_reader.fieldnames = _unify_field_names(csv_reader.fieldnames)
         yield csv_reader
 
 
+def _check_officers_csv(csv_reader, force_create: bool) -> None:
+    _check_provided_fields(
+        csv_reader,
+        required_fields=["id", "department_name", "department_state"]
+        if not force_create
+        else ["id"],
+        optional_fields=[
+            "last_name",
+            "first_name",
+            "middle_initial",
+            "suffix",
+            "race",
+            "gender",
+            "employment_date",
+            "birth_year",
+            "unique_internal_identifier",
+            "department_name",
+            "department_state",
+            # the following are unused, but allowed since they are included in the
+            # csv output
+            "badge_number",
+            "unique_identifier",
+            "job_title",
+            "most_recent_salary",
+            "last_employment_date",
+            "last_employment_notice",
+        ],
+        csv_name="officers",
+    )
+
+
+def _check_assignments_csv(csv_reader, overwrite_assignments: bool) -> None:
+    field_names = csv_reader.fieldnames
+    if "start_date" in field_names:
+        field_names[field_names.index("start_date")] = "start_date"
+    if "badge_number" in field_names:
+        field_names[field_names.index("badge_number")] = "star_no"
+    if "end_date" in field_names:
+        field_names[field_names.index("end_date")] = "resign_date"
+    if "unit_description" in field_names:
+        field_names[field_names.index("unit_description")] = "unit_name"
+    required_fields = ["officer_id", "job_title"]
+    if not overwrite_assignments:
+        required_fields.append("id")
+
+    _check_provided_fields(
+        csv_reader,
+        required_fields=required_fields,
+        optional_fields=[
+            "id",
+            "star_no",
+            "unit_id",
+            "unit_name",
+            "start_date",
+            "resign_date",
+            "officer_unique_identifier",
+        ],
+        csv_name="assignments",
+    )
+
+
+def _check_salaries_csv(csv_reader) -> None:
+    _check_provided_fields(
+        csv_reader,
+        required_fields=["id", "officer_id", "salary", "year"],
+        optional_fields=["overtime_pay", "is_fiscal_year"],
+        csv_name="salaries",
+    )
+
+
+def _check_incidents_csv(csv_reader) -> None:
+    _check_provided_fields(
+        csv_reader,
+        required_fields=["id", "department_name", "department_state"],
+        optional_fields=[
+            "date",
+            "time",
+            "report_number",
+            "description",
+            "street_name",
+            "cross_street1",
+            "cross_street2",
+            "city",
+            "state",
+            "zip_code",
+            "created_by",
+            "last_updated_by",
+            "officer_ids",
+            "license_plates",
+        ],
+        csv_name="incidents",
+    )
+
+
+def _check_links_csv(csv_reader) -> None:
+    _check_provided_fields(
+        csv_reader,
+        required_fields=["id", "url"],
+        optional_fields=[
+            "title",
+            "link_type",
+            "description",
+            "author",
+            "created_by",
+            "officer_ids",
+            "incident_ids",
+        ],
+        csv_name="links",
+    )
+
+
+PARSE_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+RowParsers = Dict[str, Callable[[Any], Any]]
+
+
+def _valid_id(value: Optional[str]) -> Optional[str]:
+    """Check an id column, which is empty, a #placeholder or a number."""
+    if value and not value.startswith("#"):
+        int(value)
+    return value
+
+
+def _valid_ids(value: Optional[str]) -> Optional[str]:
+    for object_id in (value or "").split("|"):
+        _valid_id(object_id)
+    return value
+
+
+def _valid_state(value: Optional[str]) -> Optional[str]:
+    state_validator(parse_str(value, None))
+    return value
+
+
+def _valid_zip_code(value: Optional[str]) -> Optional[str]:
+    zip_code = parse_str(value, None)
+    if zip_code:
+        zip_code_validator(zip_code)
+    return value
+
+
+def _valid_license_plates(value: Optional[str]) -> Optional[str]:
+    for license_plate_str in (value or "").split("|"):
+        if license_plate_str:
+            license_plate_values_from_dict(
+                dict(zip(["number", "state"], license_plate_str.split("_")))
+            )
+    return value
+
+
+# How to parse or check the columns of each csv that don't need the database. The
+# parsed values are stored in the rows, which the import then passes through as is
+OFFICER_ROW_PARSERS: RowParsers = {
+    "id": _valid_id,
+    "employment_date": parse_date,
+    "birth_year": parse_int,
+}
+ASSIGNMENT_ROW_PARSERS: RowParsers = {
+    "id": _valid_id,
+    "officer_id": _valid_id,
+    "unit_id": parse_int,
+    "start_date": parse_date,
+    "resign_date": parse_date,
+}
+SALARY_ROW_PARSERS: RowParsers = {
+    "id": _valid_id,
+    "officer_id": _valid_id,
+    "salary": float,
+    "overtime_pay": parse_float,
+    "year": int,
+    "is_fiscal_year": parse_bool,
+}
+INCIDENT_ROW_PARSERS: RowParsers = {
+    "id": _valid_id,
+    "date": parse_date,
+    "time": parse_time,
+    "state": _valid_state,
+    "zip_code": _valid_zip_code,
+    "created_by": parse_int,
+    "last_updated_by": parse_int,
+    "officer_ids": _valid_ids,
+    "license_plates": _valid_license_plates,
+}
+LINK_ROW_PARSERS: RowParsers = {
+    "id": _valid_id,
+    "url": url_validator,
+    "created_by": parse_int,
+    "officer_ids": _valid_ids,
+    "incident_ids": _valid_ids,
+}
+
+
+def _parse_rows(
+    parsers: RowParsers, numbered_rows: List[Tuple[int, int, Dict[str, Any]]]
+) -> Tuple[List[Dict[str, Any]], List[Tuple[int, int]], List[Tuple[int, str]]]:
+    """Parse a chunk of csv rows, and return the valid ones with the byte offsets and
+    line numbers after them, and the errors of the others by their line numbers.
+    """
+    rows, positions, errors = [], [], []
+    for line_num, offset, row in numbered_rows:
+        row_errors = []
+        for field, parse in parsers.items():
+            if field in row:
+                try:
+                    row[field] = parse(row[field])
+                except (ValueError, TypeError, OverflowError) as e:
+                    row_errors.append(f"{field}: {e}")
+        if row_errors:
+            errors.append((line_num, "; ".join(row_errors)))
+        else:
+            rows.append(row)
+            positions.append((offset, line_num))
+    return rows, positions, errors
+
+
+class _ParsedRows:
+    """The rows of a csv file in batches, parsed and checked with the given parsers.
+
+    With more than one worker, a pool of processes parses the next chunks of rows
+    while the current batch is applied. Only a few chunks are in flight at a time, so
+    the memory used does not grow with the size of the file.
+
+    Invalid rows are left out of the batches, and rows that turn out to be invalid
+    when they are applied are passed to reject(). Their errors are collected and raised
+    together by check(), once the whole file has been read. The byte offsets and line
+    numbers after the rows of the last batch that was returned are kept in positions.
+    """
+
+    def __init__(
+        self,
+        csv_reader,
+        parsers: RowParsers,
+        workers: int = 1,
+        batch_size: int = PARSE_BATCH_SIZE,
+    ):
+        self.csv_reader = csv_reader
+        self.parsers = parsers
+        self.workers = workers
+        self.batch_size = batch_size
+        self.errors: List[Tuple[int, str]] = []
+        self.positions: List[Tuple[int, int]] = []
+
+    def _chunks(self) -> Iterator[List[Tuple[int, int, Dict[str, Any]]]]:
+        numbered_rows = (
+            (self.csv_reader.line_num, self.csv_reader.offset, row)
+            for row in self.csv_reader
+        )
+        while chunk := list(islice(numbered_rows, self.batch_size)):
+            yield chunk
+
+    def _collect(
+        self,
+        result: Tuple[
+            List[Dict[str, Any]], List[Tuple[int, int]], List[Tuple[int, str]]
+        ],
+    ):
+        rows, self.positions, errors = result
+        self.errors.extend(errors)
+        return rows
+
+    def __iter__(self) -> Iterator[List[Dict[str, Any]]]:
+        if self.workers <= 1:
+            for chunk in self._chunks():
+                yield self._collect(_parse_rows(self.parsers, chunk))
+            return
+
+        pool = ProcessPoolExecutor(self.workers)
+        try:
+            pending: deque = deque()
+            for chunk in self._chunks():
+                pending.append(pool.submit(_parse_rows, self.parsers, chunk))
+                if len(pending) >= 2 * self.workers:
+                    yield self._collect(pending.popleft().result())
+            while pending:
+                yield self._collect(pending.popleft().result())
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def reject(self, n: int, error: str) -> None:
+        """Record the error of the nth row of the last batch, which is not applied."""
+        self.errors.append((self.positions[n][1], error))
+
+    def check(self, csv_name: str) -> None:
+        if not self.errors:
+            return
+        message = "\n".join(
+            f"line {line_num}: {error}"
+            for line_num, error in sorted(self.errors)[:MAX_REPORTED_ERRORS]
+        )
+        if len(self.errors) > MAX_REPORTED_ERRORS:
+            message += f"\n... and {len(self.errors) - MAX_REPORTED_ERRORS} more"
+        raise Exception(
+            f"Found {len(self.errors)} invalid row(s) in {csv_name} csv:\n{message}"
+        )
+
+
+class _ModelLookup(MutableMapping):
+    """Models by their connection ids that only keeps the ids of the models, and
+    loads the models when they are needed. The loaded models are released when the
+    session is emptied between the chunks of an import.
+    """
+
+    def __init__(self, model, ids: Dict[Any, int]):
+        self.model = model
+        self.ids = ids
+        self.loaded: Dict[Any, Any] = {}
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            self.loaded[key] = db.session.get(self.model, self.ids[key])
+        return self.loaded[key]
+
+    def __setitem__(self, key, value) -> None:
+        self.ids[key] = value.id
+        self.loaded[key] = value
+
+    def __delitem__(self, key) -> None:
+        del self.ids[key]
+        self.loaded.pop(key, None)
+
+    def __contains__(self, key) -> bool:
+        return key in self.ids
+
+    def __iter__(self) -> Iterator:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def release(self) -> None:
+        self.loaded.clear()
+
+
+DEFAULT_CHECKPOINT = "csv_import_checkpoint.json"
+
+
+class _Checkpoint:
+    """Commits a chunked import every chunk_size rows, and records in a checkpoint
+    file how far it got: the csv files that are done, the byte offset and line number
+    after the last committed row of the current file, and the ids of the officers and
+    incidents that were created for #placeholder ids.
+
+    The session is emptied after every commit, so that it only holds the models of
+    one chunk, and the lookups of the import only keep ids in between.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        chunk_size: Optional[int],
+        department_id: int,
+        context: ImportContext,
+        resume: bool,
+    ):
+        self.path = path
+        self.chunk_size = chunk_size or 0
+        self.department_id = department_id
+        self.context = context
+        self.done: List[str] = []
+        self.csv_name: Optional[str] = None
+        self.offset = 0
+        self.line_num = 0
+        self.pending = 0
+        self.lookups: List[_ModelLookup] = []
+        self.new_officers = self.lookup(Officer, {})
+        self.new_incidents = self.lookup(Incident, {})
+        if resume:
+            self._load()
+        elif os.path.exists(path):
+            raise Exception(
+                f"Found a checkpoint in {path}, use --resume to continue that import "
+                "or remove the file."
+            )
+        if not self.chunk_size:
+            raise Exception("A chunked import needs a chunk size.")
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise Exception(f"No checkpoint found in {self.path}.")
+        with open(self.path) as f:
+            state = json.load(f)
+        if state["department_id"] != self.department_id:
+            raise Exception(f"The checkpoint in {self.path} is for another department.")
+        self.chunk_size = self.chunk_size or state["chunk_size"]
+        self.done = state["done"]
+        self.csv_name = state["csv_name"]
+        self.offset = state["offset"]
+        self.line_num = state["line_num"]
+        self.new_officers.ids.update(state["officers"])
+        self.new_incidents.ids.update(state["incidents"])
+        print(f"Resuming the import from {self.path}, done with {self.done}.")
+
+    def _save(self) -> None:
+        state = {
+            "department_id": self.department_id,
+            "chunk_size": self.chunk_size,
+            "done": self.done,
+            "csv_name": self.csv_name,
+            "offset": self.offset,
+            "line_num": self.line_num,
+            "officers": _placeholder_ids(self.new_officers),
+            "incidents": _placeholder_ids(self.new_incidents),
+        }
+        # replace the checkpoint at once, so that it is never left half written
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def lookup(self, model, ids: Dict[Any, int]) -> _ModelLookup:
+        lookup = _ModelLookup(model, ids)
+        self.lookups.append(lookup)
+        return lookup
+
+    def is_done(self, csv_name: str) -> bool:
+        return csv_name in self.done
+
+    def start(self, csv_name: str) -> Tuple[int, int]:
+        """Return the offset and line number to read a csv file from."""
+        if csv_name != self.csv_name:
+            self.csv_name, self.offset, self.line_num = csv_name, 0, 0
+        elif self.offset:
+            print(f"Continuing {csv_name} after line {self.line_num}.")
+        return self.offset, self.line_num
+
+    def _commit(self) -> None:
+        db.session.commit()
+        self._save()
+        db.session.expunge_all()
+        self.context.release()
+        for lookup in self.lookups:
+            lookup.release()
+        self.pending = 0
+
+    def applied(self, position: Tuple[int, int]) -> None:
+        """Count a row that was applied, and commit the rows once there are enough.
+        The position is the byte offset and line number after the row.
+        """
+        self.pending += 1
+        if self.pending >= self.chunk_size:
+            self.offset, self.line_num = position
+            self._commit()
+            print(f"Committed {self.csv_name} up to line {self.line_num}.")
+
+    def finish(self, csv_name: str) -> None:
+        self.done.append(csv_name)
+        self.csv_name, self.offset, self.line_num = None, 0, 0
+        self._commit()
+
+    def remove(self) -> None:
+        os.remove(self.path)
+
+
+def _add_models(lookup: MutableMapping, models: MutableMapping) -> None:
+    """Add models to a lookup, only taking over the ids between chunked lookups."""
+    if isinstance(lookup, _ModelLookup) and isinstance(models, _ModelLookup):
+        lookup.ids.update(models.ids)
+    else:
+        lookup.update(models)
+
+
+def _placeholder_ids(lookup: _ModelLookup) -> Dict[str, int]:
+    return {
+        key: model_id for key, model_id in lookup.ids.items() if key.startswith("#")
+    }
+
+
+def _models_by_id(query, model, checkpoint: Optional[_Checkpoint]):
+    """Return the models of the query by their ids. Chunked imports only keep the
+    ids and load the models when needed.
+    """
+    if checkpoint is None:
+        return {instance.id: instance for instance in query}
+    ids = query.with_entities(model.id)
+    return checkpoint.lookup(model, {model_id: model_id for (model_id,) in ids})
+
+
+def _by_connection_id(models_by_id, checkpoint: Optional[_Checkpoint]):
+    if checkpoint is None:
+        return {str(k): v for k, v in models_by_id.items()}
+    return checkpoint.lookup(
+        models_by_id.model, {str(k): v for k, v in models_by_id.ids.items()}
+    )
+
+
+def _should_import(csv_name: str, checkpoint: Optional[_Checkpoint]) -> bool:
+    return not (checkpoint and checkpoint.is_done(csv_name))
+
+
 def _handle_officers_csv(
     officers_csv: str,
     department_name: str,
     department_state: str,
     department_id: int,
     id_to_officer,
+    context: ImportContext,
     force_create,
-) -> Dict[str, Officer]:
-    new_officers = {}
+    workers: int,
+    checkpoint: Optional[_Checkpoint],
+) -> MutableMapping[str, Officer]:
+    new_officers: MutableMapping[str, Officer] = (
+        checkpoint.new_officers if checkpoint else {}
+    )
     counter = 0
-    with _csv_reader(officers_csv) as csv_reader:
-        _check_provided_fields(
-            csv_reader,
-            required_fields=["id", "department_name", "department_state"]
-            if not force_create
-            else ["id"],
-            optional_fields=[
-                "last_name",
-                "first_name",
-                "middle_initial",
-                "suffix",
-                "race",
-                "gender",
-                "employment_date",
-                "birth_year",
-                "unique_internal_identifier",
-                "department_name",
-                "department_state",
-                # the following are unused, but allowed since they are included in the
-                # csv output
-                "badge_number",
-                "unique_identifier",
-                "job_title",
-                "most_recent_salary",
-                "last_employment_date",
-                "last_employment_notice",
-            ],
-            csv_name="officers",
-        )
-
-        for row in csv_reader:
-            # can only update department with given name
-            if not force_create:
-                assert row["department_name"] == department_name
-                assert row["department_state"] == department_state
-            row["department_id"] = department_id
-            connection_id = row["id"]
-            if row["id"].startswith("#"):
-                row["id"] = ""
-            officer = _create_or_update_model(
-                row=row,
-                existing_model_lookup=id_to_officer,
-                create_method=create_officer_from_dict,
-                update_method=update_officer_from_dict,
-                force_create=force_create,
-                model=Officer,
-            )
-            if connection_id is not None:
-                new_officers[connection_id] = officer
-            counter += 1
-            if counter % 1000 == 0:
-                print(f"Processed {counter} officers.")
+    offset, line_num = checkpoint.start("officers") if checkpoint else (0, 0)
+    with _csv_reader(officers_csv, offset, line_num) as csv_reader:
+        _check_officers_csv(csv_reader, force_create)
+
+        parsed_rows = _ParsedRows(csv_reader, OFFICER_ROW_PARSERS, workers)
+        for batch in parsed_rows:
+            for n, row in enumerate(batch):
+                # can only update department with given name
+                if not force_create:
+                    error = _department_error(row, department_name, department_state)
+                    if error:
+                        parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    # the import will fail, so only check the remaining rows. In
+                    # chunks, those before the first invalid row are committed already
+                    continue
+                row["department_id"] = department_id
+                connection_id = row["id"]
+                if row["id"].startswith("#"):
+                    row["id"] = ""
+                officer = _create_or_update_model(
+                    row=row,
+                    existing_model_lookup=id_to_officer,
+                    create_method=create_officer_from_dict,
+                    update_method=update_officer_from_dict,
+                    context=context,
+                    force_create=force_create,
+                    model=Officer,
+                )
+                if connection_id is not None:
+                    new_officers[connection_id] = officer
+                counter += 1
+                if counter % 1000 == 0:
+                    print(f"Processed {counter} officers.")
+                if checkpoint:
+                    checkpoint.applied(parsed_rows.positions[n])
+        parsed_rows.check("officers")
+    if checkpoint:
+        checkpoint.finish("officers")
     print(f"Done with officers. Processed {counter} rows.")
     return new_officers
 
@@ -157,55 +786,30 @@ def _handle_officers_csv(
 def _handle_assignments_csv(
     assignments_csv: str,
     department_id: int,
-    all_officers: Dict[str, Officer],
+    all_officers: MutableMapping[str, Officer],
+    context: ImportContext,
     force_create: bool,
     overwrite_assignments: bool,
+    workers: int,
+    checkpoint: Optional[_Checkpoint],
 ) -> None:
     counter = 0
-    with _csv_reader(assignments_csv) as csv_reader:
-        field_names = csv_reader.fieldnames
-        if "start_date" in field_names:
-            field_names[field_names.index("start_date")] = "start_date"
-        if "badge_number" in field_names:
-            field_names[field_names.index("badge_number")] = "star_no"
-        if "end_date" in field_names:
-            field_names[field_names.index("end_date")] = "resign_date"
-        if "unit_description" in field_names:
-            field_names[field_names.index("unit_description")] = "unit_name"
-        required_fields = ["officer_id", "job_title"]
-        if not overwrite_assignments:
-            required_fields.append("id")
-
-        _check_provided_fields(
-            csv_reader,
-            required_fields=required_fields,
-            optional_fields=[
-                "id",
-                "star_no",
-                "unit_id",
-                "unit_name",
-                "start_date",
-                "resign_date",
-                "officer_unique_identifier",
-            ],
-            csv_name="assignments",
-        )
-        jobs_for_department = list(
-            Job.query.filter_by(department_id=department_id).all()
-        )
-        job_title_to_id = {
-            job.job_title.strip().lower(): job.id for job in jobs_for_department
-        }
-        unit_description_to_id = {
-            unit.description.strip().lower(): unit.id
-            for unit in Unit.query.filter_by(department_id=department_id).all()
-        }
+    offset, line_num = checkpoint.start("assignments") if checkpoint else (0, 0)
+    with _csv_reader(assignments_csv, offset, line_num) as csv_reader:
+        _check_assignments_csv(csv_reader, overwrite_assignments)
+        parsed_rows = _ParsedRows(csv_reader, ASSIGNMENT_ROW_PARSERS, workers)
+        batches: Iterable[List[Dict[str, Any]]] = parsed_rows
         if overwrite_assignments:
             id_to_assignment = {}
-            rows = []
+            rows: List[Dict[str, Any]] = []
+            positions: List[Tuple[int, int]] = []
+            for batch in parsed_rows:
+                rows.extend(batch)
+                positions.extend(parsed_rows.positions)
+            # the existing assignments must not be deleted if any row is invalid
+            parsed_rows.check("assignments")
             all_rel_officers = set()
-            for row in csv_reader:
-                rows.append(row)
+            for row in rows:
                 officer_id = row["officer_id"]
                 if officer_id != "" and officer_id[0] != "#":
                     all_rel_officers.add(int(officer_id))
@@ -221,125 +825,128 @@ def _handle_assignments_csv(
             print(
                 f"Deleting assignments from {len(all_rel_officers)} officers to overwrite."
             )
+            add_tombstones(
+                db.session.connection(),
+                Assignment,
+                [
+                    (assignment_id, department_id)
+                    for (assignment_id,) in db.session.query(Assignment.id).filter(
+                        Assignment.officer_id.in_(all_rel_officers)
+                    )
+                ],
+            )
             (
                 db.session.query(Assignment)
                 .filter(Assignment.officer_id.in_(all_rel_officers))
                 .delete(synchronize_session=False)
             )
+            # Bulk deletes skip the flush events that maintain current assignments,
+            # department stats and tombstones
+            update_current_assignments(db.session.connection(), all_rel_officers)
+            refresh_department_stats(db.session.connection(), [department_id])
             db.session.flush()
-            # assign rows to csv_reader since we already iterated over reader
-            csv_reader = rows
+            # the rows have been read already, so errors refer to their positions
+            batches = [rows]
+            parsed_rows.positions = positions
         else:
-            existing_assignments = (
-                Assignment.query.join(Assignment.base_officer)
-                .filter(Officer.department_id == department_id)
-                .all()
+            id_to_assignment = _models_by_id(
+                Assignment.query.join(Assignment.base_officer).filter(
+                    Officer.department_id == department_id
+                ),
+                Assignment,
+                checkpoint,
             )
-            id_to_assignment = {
-                assignment.id: assignment for assignment in existing_assignments
-            }
-        for row in csv_reader:
-            officer = all_officers.get(row["officer_id"])
-            if not officer:
-                raise Exception(
-                    f"Officer with id {row['officer_id']} does not exist (in this department)"
-                )
-            if row.get("unit_id"):
-                assert (
-                    db.session.get(Unit, int(row.get("unit_id"))).department.id
-                    == department_id
-                )
-            elif row.get("unit_name"):
-                unit_name = row["unit_name"].strip()
-                description = unit_name.lower()
-                unit_id = unit_description_to_id.get(description)
-                if unit_id is None:
-                    unit = Unit(
-                        description=unit_name,
-                        department_id=officer.department_id,
+        for batch in batches:
+            for n, row in enumerate(batch):
+                error = _officer_error(row, all_officers)
+                if not error and row.get("unit_id"):
+                    error = _unit_error(
+                        row, context.department_unit_ids(department_id).values()
                     )
-                    db.session.add(unit)
-                    db.session.flush()
-                    unit_id = unit.id
-                    unit_description_to_id[description] = unit_id
-                row["unit_id"] = unit_id
-            job_title = row["job_title"].strip().lower()
-            job_id = job_title_to_id.get(job_title)
-            if job_id is None:
-                num_existing_ranks = len(
-                    Job.query.filter_by(department_id=officer.department_id).all()
+                if error:
+                    parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    # the import will fail, so only check the remaining rows. In
+                    # chunks, those before the first invalid row are committed already
+                    continue
+                officer = all_officers[row["officer_id"]]
+                if not row.get("unit_id") and row.get("unit_name"):
+                    row["unit_id"] = context.get_or_create_unit_id(
+                        officer.department_id, row["unit_name"]
+                    )
+                row["job_id"] = context.get_or_create_job_id(
+                    officer.department_id, row["job_title"]
                 )
-                if num_existing_ranks > 0:
-                    auto_order = num_existing_ranks + 1
-                else:
-                    auto_order = 0
-                # create new job
-                job = Job(
-                    job_title=row["job_title"].strip(),
-                    is_sworn_officer=False,
-                    department_id=officer.department_id,
-                    order=auto_order,
+                row["officer_id"] = officer.id
+                _create_or_update_model(
+                    row=row,
+                    existing_model_lookup=id_to_assignment,
+                    create_method=create_assignment_from_dict,
+                    update_method=update_assignment_from_dict,
+                    context=context,
+                    force_create=force_create,
+                    model=Assignment,
+                    always_create=overwrite_assignments,
                 )
-                db.session.add(job)
-                db.session.flush()
-                job_id = job.id
-                job_title_to_id[job_title] = job_id
-
-            row["job_id"] = job_id
-            row["officer_id"] = officer.id
-            _create_or_update_model(
-                row=row,
-                existing_model_lookup=id_to_assignment,
-                create_method=create_assignment_from_dict,
-                update_method=update_assignment_from_dict,
-                force_create=force_create,
-                model=Assignment,
-                always_create=overwrite_assignments,
-            )
-            counter += 1
-            if counter % 1000 == 0:
-                print(f"Processed {counter} assignments.")
+                counter += 1
+                if counter % 1000 == 0:
+                    print(f"Processed {counter} assignments.")
+                if checkpoint and not overwrite_assignments:
+                    checkpoint.applied(parsed_rows.positions[n])
+        parsed_rows.check("assignments")
+    if checkpoint:
+        checkpoint.finish("assignments")
     print(f"Done with assignments. Processed {counter} rows.")
 
 
 def _handle_salaries(
     salaries_csv: str,
     department_id: int,
-    all_officers: Dict[str, Officer],
+    all_officers: MutableMapping[str, Officer],
+    context: ImportContext,
     force_create: bool,
+    workers: int,
+    checkpoint: Optional[_Checkpoint],
 ) -> None:
     counter = 0
-    with _csv_reader(salaries_csv) as csv_reader:
-        _check_provided_fields(
-            csv_reader,
-            required_fields=["id", "officer_id", "salary", "year"],
-            optional_fields=["overtime_pay", "is_fiscal_year"],
-            csv_name="salaries",
-        )
-        existing_salaries = (
-            Salary.query.join(Salary.officer)
-            .filter(Officer.department_id == department_id)
-            .all()
-        )
-        id_to_salary = {salary.id: salary for salary in existing_salaries}
-        for row in csv_reader:
-            officer = all_officers.get(row["officer_id"])
-            if not officer:
-                raise Exception(
-                    f"Officer with id {row['officer_id']} does not exist (in this department)"
+    offset, line_num = checkpoint.start("salaries") if checkpoint else (0, 0)
+    with _csv_reader(salaries_csv, offset, line_num) as csv_reader:
+        _check_salaries_csv(csv_reader)
+        id_to_salary = _models_by_id(
+            Salary.query.join(Salary.officer).filter(
+                Officer.department_id == department_id
+            ),
+            Salary,
+            checkpoint,
+        )
+        parsed_rows = _ParsedRows(csv_reader, SALARY_ROW_PARSERS, workers)
+        for batch in parsed_rows:
+            for n, row in enumerate(batch):
+                error = _officer_error(row, all_officers)
+                if error:
+                    parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    # the import will fail, so only check the remaining rows. In
+                    # chunks, those before the first invalid row are committed already
+                    continue
+                row["officer_id"] = all_officers[row["officer_id"]].id
+                _create_or_update_model(
+                    row=row,
+                    existing_model_lookup=id_to_salary,
+                    create_method=create_salary_from_dict,
+                    update_method=update_salary_from_dict,
+                    context=context,
+                    force_create=force_create,
+                    model=Salary,
                 )
-            row["officer_id"] = officer.id
-            _create_or_update_model(
-                row=row,
-                existing_model_lookup=id_to_salary,
-                create_method=create_salary_from_dict,
-                update_method=update_salary_from_dict,
-                force_create=force_create,
-                model=Salary,
-            )
-            counter += 1
-            if counter % 1000 == 0:
-                print(f"Processed {counter} salaries.")
+                counter += 1
+                if counter % 1000 == 0:
+                    print(f"Processed {counter} salaries.")
+                if checkpoint:
+                    checkpoint.applied(parsed_rows.positions[n])
+        parsed_rows.check("salaries")
+    if checkpoint:
+        checkpoint.finish("salaries")
     print(f"Done with salaries. Processed {counter} rows.")
 
 
@@ -348,131 +955,172 @@ def _handle_incidents_csv(
     department_name: str,
     department_state: str,
     department_id: int,
-    all_officers: Dict[str, Officer],
-    id_to_incident: Dict[int, Incident],
+    all_officers: MutableMapping[str, Officer],
+    id_to_incident: MutableMapping[int, Incident],
+    context: ImportContext,
     force_create: bool,
-) -> Dict[str, Incident]:
+    workers: int,
+    checkpoint: Optional[_Checkpoint],
+) -> MutableMapping[str, Incident]:
     counter = 0
-    new_incidents = {}
-    with _csv_reader(incidents_csv) as csv_reader:
-        _check_provided_fields(
-            csv_reader,
-            required_fields=["id", "department_name", "department_state"],
-            optional_fields=[
-                "date",
-                "time",
-                "report_number",
-                "description",
-                "street_name",
-                "cross_street1",
-                "cross_street2",
-                "city",
-                "state",
-                "zip_code",
-                "created_by",
-                "last_updated_by",
-                "officer_ids",
-                "license_plates",
-            ],
-            csv_name="incidents",
-        )
-
-        for row in csv_reader:
-            assert row["department_name"] == department_name
-            assert row["department_state"] == department_state
-            row["department_id"] = department_id
-            row["officers"] = _objects_from_split_field(
-                row.get("officer_ids"), all_officers
-            )
-            address, _ = get_or_create_location_from_dict(row)
-            if address is not None:
-                row["address_id"] = address.id
-            license_plates = []
-            for license_plate_str in row.get("license_plates", "").split("|"):
-                if license_plate_str:
-                    parts = license_plate_str.split("_")
-                    data = dict(zip(["number", "state"], parts))
-                    license_plate, _ = get_or_create_license_plate_from_dict(data)
-                    license_plates.append(license_plate)
-            db.session.flush()
+    new_incidents: MutableMapping[str, Incident] = (
+        checkpoint.new_incidents if checkpoint else {}
+    )
+    offset, line_num = checkpoint.start("incidents") if checkpoint else (0, 0)
+    with _csv_reader(incidents_csv, offset, line_num) as csv_reader:
+        _check_incidents_csv(csv_reader)
 
-            if license_plates:
-                row["license_plate_objects"] = license_plates
-            connection_id = row["id"]
-            if row["id"].startswith("#"):
-                row["id"] = ""
-            incident = _create_or_update_model(
-                row=row,
-                existing_model_lookup=id_to_incident,
-                create_method=create_incident_from_dict,
-                update_method=update_incident_from_dict,
-                force_create=force_create,
-                model=Incident,
-            )
-            if connection_id:
-                new_incidents[connection_id] = incident
-            counter += 1
-            if counter % 1000 == 0:
-                print(f"Processed {counter} incidents.")
-        print(f"Done with incidents. Processed {counter} rows.")
+        parsed_rows = _ParsedRows(csv_reader, INCIDENT_ROW_PARSERS, workers)
+        for batch in parsed_rows:
+            for n, row in enumerate(batch):
+                error = _department_error(
+                    row, department_name, department_state
+                ) or _split_field_error(row, "officer_ids", all_officers)
+                if error:
+                    parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    # the import will fail, so only check the remaining rows. In
+                    # chunks, those before the first invalid row are committed already
+                    continue
+                row["department_id"] = department_id
+                row["officers"] = _objects_from_split_field(
+                    row.get("officer_ids"), all_officers
+                )
+                address = context.get_or_create_location(row)
+                if address is not None:
+                    row["address_id"] = address.id
+                license_plates = []
+                for license_plate_str in row.get("license_plates", "").split("|"):
+                    if license_plate_str:
+                        parts = license_plate_str.split("_")
+                        data = dict(zip(["number", "state"], parts))
+                        license_plate = context.get_or_create_license_plate(data)
+                        license_plates.append(license_plate)
+                db.session.flush()
+
+                if license_plates:
+                    row["license_plate_objects"] = license_plates
+                connection_id = row["id"]
+                if row["id"].startswith("#"):
+                    row["id"] = ""
+                incident = _create_or_update_model(
+                    row=row,
+                    existing_model_lookup=id_to_incident,
+                    create_method=create_incident_from_dict,
+                    update_method=update_incident_from_dict,
+                    context=context,
+                    force_create=force_create,
+                    model=Incident,
+                )
+                if connection_id:
+                    new_incidents[connection_id] = incident
+                counter += 1
+                if counter % 1000 == 0:
+                    print(f"Processed {counter} incidents.")
+                if checkpoint:
+                    checkpoint.applied(parsed_rows.positions[n])
+        parsed_rows.check("incidents")
+    if checkpoint:
+        checkpoint.finish("incidents")
+    print(f"Done with incidents. Processed {counter} rows.")
     return new_incidents
 
 
 def _handle_links_csv(
     links_csv: str,
     department_id: int,
-    all_officers: Dict[str, Officer],
-    all_incidents: Dict[str, Incident],
+    all_officers: MutableMapping[str, Officer],
+    all_incidents: MutableMapping[str, Incident],
+    context: ImportContext,
     force_create: bool,
+    workers: int,
+    checkpoint: Optional[_Checkpoint],
 ) -> None:
     counter = 0
-    with _csv_reader(links_csv) as csv_reader:
-        _check_provided_fields(
-            csv_reader,
-            required_fields=["id", "url"],
-            optional_fields=[
-                "title",
-                "link_type",
-                "description",
-                "author",
-                "created_by",
-                "officer_ids",
-                "incident_ids",
-            ],
-            csv_name="links",
-        )
-        existing_officer_links = (
-            Link.query.join(Link.officers)
-            .filter(Officer.department_id == department_id)
-            .all()
-        )
-        existing_incident_links = (
-            Link.query.join(Link.incidents)
-            .filter(Incident.department_id == department_id)
-            .all()
-        )
-        id_to_link = {
-            link.id: link for link in existing_officer_links + existing_incident_links
-        }
-        for row in csv_reader:
-            row["officers"] = _objects_from_split_field(
-                row.get("officer_ids"), all_officers
-            )
-            row["incidents"] = _objects_from_split_field(
-                row.get("incident_ids"), all_incidents
-            )
-            _create_or_update_model(
-                row=row,
-                existing_model_lookup=id_to_link,
-                create_method=create_link_from_dict,
-                update_method=update_link_from_dict,
-                force_create=force_create,
-                model=Link,
-            )
-            counter += 1
-            if counter % 1000 == 0:
-                print(f"Processed {counter} links.")
-        print(f"Done with links. Processed {counter} rows.")
+    offset, line_num = checkpoint.start("links") if checkpoint else (0, 0)
+    with _csv_reader(links_csv, offset, line_num) as csv_reader:
+        _check_links_csv(csv_reader)
+        id_to_link = _models_by_id(
+            Link.query.join(Link.officers).filter(
+                Officer.department_id == department_id
+            ),
+            Link,
+            checkpoint,
+        )
+        _add_models(
+            id_to_link,
+            _models_by_id(
+                Link.query.join(Link.incidents).filter(
+                    Incident.department_id == department_id
+                ),
+                Link,
+                checkpoint,
+            ),
+        )
+        parsed_rows = _ParsedRows(csv_reader, LINK_ROW_PARSERS, workers)
+        for batch in parsed_rows:
+            for n, row in enumerate(batch):
+                error = _split_field_error(
+                    row, "officer_ids", all_officers
+                ) or _split_field_error(row, "incident_ids", all_incidents)
+                if error:
+                    parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    # the import will fail, so only check the remaining rows. In
+                    # chunks, those before the first invalid row are committed already
+                    continue
+                row["officers"] = _objects_from_split_field(
+                    row.get("officer_ids"), all_officers
+                )
+                row["incidents"] = _objects_from_split_field(
+                    row.get("incident_ids"), all_incidents
+                )
+                _create_or_update_model(
+                    row=row,
+                    existing_model_lookup=id_to_link,
+                    create_method=create_link_from_dict,
+                    update_method=update_link_from_dict,
+                    context=context,
+                    force_create=force_create,
+                    model=Link,
+                )
+                counter += 1
+                if counter % 1000 == 0:
+                    print(f"Processed {counter} links.")
+                if checkpoint:
+                    checkpoint.applied(parsed_rows.positions[n])
+        parsed_rows.check("links")
+    if checkpoint:
+        checkpoint.finish("links")
+    print(f"Done with links. Processed {counter} rows.")
+
+
+def _get_department_id(department_name: str, department_state: str) -> int:
+    department = Department.query.filter_by(
+        name=department_name, state=department_state
+    ).one_or_none()
+    if department is None:
+        raise Exception(
+            f"Department with name '{department_name}' in {department_state} "
+            "does not exist!"
+        )
+    return department.id
+
+
+def _update_sequences() -> None:
+    # This will only work in postgres and fail in sqlite
+    raw_sql = """
+    select setval('officers_id_seq', (select max(id) from officers));
+    select setval('salaries_id_seq', (select max(id) from salaries));
+    select setval('assignments_id_seq', (select max(id) from assignments));
+    select setval('links_id_seq', (select max(id) from links));
+    select setval('incidents_id_seq', (select max(id) from incidents));
+    """
+    try:
+        db.session.execute(sql.text(raw_sql))
+        print("Updated sequences.")
+    except SQLAlchemyError:
+        print("Failed to update sequences")
 
 
 def import_csv_files(
@@ -485,80 +1133,1020 @@ def import_csv_files(
     incidents_csv: Optional[str],
     force_create: bool = False,
     overwrite_assignments: bool = False,
+    workers: int = 1,
+    chunk_size: Optional[int] = None,
+    checkpoint_path: str = DEFAULT_CHECKPOINT,
+    resume: bool = False,
 ):
-    department = Department.query.filter_by(
-        name=department_name, state=department_state
-    ).one_or_none()
-    if department is None:
+    """Import the csv files in one transaction, or with a chunk_size in chunks that
+    are committed one at a time and can be resumed from the checkpoint file.
+    """
+    department_id = _get_department_id(department_name, department_state)
+    context = ImportContext()
+    checkpoint = None
+    if chunk_size or resume:
+        checkpoint = _Checkpoint(
+            checkpoint_path, chunk_size, department_id, context, resume
+        )
+    # Chunks are committed as they go, while an import in one transaction is undone
+    # through a savepoint, which leaves a transaction the caller began usable
+    savepoint = None if checkpoint else db.session.begin_nested()
+
+    try:
+        id_to_officer = _models_by_id(
+            Officer.query.filter_by(department_id=department_id), Officer, checkpoint
+        )
+        all_officers = _by_connection_id(id_to_officer, checkpoint)
+
+        if officers_csv is not None and _should_import("officers", checkpoint):
+            new_officers = _handle_officers_csv(
+                officers_csv,
+                department_name,
+                department_state,
+                department_id,
+                id_to_officer,
+                context,
+                force_create,
+                workers,
+                checkpoint,
+            )
+            _add_models(all_officers, new_officers)
+        if checkpoint:
+            # the officers created for placeholder ids before the import was resumed
+            _add_models(all_officers, checkpoint.new_officers)
+
+        if assignments_csv is not None and _should_import("assignments", checkpoint):
+            _handle_assignments_csv(
+                assignments_csv,
+                department_id,
+                all_officers,
+                context,
+                force_create,
+                overwrite_assignments,
+                workers,
+                checkpoint,
+            )
+
+        if salaries_csv is not None and _should_import("salaries", checkpoint):
+            _handle_salaries(
+                salaries_csv,
+                department_id,
+                all_officers,
+                context,
+                force_create,
+                workers,
+                checkpoint,
+            )
+
+        if incidents_csv is not None or links_csv is not None:
+            id_to_incident = _models_by_id(
+                Incident.query.filter_by(department_id=department_id),
+                Incident,
+                checkpoint,
+            )
+            all_incidents = _by_connection_id(id_to_incident, checkpoint)
+
+        if incidents_csv is not None and _should_import("incidents", checkpoint):
+            new_incidents = _handle_incidents_csv(
+                incidents_csv,
+                department_name,
+                department_state,
+                department_id,
+                all_officers,
+                id_to_incident,
+                context,
+                force_create,
+                workers,
+                checkpoint,
+            )
+            _add_models(all_incidents, new_incidents)
+        if checkpoint and links_csv is not None:
+            _add_models(all_incidents, checkpoint.new_incidents)
+
+        if links_csv is not None and _should_import("links", checkpoint):
+            _handle_links_csv(
+                links_csv,
+                department_id,
+                all_officers,
+                all_incidents,
+                context,
+                force_create,
+                workers,
+                checkpoint,
+            )
+
+        if savepoint:
+            savepoint.commit()
+        db.session.commit()
+    except Exception:
+        if savepoint is None:
+            # Only keep the chunks that were committed, so that a resumed import
+            # starts right after them
+            db.session.rollback()
+        elif savepoint.is_active:
+            savepoint.rollback()
+        raise
+    print("All committed.")
+    if checkpoint:
+        checkpoint.remove()
+
+    if force_create:
+        _update_sequences()
+
+
+BULK_BATCH_SIZE = 10000
+
+
+def _report_throughput(name: str, counter: int, start: float) -> None:
+    seconds = perf_counter() - start
+    print(
+        f"Done with {name}. Processed {counter} rows in {seconds:.1f}s "
+        f"({counter / seconds:.0f} rows/s)."
+    )
+
+
+def _staged_columns(table: Table, *excluded: str) -> List[Column]:
+    # The application and the database maintain the other columns
+    return [
+        Column(column.name, column.type)
+        for column in table.columns
+        if column.name not in ("created_at", "last_updated_at", *excluded)
+    ]
+
+
+def _copy_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, (date, time)):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class _StagingTable:
+    """A temporary table that the rows of a bulk import are staged in, through COPY on
+    PostgreSQL and executemany elsewhere, before they are merged into their table.
+    """
+
+    def __init__(self, connection, name: str, columns: Sequence[Column]):
+        self.connection = connection
+        self.table = Table(
+            f"import_{name}", MetaData(), *columns, prefixes=["TEMPORARY"]
+        )
+        self.table.create(connection)
+        # Remembered, so that the tables are dropped when an import fails
+        connection.info.setdefault("staging_tables", []).append(self)
+
+    @property
+    def c(self):
+        return self.table.c
+
+    def add(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        if self.connection.dialect.name != "postgresql":
+            self.connection.execute(self.table.insert(), rows)
+            return
+        names = self.table.columns.keys()
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(_copy_value(row[name]) for name in names) + "\n")
+        buffer.seek(0)
+        quote = self.connection.dialect.identifier_preparer.quote
+        columns = ", ".join(quote(name) for name in names)
+        with self.connection.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {quote(self.table.name)} ({columns}) FROM STDIN", buffer
+            )
+
+    def clear(self) -> None:
+        self.connection.execute(delete(self.table))
+
+    def merge(
+        self,
+        model,
+        update_columns: Iterable[str],
+        keep_existing: Iterable[str] = (),
+        values: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Upsert the staged rows into the table of the model by their ids.
+
+        Rows that exist already only get the update columns and values, and the
+        columns to keep existing values of are only updated by staged values that
+        are not null.
+        """
+        table = model.__table__
+        names = [name for name in self.table.columns.keys() if name in table.columns]
+        statement = upsert(self.connection, table).from_select(
+            names,
+            # Keeps SQLite from parsing ON CONFLICT as the constraint of a join
+            select(*(self.c[name] for name in names)).where(true()),
+        )
+        set_ = {name: statement.excluded[name] for name in update_columns}
+        for name in keep_existing:
+            set_[name] = func.coalesce(statement.excluded[name], table.c[name])
+        set_.update(values or {}, last_updated_at=datetime.utcnow())
+        self.connection.execute(
+            statement.on_conflict_do_update(index_elements=[table.c.id], set_=set_)
+        )
+        if self.connection.dialect.name == "postgresql":
+            # Plan the statements that follow with statistics that include the rows
+            self.connection.execute(sql.text(f"ANALYZE {table.name}"))
+
+    def drop(self) -> None:
+        self.table.drop(self.connection)
+        self.connection.info["staging_tables"].remove(self)
+
+
+def _drop_staging_tables(connection) -> None:
+    for staging in list(connection.info.get("staging_tables", [])):
+        staging.drop()
+
+
+class _IdAllocator:
+    """Hands out the ids of new rows of a model, so that rows can be staged and
+    referenced before they are merged.
+    """
+
+    def __init__(self, connection, model):
+        self.connection = connection
+        self.table = model.__table__
+        self.next_id = None
+
+    def assign(self, records: List[Dict[str, Any]]) -> None:
+        new_records = [record for record in records if record["id"] is None]
+        if not new_records:
+            return
+        if self.connection.dialect.name == "postgresql":
+            ids = self.connection.scalars(
+                select(
+                    func.nextval(func.pg_get_serial_sequence(self.table.name, "id"))
+                ).select_from(func.generate_series(1, len(new_records)))
+            ).all()
+        else:
+            if self.next_id is None:
+                max_id = self.connection.scalar(select(func.max(self.table.c.id)))
+                self.next_id = (max_id or 0) + 1
+            ids = range(self.next_id, self.next_id + len(new_records))
+            self.next_id += len(new_records)
+        for record, record_id in zip(new_records, ids):
+            record["id"] = record_id
+
+
+class _NaturalKeyLookup:
+    """The ids of the rows of a model by their natural keys, getting or creating the
+    rows of unseen keys a batch at a time.
+    """
+
+    def __init__(self, connection, model, names: Sequence[str]):
+        self.connection = connection
+        self.model = model
+        self.names = names
+        self.ids: Dict[Tuple, int] = {}
+        self.staging = _StagingTable(
+            connection,
+            f"{model.__tablename__}_keys",
+            [Column(name, model.__table__.c[name].type) for name in names],
+        )
+
+    def resolve(self, keys: Iterable[Tuple]) -> None:
+        new_keys = set(keys) - self.ids.keys()
+        if not new_keys:
+            return
+        self.staging.clear()
+        self.staging.add([dict(zip(self.names, key)) for key in new_keys])
+        table = self.model.__table__
+        # Like get_or_create, compare empty strings and nulls as equal
+        matches = and_(
+            *(
+                func.coalesce(table.c[name], "")
+                == func.coalesce(self.staging.c[name], "")
+                for name in self.names
+            )
+        )
+        self.connection.execute(
+            insert(table).from_select(
+                self.names,
+                select(*self.staging.c).where(~exists().where(matches)),
+            )
+        )
+        for *key, row_id in self.connection.execute(
+            select(*self.staging.c, func.min(table.c.id))
+            .select_from(self.staging.table)
+            .join(table, matches)
+            .group_by(*self.staging.c)
+        ):
+            self.ids[tuple(key)] = row_id
+
+    def __getitem__(self, key: Tuple) -> int:
+        return self.ids[key]
+
+    def drop(self) -> None:
+        self.staging.drop()
+
+
+def _record_id(
+    row: Dict[str, str],
+    existing_ids: Set[int],
+    seen_ids: Set[int],
+    force_create: bool,
+    label: str,
+) -> Optional[int]:
+    if not row["id"]:
+        return None
+    record_id = int(row["id"])
+    if not force_create and record_id not in existing_ids:
         raise Exception(
-            f"Department with name '{department_name}' in {department_state} "
-            "does not exist!"
+            f"{label} with id {record_id} does not exist (in this department)"
         )
-    department_id = department.id
+    # A row can only be merged once
+    if record_id in seen_ids:
+        raise Exception(f"{label} with id {record_id} is listed more than once")
+    seen_ids.add(record_id)
+    return record_id
+
+
+def _lookup_ids(field: Optional[str], ids: Dict[str, int]) -> List[int]:
+    if not field:
+        return []
+    return [ids[object_id] for object_id in field.split("|")]
+
+
+def _update_columns(
+    staging: _StagingTable, field_names: Iterable[str], *always: str
+) -> List[str]:
+    provided = set(field_names) - {"id", "created_by"}
+    return [name for name in staging.c.keys() if name in provided] + list(always)
+
+
+def _bulk_officers_csv(
+    connection,
+    officers_csv: str,
+    department_name: str,
+    department_state: str,
+    department_id: int,
+    existing_ids: Set[int],
+    admin_id: int,
+    force_create: bool,
+    workers: int,
+) -> Dict[str, int]:
+    start = perf_counter()
+    new_officers = {}
+    seen_ids: Set[int] = set()
+    counter = 0
+    staging = _StagingTable(
+        connection,
+        "officers",
+        _staged_columns(Officer.__table__, "current_assignment_id"),
+    )
+    allocator = _IdAllocator(connection, Officer)
+    with _csv_reader(officers_csv) as csv_reader:
+        _check_officers_csv(csv_reader, force_create)
+        field_names = csv_reader.fieldnames
 
-    existing_officers = Officer.query.filter_by(department_id=department_id).all()
-    id_to_officer = {officer.id: officer for officer in existing_officers}
-    all_officers = {str(k): v for k, v in id_to_officer.items()}
+        parsed_rows = _ParsedRows(
+            csv_reader, OFFICER_ROW_PARSERS, workers, BULK_BATCH_SIZE
+        )
+        for batch in parsed_rows:
+            connection_ids, records = [], []
+            for n, row in enumerate(batch):
+                # can only update department with given name
+                if not force_create:
+                    error = _department_error(row, department_name, department_state)
+                    if error:
+                        parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    continue
+                row["department_id"] = department_id
+                connection_ids.append(row["id"])
+                if row["id"].startswith("#"):
+                    row["id"] = ""
+                records.append(
+                    {
+                        "id": _record_id(
+                            row, existing_ids, seen_ids, force_create, "Officer"
+                        ),
+                        **officer_values_from_dict(row),
+                        "created_by": admin_id,
+                        "last_updated_by": admin_id,
+                    }
+                )
+            if parsed_rows.errors:
+                # nothing will be committed, so only check the remaining rows
+                continue
+            allocator.assign(records)
+            for connection_id, record in zip(connection_ids, records):
+                new_officers[connection_id] = record["id"]
+            staging.add(records)
+            counter += len(records)
+            print(f"Staged {counter} officers.")
+        parsed_rows.check("officers")
 
-    if officers_csv is not None:
-        new_officers = _handle_officers_csv(
-            officers_csv,
-            department_name,
-            department_state,
-            department_id,
-            id_to_officer,
-            force_create,
+    if force_create:
+        update_columns = _update_columns(staging, staging.c.keys(), "created_by")
+    else:
+        update_columns = _update_columns(
+            staging, field_names, "department_id", "last_updated_by"
         )
-        all_officers.update(new_officers)
+    staging.merge(Officer, update_columns)
+    staging.drop()
+    _report_throughput("officers", counter, start)
+    return new_officers
+
 
-    if assignments_csv is not None:
-        _handle_assignments_csv(
-            assignments_csv,
-            department_id,
-            all_officers,
-            force_create,
-            overwrite_assignments,
+def _bulk_assignments_csv(
+    connection,
+    assignments_csv: str,
+    department_id: int,
+    officer_ids: Dict[str, int],
+    context: ImportContext,
+    force_create: bool,
+    overwrite_assignments: bool,
+    workers: int,
+) -> None:
+    start = perf_counter()
+    seen_ids: Set[int] = set()
+    counter = 0
+    staging = _StagingTable(
+        connection, "assignments", _staged_columns(Assignment.__table__)
+    )
+    allocator = _IdAllocator(connection, Assignment)
+    existing_ids = set(
+        connection.scalars(
+            select(Assignment.id)
+            .join(Officer, Officer.id == Assignment.officer_id)
+            .where(Officer.department_id == department_id)
         )
+    )
+    admin_id = context.user_id
+    unit_ids = set(context.department_unit_ids(department_id).values())
+    with _csv_reader(assignments_csv) as csv_reader:
+        _check_assignments_csv(csv_reader, overwrite_assignments)
+        field_names = csv_reader.fieldnames
 
-    if salaries_csv is not None:
-        _handle_salaries(salaries_csv, department_id, all_officers, force_create)
+        parsed_rows = _ParsedRows(
+            csv_reader, ASSIGNMENT_ROW_PARSERS, workers, BULK_BATCH_SIZE
+        )
+        for batch in parsed_rows:
+            records = []
+            for n, row in enumerate(batch):
+                error = _officer_error(row, officer_ids)
+                if not error and row.get("unit_id"):
+                    error = _unit_error(row, unit_ids)
+                if error:
+                    parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    continue
+                officer_id = officer_ids[row["officer_id"]]
+                if not row.get("unit_id") and row.get("unit_name"):
+                    row["unit_id"] = context.get_or_create_unit_id(
+                        department_id, row["unit_name"]
+                    )
+                    unit_ids.add(row["unit_id"])
+                row["job_id"] = context.get_or_create_job_id(
+                    department_id, row["job_title"]
+                )
+                row["officer_id"] = officer_id
+                if overwrite_assignments and not force_create:
+                    # the assignments of the officers are replaced by new ones
+                    row["id"] = ""
+                values = assignment_values_from_dict(row)
+                records.append(
+                    {
+                        "id": _record_id(
+                            row, existing_ids, seen_ids, force_create, "Assignment"
+                        ),
+                        **values,
+                        "star_no_normalized": normalize_star_no(values["star_no"]),
+                        "created_by": admin_id,
+                        "last_updated_by": admin_id,
+                    }
+                )
+            if parsed_rows.errors:
+                # nothing will be committed, so only check the remaining rows
+                continue
+            allocator.assign(records)
+            staging.add(records)
+            counter += len(records)
+            print(f"Staged {counter} assignments.")
+        parsed_rows.check("assignments")
 
-    if incidents_csv is not None or links_csv is not None:
-        existing_incidents = Incident.query.filter_by(department_id=department_id).all()
-        id_to_incident = {incident.id: incident for incident in existing_incidents}
-        all_incidents = {str(k): v for k, v in id_to_incident.items()}
+    if overwrite_assignments:
+        replaced = Assignment.officer_id.in_(select(staging.c.officer_id))
+        connection.execute(
+            insert(Tombstone.__table__).from_select(
+                ["table_name", "record_id", "department_id"],
+                select(
+                    literal(Assignment.__tablename__),
+                    Assignment.id,
+                    literal(department_id),
+                ).where(replaced),
+            )
+        )
+        connection.execute(delete(Assignment.__table__).where(replaced))
+        print("Deleted the assignments of the officers to overwrite.")
 
-    if incidents_csv is not None:
-        new_incidents = _handle_incidents_csv(
-            incidents_csv,
-            department_name,
-            department_state,
-            department_id,
-            all_officers,
-            id_to_incident,
-            force_create,
+    keep_existing = []
+    if force_create:
+        update_columns = _update_columns(staging, staging.c.keys(), "created_by")
+    else:
+        update_columns = _update_columns(
+            staging, field_names, "officer_id", "job_id", "last_updated_by"
         )
-        all_incidents.update(new_incidents)
+        if "star_no" in field_names:
+            update_columns.append("star_no_normalized")
+        if "unit_name" in field_names and "unit_id" not in field_names:
+            # a unit is only set by the rows that name one
+            keep_existing.append("unit_id")
+    staging.merge(Assignment, update_columns, keep_existing)
+    staging.drop()
+    # The bulk statements skip the flush events that maintain current assignments
+    update_current_assignments(
+        connection, select(Officer.id).where(Officer.department_id == department_id)
+    )
+    _report_throughput("assignments", counter, start)
+
 
-    if links_csv is not None:
-        _handle_links_csv(
-            links_csv, department_id, all_officers, all_incidents, force_create
+def _bulk_salaries_csv(
+    connection,
+    salaries_csv: str,
+    department_id: int,
+    officer_ids: Dict[str, int],
+    admin_id: int,
+    force_create: bool,
+    workers: int,
+) -> None:
+    start = perf_counter()
+    seen_ids: Set[int] = set()
+    counter = 0
+    staging = _StagingTable(connection, "salaries", _staged_columns(Salary.__table__))
+    allocator = _IdAllocator(connection, Salary)
+    existing_ids = set(
+        connection.scalars(
+            select(Salary.id)
+            .join(Officer, Officer.id == Salary.officer_id)
+            .where(Officer.department_id == department_id)
         )
+    )
+    with _csv_reader(salaries_csv) as csv_reader:
+        _check_salaries_csv(csv_reader)
+        field_names = csv_reader.fieldnames
 
-    db.session.commit()
-    print("All committed.")
+        parsed_rows = _ParsedRows(
+            csv_reader, SALARY_ROW_PARSERS, workers, BULK_BATCH_SIZE
+        )
+        for batch in parsed_rows:
+            records = []
+            for n, row in enumerate(batch):
+                error = _officer_error(row, officer_ids)
+                if error:
+                    parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    continue
+                row["officer_id"] = officer_ids[row["officer_id"]]
+                records.append(
+                    {
+                        "id": _record_id(
+                            row, existing_ids, seen_ids, force_create, "Salary"
+                        ),
+                        **salary_values_from_dict(row),
+                        "created_by": admin_id,
+                        "last_updated_by": admin_id,
+                    }
+                )
+            if parsed_rows.errors:
+                # nothing will be committed, so only check the remaining rows
+                continue
+            allocator.assign(records)
+            staging.add(records)
+            counter += len(records)
+            print(f"Staged {counter} salaries.")
+        parsed_rows.check("salaries")
 
     if force_create:
-        # This will only work in postgres and fail in sqlite
-        raw_sql = """
-        select setval('officers_id_seq', (select max(id) from officers));
-        select setval('salaries_id_seq', (select max(id) from salaries));
-        select setval('assignments_id_seq', (select max(id) from assignments));
-        select setval('links_id_seq', (select max(id) from links));
-        select setval('incidents_id_seq', (select max(id) from incidents));
-        """
-        try:
-            db.session.execute(sql.text(raw_sql))
-            print("Updated sequences.")
-        except SQLAlchemyError:
-            print("Failed to update sequences")
+        update_columns = _update_columns(staging, staging.c.keys(), "created_by")
+    else:
+        update_columns = _update_columns(
+            staging, field_names, "officer_id", "last_updated_by"
+        )
+    staging.merge(Salary, update_columns)
+    staging.drop()
+    _report_throughput("salaries", counter, start)
+
+
+def _replace_associations(
+    connection, association: Table, key: str, ids, staging: _StagingTable
+) -> None:
+    connection.execute(delete(association).where(association.c[key].in_(ids)))
+    names = staging.c.keys()
+    connection.execute(
+        insert(association).from_select(names, select(*staging.c).distinct())
+    )
+
+
+def _bulk_incidents_csv(
+    connection,
+    incidents_csv: str,
+    department_name: str,
+    department_state: str,
+    department_id: int,
+    officer_ids: Dict[str, int],
+    existing_ids: Set[int],
+    admin_id: int,
+    force_create: bool,
+    workers: int,
+) -> Dict[str, int]:
+    start = perf_counter()
+    new_incidents = {}
+    seen_ids: Set[int] = set()
+    counter = 0
+    staging = _StagingTable(
+        connection, "incidents", _staged_columns(Incident.__table__)
+    )
+    staged_officers = _StagingTable(
+        connection, "officer_incidents", _staged_columns(officer_incidents)
+    )
+    staged_license_plates = _StagingTable(
+        connection,
+        "incident_license_plates",
+        _staged_columns(incident_license_plates),
+    )
+    allocator = _IdAllocator(connection, Incident)
+    locations = _NaturalKeyLookup(
+        connection,
+        Location,
+        ["street_name", "cross_street1", "cross_street2", "city", "state", "zip_code"],
+    )
+    license_plates = _NaturalKeyLookup(connection, LicensePlate, ["number", "state"])
+    with _csv_reader(incidents_csv) as csv_reader:
+        _check_incidents_csv(csv_reader)
+        field_names = csv_reader.fieldnames
+
+        parsed_rows = _ParsedRows(
+            csv_reader, INCIDENT_ROW_PARSERS, workers, BULK_BATCH_SIZE
+        )
+        for batch in parsed_rows:
+            connection_ids, records = [], []
+            location_keys, license_plate_keys, incident_officer_ids = [], [], []
+            for n, row in enumerate(batch):
+                error = _department_error(
+                    row, department_name, department_state
+                ) or _split_field_error(row, "officer_ids", officer_ids)
+                if error:
+                    parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    continue
+                row["department_id"] = department_id
+                incident_officer_ids.append(
+                    _lookup_ids(row.get("officer_ids"), officer_ids)
+                )
+                location = location_values_from_dict(row)
+                location_keys.append(tuple(location.values()) if location else None)
+                license_plate_keys.append(
+                    [
+                        tuple(
+                            license_plate_values_from_dict(
+                                dict(zip(["number", "state"], plate.split("_")))
+                            ).values()
+                        )
+                        for plate in row.get("license_plates", "").split("|")
+                        if plate
+                    ]
+                )
+                connection_ids.append(row["id"])
+                if row["id"].startswith("#"):
+                    row["id"] = ""
+                records.append(
+                    {
+                        "id": _record_id(
+                            row, existing_ids, seen_ids, force_create, "Incident"
+                        ),
+                        **incident_values_from_dict(row),
+                        "created_by": parse_int(row.get("created_by", admin_id)),
+                        "last_updated_by": parse_int(
+                            row.get("last_updated_by", admin_id)
+                        ),
+                    }
+                )
+            if parsed_rows.errors:
+                # nothing will be committed, so only check the remaining rows
+                continue
+            allocator.assign(records)
+            locations.resolve(key for key in location_keys if key)
+            license_plates.resolve(chain.from_iterable(license_plate_keys))
+            for connection_id, record, location_key in zip(
+                connection_ids, records, location_keys
+            ):
+                if connection_id:
+                    new_incidents[connection_id] = record["id"]
+                if location_key:
+                    record["address_id"] = locations[location_key]
+            staging.add(records)
+            staged_officers.add(
+                [
+                    {"officer_id": officer_id, "incident_id": record["id"]}
+                    for record, ids in zip(records, incident_officer_ids)
+                    for officer_id in ids
+                ]
+            )
+            staged_license_plates.add(
+                [
+                    {
+                        "incident_id": record["id"],
+                        "license_plate_id": license_plates[key],
+                    }
+                    for record, keys in zip(records, license_plate_keys)
+                    for key in keys
+                ]
+            )
+            counter += len(records)
+            print(f"Staged {counter} incidents.")
+        parsed_rows.check("incidents")
+
+    if force_create:
+        update_columns = _update_columns(staging, staging.c.keys(), "created_by")
+        keep_existing = []
+    else:
+        update_columns = _update_columns(staging, field_names, "department_id")
+        # an address is only set by the rows that have one
+        keep_existing = ["address_id"]
+    staging.merge(Incident, update_columns, keep_existing)
+    _replace_associations(
+        connection,
+        officer_incidents,
+        "incident_id",
+        select(staging.c.id),
+        staged_officers,
+    )
+    # license plates are only replaced by the rows that list some
+    _replace_associations(
+        connection,
+        incident_license_plates,
+        "incident_id",
+        select(staged_license_plates.c.incident_id),
+        staged_license_plates,
+    )
+    for table in (staging, staged_officers, staged_license_plates):
+        table.drop()
+    locations.drop()
+    license_plates.drop()
+    _report_throughput("incidents", counter, start)
+    return new_incidents
+
+
+def _bulk_links_csv(
+    connection,
+    links_csv: str,
+    department_id: int,
+    officer_ids: Dict[str, int],
+    incident_ids: Dict[str, int],
+    admin_id: int,
+    force_create: bool,
+    workers: int,
+) -> Set[int]:
+    start = perf_counter()
+    seen_ids: Set[int] = set()
+    counter = 0
+    staging = _StagingTable(
+        connection, "links", _staged_columns(Link.__table__, "has_content_warning")
+    )
+    staged_officers = _StagingTable(
+        connection, "officer_links", _staged_columns(officer_links)
+    )
+    staged_incidents = _StagingTable(
+        connection, "incident_links", _staged_columns(incident_links)
+    )
+    allocator = _IdAllocator(connection, Link)
+    existing_ids = set(
+        connection.scalars(
+            union(
+                select(officer_links.c.link_id)
+                .join(Officer, Officer.id == officer_links.c.officer_id)
+                .where(Officer.department_id == department_id),
+                select(incident_links.c.link_id)
+                .join(Incident, Incident.id == incident_links.c.incident_id)
+                .where(Incident.department_id == department_id),
+            )
+        )
+    )
+    with _csv_reader(links_csv) as csv_reader:
+        _check_links_csv(csv_reader)
+        field_names = csv_reader.fieldnames
+
+        parsed_rows = _ParsedRows(
+            csv_reader, LINK_ROW_PARSERS, workers, BULK_BATCH_SIZE
+        )
+        for batch in parsed_rows:
+            records, link_officer_ids, link_incident_ids = [], [], []
+            for n, row in enumerate(batch):
+                error = _split_field_error(
+                    row, "officer_ids", officer_ids
+                ) or _split_field_error(row, "incident_ids", incident_ids)
+                if error:
+                    parsed_rows.reject(n, error)
+                if parsed_rows.errors:
+                    continue
+                link_officer_ids.append(
+                    _lookup_ids(row.get("officer_ids"), officer_ids)
+                )
+                link_incident_ids.append(
+                    _lookup_ids(row.get("incident_ids"), incident_ids)
+                )
+                records.append(
+                    {
+                        "id": _record_id(
+                            row, existing_ids, seen_ids, force_create, "Link"
+                        ),
+                        **link_values_from_dict(row),
+                        "created_by": parse_int(row.get("created_by", admin_id)),
+                        "last_updated_by": parse_int(row.get("created_by", admin_id)),
+                    }
+                )
+            if parsed_rows.errors:
+                # nothing will be committed, so only check the remaining rows
+                continue
+            allocator.assign(records)
+            staging.add(records)
+            staged_officers.add(
+                [
+                    {"officer_id": officer_id, "link_id": record["id"]}
+                    for record, ids in zip(records, link_officer_ids)
+                    for officer_id in ids
+                ]
+            )
+            staged_incidents.add(
+                [
+                    {"link_id": record["id"], "incident_id": incident_id}
+                    for record, ids in zip(records, link_incident_ids)
+                    for incident_id in ids
+                ]
+            )
+            counter += len(records)
+            print(f"Staged {counter} links.")
+        parsed_rows.check("links")
+
+    # The links leave the departments of the officers and incidents they lose
+    department_ids = set(
+        connection.scalars(
+            union(
+                select(Officer.department_id)
+                .join(officer_links, officer_links.c.officer_id == Officer.id)
+                .where(officer_links.c.link_id.in_(select(staging.c.id))),
+                select(Incident.department_id)
+                .join(incident_links, incident_links.c.incident_id == Incident.id)
+                .where(incident_links.c.link_id.in_(select(staging.c.id))),
+            )
+        )
+    )
+    if force_create:
+        staging.merge(Link, _update_columns(staging, staging.c.keys(), "created_by"))
+    else:
+        staging.merge(
+            Link,
+            _update_columns(staging, field_names),
+            values={"last_updated_by": admin_id},
+        )
+    for association, staged in (
+        (officer_links, staged_officers),
+        (incident_links, staged_incidents),
+    ):
+        _replace_associations(
+            connection, association, "link_id", select(staging.c.id), staged
+        )
+    for table in (staging, staged_officers, staged_incidents):
+        table.drop()
+    _report_throughput("links", counter, start)
+    return department_ids
+
+
+def bulk_import_csv_files(
+    department_name: str,
+    department_state: str,
+    officers_csv: Optional[str],
+    assignments_csv: Optional[str],
+    salaries_csv: Optional[str],
+    links_csv: Optional[str],
+    incidents_csv: Optional[str],
+    force_create: bool = False,
+    overwrite_assignments: bool = False,
+    workers: int = 1,
+):
+    """Import the csv files like import_csv_files, but stage their rows in temporary
+    tables and merge each table with a few set-based statements instead of creating
+    or updating objects one row at a time.
+    """
+    start = perf_counter()
+    context = ImportContext()
+    admin_id = context.user_id
+    department_id = _get_department_id(department_name, department_state)
+    # Undo a failed import without ending a transaction the caller began
+    savepoint = db.session.begin_nested()
+    connection = db.session.connection()
+
+    try:
+        officer_ids = {
+            str(officer_id): officer_id
+            for officer_id in connection.scalars(
+                select(Officer.id).where(Officer.department_id == department_id)
+            )
+        }
+        department_ids = {department_id}
+
+        if officers_csv is not None:
+            officer_ids.update(
+                _bulk_officers_csv(
+                    connection,
+                    officers_csv,
+                    department_name,
+                    department_state,
+                    department_id,
+                    set(officer_ids.values()),
+                    admin_id,
+                    force_create,
+                    workers,
+                )
+            )
+
+        if assignments_csv is not None:
+            _bulk_assignments_csv(
+                connection,
+                assignments_csv,
+                department_id,
+                officer_ids,
+                context,
+                force_create,
+                overwrite_assignments,
+                workers,
+            )
+
+        if salaries_csv is not None:
+            _bulk_salaries_csv(
+                connection,
+                salaries_csv,
+                department_id,
+                officer_ids,
+                admin_id,
+                force_create,
+                workers,
+            )
+
+        if incidents_csv is not None or links_csv is not None:
+            incident_ids = {
+                str(incident_id): incident_id
+                for incident_id in connection.scalars(
+                    select(Incident.id).where(Incident.department_id == department_id)
+                )
+            }
+
+        if incidents_csv is not None:
+            incident_ids.update(
+                _bulk_incidents_csv(
+                    connection,
+                    incidents_csv,
+                    department_name,
+                    department_state,
+                    department_id,
+                    officer_ids,
+                    set(incident_ids.values()),
+                    admin_id,
+                    force_create,
+                    workers,
+                )
+            )
+
+        if links_csv is not None:
+            department_ids |= _bulk_links_csv(
+                connection,
+                links_csv,
+                department_id,
+                officer_ids,
+                incident_ids,
+                admin_id,
+                force_create,
+                workers,
+            )
+
+        # The bulk statements skip the flush events that keep these up to date
+        refresh_department_stats(connection, [department_id])
+        bump_department_generations(connection, department_ids)
+        savepoint.commit()
+        db.session.commit()
+    except Exception:
+        # PostgreSQL drops the temporary tables when rolling back to the savepoint,
+        # while SQLite may have created them outside of it
+        if connection.dialect.name == "postgresql":
+            connection.info.pop("staging_tables", None)
+        else:
+            _drop_staging_tables(connection)
+        if savepoint.is_active:
+            savepoint.rollback()
+        raise
+    print(f"All committed in {perf_counter() - start:.1f}s.")
+
+    if force_create:
+        _update_sequences()
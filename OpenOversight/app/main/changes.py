@@ -0,0 +1,168 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import literal, select, union_all
+from sqlalchemy.sql import Select
+
+from OpenOversight.app.models.database import (
+    CHANGE_FEED_MODELS,
+    Incident,
+    Link,
+    Officer,
+    Tombstone,
+    db,
+    officer_links,
+)
+from OpenOversight.app.utils.pagination import KeysetPagination, encode_cursor
+
+
+CHANGES_PER_PAGE = 500
+# How long a transaction that changes feed rows may take to commit. Rows are stamped
+# when the transaction flushes, so they can become visible after later changes were
+# listed, and a resumed feed re-reads this far behind its last change to catch them
+CHANGE_FEED_WINDOW = timedelta(minutes=10)
+
+
+def _utc(value: datetime) -> datetime:
+    """Return a timestamp as an aware UTC datetime. Naive ones are in UTC already."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def parse_timestamp(value: Any) -> datetime:
+    """Parse an ISO 8601 timestamp, in UTC unless it says otherwise.
+
+    Raises ValueError if it is not one.
+    """
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid timestamp: {value}")
+    return _utc(datetime.fromisoformat(value))
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return _utc(value).isoformat()
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    return value
+
+
+def _updated_records(table_name: str, department_id: int) -> Select:
+    model = CHANGE_FEED_MODELS[table_name]
+    statement = select(
+        model.last_updated_at.label("changed_at"),
+        literal(0).label("deleted"),
+        model.id.label("key"),
+        model.id.label("record_id"),
+    )
+    if model in (Officer, Incident):
+        return statement.where(model.department_id == department_id)
+    if model is Link:
+        # Links belong to the departments of their officers, as in the CSV exports
+        return statement.where(
+            Link.id.in_(
+                select(officer_links.c.link_id)
+                .join(Officer, Officer.id == officer_links.c.officer_id)
+                .where(Officer.department_id == department_id)
+            )
+        )
+    return statement.join(Officer, Officer.id == model.officer_id).where(
+        Officer.department_id == department_id
+    )
+
+
+def _deleted_records(table_name: str, department_id: int) -> Select:
+    return select(
+        Tombstone.deleted_at,
+        literal(1),
+        Tombstone.id,
+        Tombstone.record_id,
+    ).where(
+        Tombstone.department_id == department_id, Tombstone.table_name == table_name
+    )
+
+
+def _parse_change_key(values: List[Any]) -> Sequence[Any]:
+    changed_at, deleted, key = values
+    if not isinstance(deleted, int) or not isinstance(key, int):
+        raise ValueError(f"Invalid change key: {values}")
+    return parse_timestamp(changed_at), deleted, key
+
+
+def _change_key(change) -> List[Any]:
+    return [_utc(change.changed_at).isoformat(), change.deleted, change.key]
+
+
+def _timestamp_cursor(timestamp: datetime) -> str:
+    return encode_cursor([timestamp.isoformat(), -1, 0])
+
+
+def since_cursor(since: str) -> str:
+    """Return the cursor that the changes made at or after a timestamp follow."""
+    return _timestamp_cursor(parse_timestamp(since))
+
+
+class DepartmentChanges:
+    """A page of the changes to a department's rows of a change feed table, in the
+    order they were made, after the given cursor.
+
+    Each change is an insert or update, which carries the row as it is now, or a
+    deletion. A row that changes again is listed again at its new place, so applying
+    the changes in order leaves a copy of the department's rows up to date.
+
+    `next_cursor` is where the following page starts. `cursor`, where to resume from
+    once every page has been applied, lies CHANGE_FEED_WINDOW behind the last change,
+    so resuming lists some changes again and they must be applied idempotently.
+    Raises ValueError if the cursor is invalid.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        department_id: int,
+        after: Optional[str] = None,
+        per_page: Optional[int] = None,
+    ):
+        changes = union_all(
+            _updated_records(table_name, department_id),
+            _deleted_records(table_name, department_id),
+        ).subquery()
+        page = KeysetPagination(
+            db.session.query(changes),
+            (changes.c.changed_at, changes.c.deleted, changes.c.key),
+            _change_key,
+            per_page or CHANGES_PER_PAGE,
+            after=after,
+            parse_key=_parse_change_key,
+        )
+        self.has_next = page.has_next
+        self.next_cursor = page.next_cursor
+        self.cursor = (
+            _timestamp_cursor(_utc(page.items[-1].changed_at) - CHANGE_FEED_WINDOW)
+            if page.items
+            else after
+        )
+
+        model = CHANGE_FEED_MODELS[table_name]
+        updated_ids = [change.record_id for change in page.items if not change.deleted]
+        records = {
+            row.id: {key: _json_value(value) for key, value in row._mapping.items()}
+            for row in db.session.execute(
+                select(model.__table__).where(model.id.in_(updated_ids))
+            )
+        }
+        self.items: List[Dict[str, Any]] = []
+        for change in page.items:
+            record = records.get(change.record_id)
+            # A row deleted since its change was read is listed by its tombstone
+            if not change.deleted and record is None:
+                continue
+            self.items.append(
+                {
+                    "id": change.record_id,
+                    "changed_at": _utc(change.changed_at).isoformat(),
+                    "deleted": bool(change.deleted),
+                    "record": None if change.deleted else record,
+                }
+            )
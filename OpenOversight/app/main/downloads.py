@@ -1,27 +1,78 @@
 import csv
+import gzip
 import io
-from datetime import date
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from http import HTTPStatus
-from typing import Any, Callable, Dict, List, TypeVar
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    TypeVar,
+    cast,
+)
+from zipfile import ZIP_DEFLATED, ZipFile
 
-from flask import Response, abort
-from sqlalchemy.orm import Query
+from flask import Response, abort, current_app, request, send_file
+from sqlalchemy import JSON, and_, func, select, text, type_coerce
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ColumnElement, Select
 
 from OpenOversight.app.models.database import (
     Assignment,
     Department,
+    DepartmentStats,
     Description,
     Incident,
+    Job,
     Link,
+    Location,
     Officer,
     Salary,
+    Unit,
     db,
+    incident_license_plates,
+    incident_links,
+    officer_incidents,
+    officer_links,
+)
+from OpenOversight.app.models.database_cache import (
+    get_database_cache_entry,
+    put_database_cache_entry,
 )
+from OpenOversight.app.utils.constants import (
+    ENCODING_UTF_8,
+    KEY_DB_CACHE_MAX_BYTES,
+    KEY_DEPT_ALL_ASSIGNMENTS,
+    KEY_DEPT_ALL_INCIDENTS,
+    KEY_DEPT_ALL_LINKS,
+    KEY_DEPT_ALL_NOTES,
+    KEY_DEPT_ALL_OFFICERS,
+    KEY_DEPT_ALL_SALARIES,
+    KEY_EXPORTS_DIR,
+    KILOBYTE,
+)
+from OpenOversight.app.utils.db import documented_departments, using_postgresql
 
 
 T = TypeVar("T")
 _Record = Dict[str, Any]
 
+ARCHIVE_QUEUE_SIZE = 16
+ARCHIVE_WORKERS = 4
+CSV_BATCH_SIZE = 1000
+CSV_CHUNK_SIZE = 64 * KILOBYTE
+
 
 ########################################################################################
 # Check util methods
@@ -39,30 +90,363 @@ def check_output(output_str):
 ########################################################################################
 
 
-def make_downloadable_csv(
-    query: Query,
-    department_id: int,
-    csv_suffix: str,
-    field_names: List[str],
-    record_maker: Callable[[T], _Record],
-) -> Response:
-    department = db.session.get(Department, department_id)
-    if not department:
-        abort(HTTPStatus.NOT_FOUND)
+def csv_chunks(
+    export: "CsvExport", department_id: int, session: Optional[Session] = None
+) -> Iterator[bytes]:
+    """Yield the CSV export of a department in chunks of about CSV_CHUNK_SIZE bytes,
+    reading from the given session or else from db.session.
 
+    Rows are fetched CSV_BATCH_SIZE at a time, through a server-side cursor where the
+    database supports one, so memory use does not grow with the size of the department.
+    """
     csv_output = io.StringIO()
-    csv_writer = csv.DictWriter(csv_output, fieldnames=field_names)
+    csv_writer = csv.DictWriter(csv_output, fieldnames=export.field_names)
     csv_writer.writeheader()
 
-    for entity in query:
-        record = record_maker(entity)
+    session = session or db.session
+    statement = export.query(session, department_id)
+    rows = session.execute(statement.execution_options(yield_per=CSV_BATCH_SIZE))
+    for row in rows:
+        record = export.record_maker(row)
         csv_writer.writerow(record)
+        if csv_output.tell() >= CSV_CHUNK_SIZE:
+            yield csv_output.getvalue().encode(ENCODING_UTF_8)
+            csv_output.seek(0)
+            csv_output.truncate()
+
+    yield csv_output.getvalue().encode(ENCODING_UTF_8)
+
+
+def stream_department_csv(department_id: int, update_type: str) -> Iterator[bytes]:
+    """Yield the CSV export of the given update type for a department.
+
+    A cached CSV is served as is. Otherwise the CSV is streamed as it is written and
+    cached once complete, so the cache holds compact bytes instead of the objects the
+    export query loaded.
+    """
+    cache_params = (Department(id=department_id), update_type)
+    csv_bytes = get_database_cache_entry(*cache_params)
+    if csv_bytes is not None:
+        yield csv_bytes
+        return
+
+    # Stop collecting a CSV larger than the whole cache, which would not keep it
+    max_bytes = current_app.config[KEY_DB_CACHE_MAX_BYTES]
+    collected: Optional[List[bytes]] = []
+    collected_size = 0
+    for chunk in csv_chunks(DEPARTMENT_CSV_EXPORTS[update_type], department_id):
+        if collected is not None:
+            collected.append(chunk)
+            collected_size += len(chunk)
+            if collected_size > max_bytes:
+                collected = None
+        yield chunk
+
+    if collected is not None:
+        put_database_cache_entry(*cache_params, b"".join(collected))
+
+
+def department_csv(department_id: int, update_type: str) -> bytes:
+    """Return the whole CSV export of the given update type for a department."""
+    return b"".join(stream_department_csv(department_id, update_type))
+
+
+def department_generation(department_id: int) -> int:
+    """Return the generation of a department's data, which versions its exports."""
+    generation = db.session.scalar(
+        select(DepartmentStats.generation).filter_by(department_id=department_id)
+    )
+    return generation or 0
+
+
+def export_directory(department_id: int) -> str:
+    return os.path.join(current_app.config[KEY_EXPORTS_DIR], str(department_id))
+
+
+def export_path(department_id: int, update_type: str, generation: int) -> str:
+    """Return where the rendered export of a department's data generation is kept."""
+    return os.path.join(
+        export_directory(department_id),
+        f"{DEPARTMENT_CSV_EXPORTS[update_type].csv_suffix}.{generation}.csv.gz",
+    )
+
+
+def render_department_exports(department_id: int, force: bool = False) -> bool:
+    """Write the gzip-compressed CSV exports of a department's current data
+    generation, and remove those of older generations.
+
+    Exports that were already rendered for the generation are kept unless `force` is
+    set. Return whether any export was written.
+    """
+    generation = department_generation(department_id)
+    directory = export_directory(department_id)
+    os.makedirs(directory, exist_ok=True)
+
+    rendered = False
+    for update_type, export in DEPARTMENT_CSV_EXPORTS.items():
+        path = export_path(department_id, update_type, generation)
+        if os.path.exists(path) and not force:
+            continue
+        # Write next to the export and move it in place, so that downloads never see
+        # a partial file
+        partial_path = f"{path}.{os.getpid()}.partial"
+        with open(partial_path, "wb") as partial_file:
+            with gzip.GzipFile(fileobj=partial_file, mode="wb", mtime=0) as gzip_file:
+                for chunk in csv_chunks(export, department_id):
+                    gzip_file.write(chunk)
+        os.replace(partial_path, path)
+        rendered = True
+
+    current_suffix = f".{generation}.csv.gz"
+    for file_name in os.listdir(directory):
+        if file_name.endswith(".csv.gz") and not file_name.endswith(current_suffix):
+            os.remove(os.path.join(directory, file_name))
+    return rendered
+
+
+def render_exports(
+    department_ids: Optional[List[int]] = None, force: bool = False
+) -> List[int]:
+    """Render the exports of the given departments, or of every department, whose
+    data generation has not been rendered yet. Return the ids of those rendered.
+    """
+    if department_ids is None:
+        department_ids = db.session.scalars(select(Department.id)).all()
+    return [
+        department_id
+        for department_id in department_ids
+        if render_department_exports(department_id, force)
+    ]
+
+
+def rendered_export(department_id: int, update_type: str) -> Optional[str]:
+    """Return the path of the department's rendered export of the given update type,
+    if there is one for its current data generation and the request accepts gzip.
+    """
+    if not current_app.config[KEY_EXPORTS_DIR] or not request.accept_encodings["gzip"]:
+        return None
+    path = export_path(department_id, update_type, department_generation(department_id))
+    return path if os.path.exists(path) else None
+
+
+def serves_rendered_export(update_type: str) -> Callable[[], bool]:
+    """Return a rate limit exemption for the download requests of the given update
+    type that a rendered export answers, since those are cheap static file serves.
+    """
+
+    def _exempt() -> bool:
+        department_id = (request.view_args or {}).get("department_id")
+        if department_id is None:
+            return False
+        return rendered_export(department_id, update_type) is not None
+
+    return _exempt
+
+
+def make_downloadable_csv(department_id: int, update_type: str) -> Response:
+    department = db.session.get(Department, department_id)
+    if not department:
+        abort(HTTPStatus.NOT_FOUND)
 
     dept_name = department.name.replace(" ", "_")
+    csv_suffix = DEPARTMENT_CSV_EXPORTS[update_type].csv_suffix
     csv_name = dept_name + "_" + csv_suffix + ".csv"
 
+    path = rendered_export(department_id, update_type)
+    if path:
+        # The file name includes the generation, so together with the department it
+        # identifies the content
+        response = send_file(
+            path,
+            mimetype="text/csv",
+            as_attachment=True,
+            download_name=csv_name,
+            etag=f"{department_id}.{os.path.basename(path)}",
+            conditional=True,
+        )
+        response.content_encoding = "gzip"
+        response.vary.add("Accept-Encoding")
+        return response
+
     csv_headers = {"Content-disposition": "attachment; filename=" + csv_name}
-    return Response(csv_output.getvalue(), mimetype="text/csv", headers=csv_headers)
+    app = current_app._get_current_object()
+
+    def generate_csv() -> Iterator[bytes]:
+        # The response is sent after the request's app context, and the session that
+        # belongs to it, are torn down, so stream from a context of its own
+        with app.app_context():
+            yield from stream_department_csv(department_id, update_type)
+
+    return Response(generate_csv(), mimetype="text/csv", headers=csv_headers)
+
+
+class _ArchiveBuffer:
+    """Unseekable file that a ZipFile writes to, from which the archive is streamed."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+_ArchiveEntry = Tuple[str, int, str]
+_DONE = object()
+
+
+def _consume(chunks: queue.Queue) -> Iterator[bytes]:
+    while True:
+        chunk = chunks.get()
+        if chunk is _DONE:
+            return
+        if isinstance(chunk, BaseException):
+            raise chunk
+        yield chunk
+
+
+@contextmanager
+def _snapshot_csv_chunks(entries: List[_ArchiveEntry]):
+    """Build the CSVs of the archive entries in ARCHIVE_WORKERS threads, each with a
+    connection of its own that reads the same snapshot of a PostgreSQL database.
+
+    Each CSV is handed over through a bounded queue, so that workers stay at most
+    ARCHIVE_QUEUE_SIZE chunks ahead of the archive.
+    """
+    app = current_app._get_current_object()
+    cancelled = threading.Event()
+
+    def put(chunks: queue.Queue, item) -> bool:
+        # Give up once the archive is no longer read, instead of blocking forever
+        while not cancelled.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def build(snapshot: str, department_id: int, update_type: str, chunks) -> None:
+        try:
+            with app.app_context(), db.engine.connect() as connection:
+                connection = connection.execution_options(
+                    isolation_level="REPEATABLE READ"
+                )
+                with connection.begin():
+                    connection.execute(
+                        text("SET TRANSACTION SNAPSHOT :snapshot"),
+                        {"snapshot": snapshot},
+                    )
+                    with Session(bind=connection) as session:
+                        export = DEPARTMENT_CSV_EXPORTS[update_type]
+                        for chunk in csv_chunks(export, department_id, session):
+                            if not put(chunks, chunk):
+                                return
+            put(chunks, _DONE)
+        except Exception as error:
+            put(chunks, error)
+
+    with db.engine.connect() as exporter:
+        exporter = exporter.execution_options(isolation_level="REPEATABLE READ")
+        # The snapshot can be imported as long as this transaction is open
+        with exporter.begin():
+            snapshot = exporter.scalar(text("SELECT pg_export_snapshot()"))
+            executor = ThreadPoolExecutor(max_workers=ARCHIVE_WORKERS)
+            try:
+                sources = []
+                for name, department_id, update_type in entries:
+                    chunks: queue.Queue[object] = queue.Queue(
+                        maxsize=ARCHIVE_QUEUE_SIZE
+                    )
+                    executor.submit(build, snapshot, department_id, update_type, chunks)
+                    sources.append((name, _consume(chunks)))
+                yield sources
+            finally:
+                cancelled.set()
+                executor.shutdown(wait=True, cancel_futures=True)
+
+
+@contextmanager
+def _transaction_csv_chunks(entries: List[_ArchiveEntry]):
+    """Build the CSVs of the archive entries one after the other in the transaction
+    of db.session, for databases that cannot share a snapshot between connections.
+    """
+    yield [
+        (name, csv_chunks(DEPARTMENT_CSV_EXPORTS[update_type], department_id))
+        for name, department_id, update_type in entries
+    ]
+
+
+def stream_archive(entries: List[_ArchiveEntry]) -> Iterator[bytes]:
+    """Yield a ZIP archive of the CSV exports given as (name in the archive,
+    department id, update type) entries, as it is compressed.
+
+    All CSVs are read from a single consistent snapshot of the database.
+    """
+    build_csv_chunks = (
+        _snapshot_csv_chunks if using_postgresql() else _transaction_csv_chunks
+    )
+    archive_buffer = _ArchiveBuffer()
+    with (
+        build_csv_chunks(entries) as sources,
+        ZipFile(
+            cast(IO[bytes], archive_buffer), mode="w", compression=ZIP_DEFLATED
+        ) as archive,
+    ):
+        for name, chunks in sources:
+            with archive.open(name, mode="w") as archive_file:
+                for chunk in chunks:
+                    archive_file.write(chunk)
+                    yield archive_buffer.take()
+    yield archive_buffer.take()
+
+
+def department_archive_entries(
+    department: Department, prefix: str = ""
+) -> List[_ArchiveEntry]:
+    dept_name = department.name.replace(" ", "_")
+    return [
+        (f"{prefix}{dept_name}_{export.csv_suffix}.csv", department.id, update_type)
+        for update_type, export in DEPARTMENT_CSV_EXPORTS.items()
+    ]
+
+
+def make_downloadable_archive(department_id: Optional[int] = None) -> Response:
+    """Stream a ZIP archive of all CSV exports of a department, or of every department
+    with officers documented, with each department's in a folder of its own.
+    """
+    if department_id is not None:
+        department = db.session.get(Department, department_id)
+        if not department:
+            abort(HTTPStatus.NOT_FOUND)
+        entries = department_archive_entries(department)
+        archive_name = department.name.replace(" ", "_") + "_archive.zip"
+    else:
+        entries = []
+        for department, _ in documented_departments():
+            folder = f"{department.id}_{department.name.replace(' ', '_')}/"
+            entries += department_archive_entries(department, folder)
+        archive_name = "OpenOversight_archive.zip"
+
+    app = current_app._get_current_object()
+
+    def generate_archive() -> Iterator[bytes]:
+        with app.app_context():
+            yield from stream_archive(entries)
+
+    return Response(
+        generate_archive(),
+        mimetype="application/zip",
+        headers={"Content-disposition": "attachment; filename=" + archive_name},
+    )
 
 
 ########################################################################################
@@ -70,99 +454,440 @@ def make_downloadable_csv(
 ########################################################################################
 
 
-def salary_record_maker(salary: Salary) -> _Record:
+def _ids(ids: Optional[List[int]]) -> List[int]:
+    return sorted(ids or [])
+
+
+def salary_record_maker(row: Row) -> _Record:
     return {
-        "id": salary.id,
-        "officer id": salary.officer_id,
-        "first name": salary.officer.first_name,
-        "last name": salary.officer.last_name,
-        "salary": salary.salary,
-        "overtime_pay": salary.overtime_pay,
-        "year": salary.year,
-        "is_fiscal_year": salary.is_fiscal_year,
+        "id": row.id,
+        "officer id": row.officer_id,
+        "first name": row.first_name,
+        "last name": row.last_name,
+        "salary": row.salary,
+        "overtime_pay": row.overtime_pay,
+        "year": row.year,
+        "is_fiscal_year": row.is_fiscal_year,
     }
 
 
-def officer_record_maker(officer: Officer) -> _Record:
-    if officer.assignments:
-        most_recent_assignment = max(
-            officer.assignments, key=lambda a: a.start_date or date.min
-        )
-        most_recent_title = most_recent_assignment.job and check_output(
-            most_recent_assignment.job.job_title
-        )
-    else:
-        most_recent_assignment = None
-        most_recent_title = None
-    if officer.salaries:
-        most_recent_salary = max(officer.salaries, key=lambda s: s.year)
-    else:
-        most_recent_salary = None
+def officer_record_maker(row: Row) -> _Record:
     return {
-        "id": officer.id,
-        "unique identifier": officer.unique_internal_identifier,
-        "last name": officer.last_name,
-        "first name": officer.first_name,
-        "middle initial": officer.middle_initial,
-        "suffix": officer.suffix,
-        "gender": check_output(officer.gender),
-        "race": check_output(officer.race),
-        "birth year": officer.birth_year,
-        "employment date": officer.employment_date,
-        "badge number": most_recent_assignment and most_recent_assignment.star_no,
-        "job title": most_recent_title,
-        "most recent salary": most_recent_salary and most_recent_salary.salary,
+        "id": row.id,
+        "unique identifier": row.unique_internal_identifier,
+        "last name": row.last_name,
+        "first name": row.first_name,
+        "middle initial": row.middle_initial,
+        "suffix": row.suffix,
+        "gender": check_output(row.gender),
+        "race": check_output(row.race),
+        "birth year": row.birth_year,
+        "employment date": row.employment_date,
+        "badge number": row.star_no,
+        "job title": check_output(row.job_title),
+        "most recent salary": row.salary,
     }
 
 
-def assignment_record_maker(assignment: Assignment) -> _Record:
-    officer = assignment.base_officer
+def assignment_record_maker(row: Row) -> _Record:
     return {
-        "id": assignment.id,
-        "officer id": assignment.officer_id,
-        "officer unique identifier": officer and officer.unique_internal_identifier,
-        "badge number": assignment.star_no,
-        "job title": assignment.job and check_output(assignment.job.job_title),
-        "start date": assignment.start_date,
-        "end date": assignment.resign_date,
-        "unit id": assignment.unit and assignment.unit.id,
-        "unit description": assignment.unit and assignment.unit.description,
+        "id": row.id,
+        "officer id": row.officer_id,
+        "officer unique identifier": row.unique_internal_identifier,
+        "badge number": row.star_no,
+        "job title": check_output(row.job_title),
+        "start date": row.start_date,
+        "end date": row.resign_date,
+        "unit id": row.unit_id,
+        "unit description": row.unit_description,
     }
 
 
-def incidents_record_maker(incident: Incident) -> _Record:
+def incidents_record_maker(row: Row) -> _Record:
+    location = row.address_id and Location.format_address(
+        row.street_name, row.cross_street1, row.cross_street2, row.city, row.state
+    )
+    officers = sorted(row.officers or [], key=lambda officer: officer[0])
     return {
-        "id": incident.id,
-        "report_num": incident.report_number,
-        "date": incident.date,
-        "time": incident.time,
-        "description": incident.description,
-        "location": incident.address,
-        "licenses": " ".join(map(str, incident.license_plates)),
-        "links": " ".join(map(str, incident.links)),
-        "officers": " ".join(map(str, incident.officers)),
+        "id": row.id,
+        "report_num": row.report_number,
+        "date": row.date,
+        "time": row.time,
+        "description": row.description,
+        "location": location,
+        "licenses": " ".join(f"<LicensePlate {id}>" for id in _ids(row.licenses)),
+        "links": " ".join(f"<Link {id}>" for id in _ids(row.links)),
+        "officers": " ".join(
+            Officer.format_repr(
+                officer_id,
+                Officer.format_full_name(first_name, middle_initial, last_name, suffix),
+                unique_internal_identifier,
+            )
+            for (
+                officer_id,
+                first_name,
+                middle_initial,
+                last_name,
+                suffix,
+                unique_internal_identifier,
+            ) in officers
+        ),
     }
 
 
-def links_record_maker(link: Link) -> _Record:
+def links_record_maker(row: Row) -> _Record:
     return {
-        "id": link.id,
-        "title": link.title,
-        "url": link.url,
-        "link_type": link.link_type,
-        "description": link.description,
-        "author": link.author,
-        "officers": [officer.id for officer in link.officers],
-        "incidents": [incident.id for incident in link.incidents],
+        "id": row.id,
+        "title": row.title,
+        "url": row.url,
+        "link_type": row.link_type,
+        "description": row.description,
+        "author": row.author,
+        "officers": _ids(row.officers),
+        "incidents": _ids(row.incidents),
     }
 
 
-def descriptions_record_maker(description: Description) -> _Record:
+def descriptions_record_maker(row: Row) -> _Record:
     return {
-        "id": description.id,
-        "text_contents": description.text_contents,
-        "created_by": description.created_by,
-        "officer_id": description.officer_id,
-        "created_at": description.created_at,
-        "last_updated_at": description.last_updated_at,
+        "id": row.id,
+        "text_contents": row.text_contents,
+        "created_by": row.created_by,
+        "officer_id": row.officer_id,
+        "created_at": row.created_at,
+        "last_updated_at": row.last_updated_at,
     }
+
+
+########################################################################################
+# Department exports
+########################################################################################
+
+
+class CsvExport(NamedTuple):
+    csv_suffix: str
+    field_names: List[str]
+    record_maker: Callable[[Row], _Record]
+    # Selects of exactly the columns the record maker reads, without loading models
+    query: Callable[[Session, int], Select]
+
+
+def _json_list(session: Session, *columns) -> ColumnElement:
+    """Aggregate the given columns into a JSON list, of lists when there are several
+    columns, that is loaded as a Python list.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        value = columns[0] if len(columns) == 1 else func.json_build_array(*columns)
+        aggregate = func.json_agg(value)
+    else:
+        value = columns[0] if len(columns) == 1 else func.json_array(*columns)
+        aggregate = func.json_group_array(value)
+    return type_coerce(aggregate, JSON)
+
+
+def _json_lists(session: Session, from_clause, key, *columns) -> Select:
+    """Select the `key` and JSON list of `columns` of each group of rows with the same
+    `key`, to be joined to an export query once instead of correlated to every row.
+    """
+    return (
+        select(key.label("key"), _json_list(session, *columns).label("list"))
+        .select_from(from_clause)
+        .group_by(key)
+    )
+
+
+def officers_query(session: Session, department_id: int) -> Select:
+    salaries = (
+        select(
+            Salary.officer_id,
+            Salary.salary,
+            func.row_number()
+            .over(
+                partition_by=Salary.officer_id,
+                order_by=(Salary.year.desc(), Salary.id),
+            )
+            .label("rank"),
+        )
+        .join(Officer, Officer.id == Salary.officer_id)
+        .where(Officer.department_id == department_id)
+        .subquery()
+    )
+    return (
+        select(
+            Officer.id,
+            Officer.unique_internal_identifier,
+            Officer.last_name,
+            Officer.first_name,
+            Officer.middle_initial,
+            Officer.suffix,
+            Officer.gender,
+            Officer.race,
+            Officer.birth_year,
+            Officer.employment_date,
+            Assignment.star_no,
+            Job.job_title,
+            salaries.c.salary,
+        )
+        .outerjoin(Assignment, Assignment.id == Officer.current_assignment_id)
+        .outerjoin(Job, Job.id == Assignment.job_id)
+        .outerjoin(
+            salaries, and_(salaries.c.officer_id == Officer.id, salaries.c.rank == 1)
+        )
+        .where(Officer.department_id == department_id)
+    )
+
+
+def assignments_query(session: Session, department_id: int) -> Select:
+    return (
+        select(
+            Assignment.id,
+            Assignment.officer_id,
+            Officer.unique_internal_identifier,
+            Assignment.star_no,
+            Job.job_title,
+            Assignment.start_date,
+            Assignment.resign_date,
+            Unit.id.label("unit_id"),
+            Unit.description.label("unit_description"),
+        )
+        .join(Officer, Officer.id == Assignment.officer_id)
+        .outerjoin(Job, Job.id == Assignment.job_id)
+        .outerjoin(Unit, Unit.id == Assignment.unit_id)
+        .where(Officer.department_id == department_id)
+    )
+
+
+def incidents_query(session: Session, department_id: int) -> Select:
+    department_incidents = select(Incident.id).where(
+        Incident.department_id == department_id
+    )
+    licenses = (
+        _json_lists(
+            session,
+            incident_license_plates,
+            incident_license_plates.c.incident_id,
+            incident_license_plates.c.license_plate_id,
+        )
+        .where(incident_license_plates.c.incident_id.in_(department_incidents))
+        .subquery()
+    )
+    links = (
+        _json_lists(
+            session,
+            incident_links,
+            incident_links.c.incident_id,
+            incident_links.c.link_id,
+        )
+        .where(incident_links.c.incident_id.in_(department_incidents))
+        .subquery()
+    )
+    officers = (
+        _json_lists(
+            session,
+            officer_incidents.join(
+                Officer, Officer.id == officer_incidents.c.officer_id
+            ),
+            officer_incidents.c.incident_id,
+            Officer.id,
+            Officer.first_name,
+            Officer.middle_initial,
+            Officer.last_name,
+            Officer.suffix,
+            Officer.unique_internal_identifier,
+        )
+        .where(officer_incidents.c.incident_id.in_(department_incidents))
+        .subquery()
+    )
+    return (
+        select(
+            Incident.id,
+            Incident.report_number,
+            Incident.date,
+            Incident.time,
+            Incident.description,
+            Incident.address_id,
+            Location.street_name,
+            Location.cross_street1,
+            Location.cross_street2,
+            Location.city,
+            Location.state,
+            licenses.c.list.label("licenses"),
+            links.c.list.label("links"),
+            officers.c.list.label("officers"),
+        )
+        .outerjoin(Location, Location.id == Incident.address_id)
+        .outerjoin(licenses, licenses.c.key == Incident.id)
+        .outerjoin(links, links.c.key == Incident.id)
+        .outerjoin(officers, officers.c.key == Incident.id)
+        .where(Incident.department_id == department_id)
+    )
+
+
+def salaries_query(session: Session, department_id: int) -> Select:
+    return (
+        select(
+            Salary.id,
+            Salary.officer_id,
+            Officer.first_name,
+            Officer.last_name,
+            Salary.salary,
+            Salary.overtime_pay,
+            Salary.year,
+            Salary.is_fiscal_year,
+        )
+        .join(Officer, Officer.id == Salary.officer_id)
+        .where(Officer.department_id == department_id)
+    )
+
+
+def links_query(session: Session, department_id: int) -> Select:
+    # Only the department's officers are listed, and links to none of them are left out
+    officers = (
+        _json_lists(
+            session,
+            officer_links.join(Officer, Officer.id == officer_links.c.officer_id),
+            officer_links.c.link_id,
+            officer_links.c.officer_id,
+        )
+        .where(Officer.department_id == department_id)
+        .subquery()
+    )
+    incidents = (
+        _json_lists(
+            session,
+            incident_links,
+            incident_links.c.link_id,
+            incident_links.c.incident_id,
+        )
+        .where(incident_links.c.link_id.in_(select(officers.c.key)))
+        .subquery()
+    )
+    return (
+        select(
+            Link.id,
+            Link.title,
+            Link.url,
+            Link.link_type,
+            Link.description,
+            Link.author,
+            officers.c.list.label("officers"),
+            incidents.c.list.label("incidents"),
+        )
+        .join(officers, officers.c.key == Link.id)
+        .outerjoin(incidents, incidents.c.key == Link.id)
+    )
+
+
+def descriptions_query(session: Session, department_id: int) -> Select:
+    return (
+        select(
+            Description.id,
+            Description.text_contents,
+            Description.created_by,
+            Description.officer_id,
+            Description.created_at,
+            Description.last_updated_at,
+        )
+        .join(Officer, Officer.id == Description.officer_id)
+        .where(Officer.department_id == department_id)
+    )
+
+
+# The CSV downloads of a department, by the update type they are cached under
+DEPARTMENT_CSV_EXPORTS: Dict[str, CsvExport] = {
+    KEY_DEPT_ALL_OFFICERS: CsvExport(
+        "Officers",
+        [
+            "id",
+            "unique identifier",
+            "last name",
+            "first name",
+            "middle initial",
+            "suffix",
+            "gender",
+            "race",
+            "birth year",
+            "employment date",
+            "badge number",
+            "job title",
+            "most recent salary",
+        ],
+        officer_record_maker,
+        officers_query,
+    ),
+    KEY_DEPT_ALL_ASSIGNMENTS: CsvExport(
+        "Assignments",
+        [
+            "id",
+            "officer id",
+            "officer unique identifier",
+            "badge number",
+            "job title",
+            "start date",
+            "end date",
+            "unit id",
+            "unit description",
+        ],
+        assignment_record_maker,
+        assignments_query,
+    ),
+    KEY_DEPT_ALL_INCIDENTS: CsvExport(
+        "Incidents",
+        [
+            "id",
+            "report_num",
+            "date",
+            "time",
+            "description",
+            "location",
+            "licenses",
+            "links",
+            "officers",
+        ],
+        incidents_record_maker,
+        incidents_query,
+    ),
+    KEY_DEPT_ALL_SALARIES: CsvExport(
+        "Salaries",
+        [
+            "id",
+            "officer id",
+            "first name",
+            "last name",
+            "salary",
+            "overtime_pay",
+            "year",
+            "is_fiscal_year",
+        ],
+        salary_record_maker,
+        salaries_query,
+    ),
+    KEY_DEPT_ALL_LINKS: CsvExport(
+        "Links",
+        [
+            "id",
+            "title",
+            "url",
+            "link_type",
+            "description",
+            "author",
+            "officers",
+            "incidents",
+        ],
+        links_record_maker,
+        links_query,
+    ),
+    KEY_DEPT_ALL_NOTES: CsvExport(
+        "Notes",
+        [
+            "id",
+            "text_contents",
+            "created_by",
+            "officer_id",
+            "created_at",
+            "last_updated_at",
+        ],
+        descriptions_record_maker,
+        descriptions_query,
+    ),
+}
@@ -1,4 +1,4 @@
-from http import HTTPMethod
+from http import HTTPMethod, HTTPStatus
 from typing import Callable, Union
 
 from flask import abort, current_app, flash, redirect, render_template, request, url_for
@@ -20,7 +20,6 @@ from OpenOversight.app.utils.constants import (
     KEY_DEPT_ALL_INCIDENTS,
     KEY_DEPT_ALL_LINKS,
     KEY_DEPT_ALL_NOTES,
-    KEY_DEPT_TOTAL_INCIDENTS,
 )
 from OpenOversight.app.utils.db import add_department_query
 from OpenOversight.app.utils.forms import set_dynamic_default
@@ -60,7 +59,7 @@ class ModelView(MethodView):
                 url=f"main.{self.model_name}_api",
             )
         else:
-            obj = db.get_or_404(self.model, obj_id)
+            obj = self.get_obj_or_404(obj_id)
             return render_template(
                 f"{self.model_name}_detail.html",
                 obj=obj,
@@ -89,7 +88,7 @@ class ModelView(MethodView):
             match self.model.__name__:
                 case Incident.__name__:
                     Department(id=new_obj.department_id).remove_database_cache_entries(
-                        [KEY_DEPT_TOTAL_INCIDENTS, KEY_DEPT_ALL_INCIDENTS],
+                        [KEY_DEPT_ALL_INCIDENTS],
                     )
                 case Note.__name__:
                     officer = Officer.query.filter_by(
@@ -111,7 +110,7 @@ class ModelView(MethodView):
     @login_required
     @ac_or_admin_required
     def edit(self, obj_id, form=None):
-        obj = db.get_or_404(self.model, obj_id)
+        obj = self.get_obj_or_404(obj_id)
         if self.department_check:
             if (
                 not current_user.is_administrator
@@ -158,7 +157,7 @@ class ModelView(MethodView):
     @login_required
     @ac_or_admin_required
     def delete(self, obj_id):
-        obj = db.get_or_404(self.model, obj_id)
+        obj = self.get_obj_or_404(obj_id)
         if self.department_check:
             if (
                 not current_user.is_administrator
@@ -172,7 +171,7 @@ class ModelView(MethodView):
             match self.model.__name__:
                 case Incident.__name__:
                     Department(id=obj.department_id).remove_database_cache_entries(
-                        [KEY_DEPT_TOTAL_INCIDENTS, KEY_DEPT_ALL_INCIDENTS],
+                        [KEY_DEPT_ALL_INCIDENTS],
                     )
                 case Note.__name__:
                     officer = Officer.query.filter_by(
@@ -189,6 +188,16 @@ class ModelView(MethodView):
 
         return render_template(f"{self.model_name}_delete.html", obj=obj)
 
+    def get_obj_or_404(self, obj_id):
+        obj = db.session.get(self.model, obj_id, options=self.get_load_options())
+        if obj is None:
+            abort(HTTPStatus.NOT_FOUND)
+        return obj
+
+    def get_load_options(self):
+        # loader options for the relationships the show, edit and delete views use
+        return []
+
     def get_edit_form(self, obj):
         form = self.form(obj=obj)
         return form
@@ -21,20 +21,19 @@ from flask import (
 from flask_login import current_user, login_required, login_user
 from flask_wtf import FlaskForm
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import contains_eager, joinedload, selectinload
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.orm.exc import NoResultFound
 
 from OpenOversight.app import limiter, sitemap
 from OpenOversight.app.auth.forms import LoginForm
 from OpenOversight.app.main import main
+from OpenOversight.app.main.changes import DepartmentChanges, since_cursor
 from OpenOversight.app.main.downloads import (
-    assignment_record_maker,
-    descriptions_record_maker,
-    incidents_record_maker,
-    links_record_maker,
+    DEPARTMENT_CSV_EXPORTS,
+    department_csv,
+    make_downloadable_archive,
     make_downloadable_csv,
-    officer_record_maker,
-    salary_record_maker,
+    serves_rendered_export,
 )
 from OpenOversight.app.main.forms import (
     AddImageForm,
@@ -56,6 +55,7 @@ from OpenOversight.app.main.forms import (
 )
 from OpenOversight.app.main.model_view import ModelView
 from OpenOversight.app.models.database import (
+    CHANGE_FEED_MODELS,
     Assignment,
     Department,
     Description,
@@ -74,8 +74,10 @@ from OpenOversight.app.models.database import (
     db,
 )
 from OpenOversight.app.models.database_cache import (
-    get_database_cache_entry,
-    put_database_cache_entry,
+    DB_CACHE,
+    DB_CACHE_STATS,
+    database_cache_usage,
+    purge_database_cache,
 )
 from OpenOversight.app.utils.auth import ac_or_admin_required, admin_required
 from OpenOversight.app.utils.choices import AGE_CHOICES, GENDER_CHOICES, RACE_CHOICES
@@ -83,25 +85,35 @@ from OpenOversight.app.utils.cloud import crop_image, save_image_to_s3_and_db
 from OpenOversight.app.utils.constants import (
     ENCODING_UTF_8,
     FLASH_MSG_PERMANENT_REDIRECT,
+    KEY_DB_CACHE_MAX_BYTES,
     KEY_DEPT_ALL_ASSIGNMENTS,
     KEY_DEPT_ALL_INCIDENTS,
     KEY_DEPT_ALL_LINKS,
     KEY_DEPT_ALL_NOTES,
     KEY_DEPT_ALL_OFFICERS,
     KEY_DEPT_ALL_SALARIES,
-    KEY_DEPT_TOTAL_ASSIGNMENTS,
-    KEY_DEPT_TOTAL_OFFICERS,
     KEY_OFFICERS_PER_PAGE,
     KEY_TIMEZONE,
 )
 from OpenOversight.app.utils.db import (
+    OFFICER_ROSTER_SORT_KEY,
     add_department_query,
     add_unit_query,
     compute_leaderboard_stats,
+    department_jobs,
+    department_units,
+    dept_choices,
+    documented_departments,
+    featured_face_filepaths,
+    incident_counts,
+    load_officer_profile,
+    officer_roster_key,
+    strict_loading_options,
     unit_choices,
     unsorted_dept_choices,
 )
 from OpenOversight.app.utils.forms import (
+    TEXT_SEARCH_FIELDS,
     add_new_assignment,
     add_officer_profile,
     create_description,
@@ -122,6 +134,7 @@ from OpenOversight.app.utils.general import (
     serve_image,
     validate_redirect_url,
 )
+from OpenOversight.app.utils.pagination import KeysetPagination
 
 
 # Ensure the file is read/write by the creator only
@@ -170,10 +183,7 @@ def set_session_timezone():
 @sitemap_include
 @main.route("/browse", methods=[HTTPMethod.GET])
 def browse():
-    departments = Department.query.filter(Department.officers.any()).order_by(
-        Department.state.asc(), Department.name.asc()
-    )
-    return render_template("browse.html", departments=departments)
+    return render_template("browse.html", departments=documented_departments())
 
 
 @sitemap_include
@@ -317,23 +327,13 @@ def redirect_officer_profile(officer_id: int):
 @main.route("/officers/<int:officer_id>", methods=[HTTPMethod.GET, HTTPMethod.POST])
 def officer_profile(officer_id: int):
     form = AssignmentForm()
-    try:
-        officer = Officer.query.filter_by(id=officer_id).one()
-    except NoResultFound:
-        abort(HTTPStatus.NOT_FOUND)
-    form.job_title.query = (
-        Job.query.filter_by(department_id=officer.department_id)
-        .order_by(Job.order.asc())
-        .all()
+    officer = load_officer_profile(officer_id)
+    form.job_title.query = sorted(
+        department_jobs(officer.department_id), key=lambda job: job.order
     )
 
     try:
-        faces = (
-            Face.query.filter_by(officer_id=officer_id)
-            .order_by(Face.featured.desc())
-            .all()
-        )
-        assignments = Assignment.query.filter_by(officer_id=officer_id).all()
+        faces = sorted(officer.face, key=lambda face: (not face.featured, face.id))
         face_paths = [(face, serve_image(face.image.filepath)) for face in faces]
         if not face_paths:
             # Add in the placeholder image if no faces are found
@@ -356,7 +356,7 @@ def officer_profile(officer_id: int):
         "officer.html",
         officer=officer,
         face_paths=face_paths,
-        assignments=assignments,
+        assignments=officer.assignments,
         form=form,
     )
 
@@ -400,7 +400,7 @@ def add_assignment(officer_id: int):
             try:
                 add_new_assignment(officer_id, form, current_user)
                 Department(id=officer.department_id).remove_database_cache_entries(
-                    [KEY_DEPT_ALL_ASSIGNMENTS, KEY_DEPT_TOTAL_ASSIGNMENTS],
+                    [KEY_DEPT_ALL_ASSIGNMENTS],
                 )
                 flash("Added new assignment!")
             except IntegrityError:
@@ -672,6 +672,50 @@ def classify_submission(image_id: int, contains_cops: int):
     return redirect(redirect_url())
 
 
+@main.route("/cache", methods=[HTTPMethod.GET])
+@login_required
+@admin_required
+def cache_panel():
+    usage_by_type, usage_by_department = database_cache_usage()
+    update_types = sorted(set(usage_by_type.entries) | set(DB_CACHE_STATS.counts))
+    return render_template(
+        "cache.html",
+        backend=DB_CACHE.backend,
+        max_bytes=current_app.config[KEY_DB_CACHE_MAX_BYTES],
+        stats=DB_CACHE_STATS,
+        update_types=update_types,
+        usage_by_type=usage_by_type,
+        usage_by_department=usage_by_department,
+        departments=dept_choices(),
+    )
+
+
+@main.route("/cache/purge", methods=[HTTPMethod.POST])
+@login_required
+@admin_required
+def purge_cache():
+    department_id = request.form.get("department_id", type=int)
+    purged = purge_database_cache(department_id)
+    flash(f"Removed {purged} cache entries")
+    return redirect(url_for("main.cache_panel"))
+
+
+@main.route("/cache/warm", methods=[HTTPMethod.POST])
+@login_required
+@admin_required
+def warm_cache():
+    department = db.session.get(Department, request.form.get("department_id", type=int))
+    if not department:
+        abort(HTTPStatus.NOT_FOUND)
+
+    department_jobs(department.id)
+    department_units(department.id)
+    for update_type in DEPARTMENT_CSV_EXPORTS:
+        department_csv(department.id, update_type)
+    flash(f"Cached the lists and downloads of {department.name}")
+    return redirect(url_for("main.cache_panel"))
+
+
 @main.route("/department/new", methods=[HTTPMethod.GET, HTTPMethod.POST])
 @login_required
 @admin_required
@@ -898,47 +942,26 @@ def redirect_list_officer(
     )
 
 
-@main.route("/departments/<int:department_id>")
-def list_officer(
-    department_id: int,
-    page: int = 1,
-    race=None,
-    gender=None,
-    rank=None,
-    min_age="16",
-    max_age="100",
-    last_name=None,
-    first_name=None,
-    badge=None,
-    unique_internal_identifier=None,
-    unit=None,
-    current_job=None,
-    require_photo: Optional[bool] = None,
-):
-    try:
-        department = Department.query.filter_by(id=department_id).one()
-    except NoResultFound:
-        abort(HTTPStatus.NOT_FOUND)
+def _roster_form_data(department_id: int):
+    """Read the officer roster filters from the query string.
 
-    form = BrowseForm()
-    form.rank.query = (
-        Job.query.filter_by(department_id=department_id, is_sworn_officer=True)
-        .order_by(Job.order.asc())
-        .all()
-    )
-    form_data = form.data
-    form_data["race"] = race or []
-    form_data["gender"] = gender or []
-    form_data["rank"] = rank or []
-    form_data["min_age"] = min_age
-    form_data["max_age"] = max_age
-    form_data["last_name"] = last_name
-    form_data["first_name"] = first_name
-    form_data["badge"] = badge
-    form_data["unit"] = unit or []
-    form_data["current_job"] = current_job
-    form_data["unique_internal_identifier"] = unique_internal_identifier
-    form_data["require_photo"] = require_photo
+    Returns the filters along with the rank and unit selections of the department,
+    which are what the rank and unit filters are validated against.
+    """
+    form_data = {
+        "race": [],
+        "gender": [],
+        "rank": [],
+        "min_age": "16",
+        "max_age": "100",
+        "last_name": None,
+        "first_name": None,
+        "badge": None,
+        "unit": [],
+        "current_job": None,
+        "unique_internal_identifier": None,
+        "require_photo": None,
+    }
 
     age_range = {ac[0] for ac in AGE_CHOICES}
 
@@ -947,8 +970,6 @@ def list_officer(
         form_data["min_age"] = min_age_arg
     if (max_age_arg := request.args.get("max_age")) and max_age_arg in age_range:
         form_data["max_age"] = max_age_arg
-    if page_arg := request.args.get("page"):
-        page = int(page_arg)
     if last_name_arg := request.args.get("last_name"):
         form_data["last_name"] = last_name_arg
     if first_name_arg := request.args.get("first_name"):
@@ -971,19 +992,9 @@ def list_officer(
         form_data["require_photo"] = require_photo_arg
 
     unit_selections = ["Not Sure"] + [
-        uc[0]
-        for uc in db.session.query(Unit.description)
-        .filter_by(department_id=department_id)
-        .order_by(Unit.description.asc())
-        .all()
-    ]
-    rank_selections = [
-        jc[0]
-        for jc in db.session.query(Job.job_title, Job.order)
-        .filter_by(department_id=department_id)
-        .order_by(Job.job_title)
-        .all()
+        unit.description for unit in department_units(department_id)
     ]
+    rank_selections = [job.job_title for job in department_jobs(department_id)]
     if (units := request.args.getlist("unit")) and all(
         unit in unit_selections for unit in units
     ):
@@ -995,6 +1006,10 @@ def list_officer(
     if current_job_arg := request.args.get("current_job"):
         form_data["current_job"] = current_job_arg
 
+    return form_data, unit_selections, rank_selections
+
+
+def _roster_query(form_data, department_id: int):
     officers = filter_by_form(form_data, Officer.query, department_id).filter(
         Officer.department_id == department_id
     )
@@ -1002,35 +1017,14 @@ def list_officer(
     # Filter officers by presence of a photo
     if form_data["require_photo"]:
         officers = officers.join(Face)
-    else:
-        officers = officers.options(selectinload(Officer.face))
-
-    officers = officers.order_by(Officer.last_name, Officer.first_name, Officer.id)
+    return officers
 
-    officers = officers.paginate(
-        page=page, per_page=current_app.config[KEY_OFFICERS_PER_PAGE], error_out=False
-    )
-
-    for officer in officers.items:
-        officer_face = sorted(officer.face, key=lambda x: x.featured, reverse=True)
-
-        # Could do some extra work to not lazy load images but load them all together.
-        # To do that properly we would want to ensure to only load the first picture of
-        # each officer.
-        if officer_face and officer_face[0].image:
-            officer.image = officer_face[0].image.filepath
-
-    choices = {
-        "race": RACE_CHOICES,
-        "gender": GENDER_CHOICES,
-        "rank": [(rc, rc) for rc in rank_selections],
-        "unit": [(uc, uc) for uc in unit_selections],
-    }
 
-    next_url = url_for(
-        "main.list_officer",
-        department_id=department.id,
-        page=officers.next_num,
+def _roster_url(endpoint: str, department_id: int, form_data, **pagination):
+    return url_for(
+        endpoint,
+        department_id=department_id,
+        **pagination,
         race=form_data["race"],
         gender=form_data["gender"],
         rank=form_data["rank"],
@@ -1044,37 +1038,214 @@ def list_officer(
         current_job=form_data["current_job"],
         require_photo=form_data["require_photo"],
     )
-    prev_url = url_for(
-        "main.list_officer",
-        department_id=department.id,
-        page=officers.prev_num,
-        race=form_data["race"],
-        gender=form_data["gender"],
-        rank=form_data["rank"],
-        min_age=form_data["min_age"],
-        max_age=form_data["max_age"],
-        last_name=form_data["last_name"],
-        first_name=form_data["first_name"],
-        badge=form_data["badge"],
-        unique_internal_identifier=form_data["unique_internal_identifier"],
-        unit=form_data["unit"],
-        current_job=form_data["current_job"],
-        require_photo=form_data["require_photo"],
+
+
+@main.route("/departments/<int:department_id>")
+def list_officer(department_id: int):
+    try:
+        department = Department.query.filter_by(id=department_id).one()
+    except NoResultFound:
+        abort(HTTPStatus.NOT_FOUND)
+
+    form = BrowseForm()
+    form.rank.query = sorted(
+        (job for job in department_jobs(department_id) if job.is_sworn_officer),
+        key=lambda job: job.order,
+    )
+    roster_form_data, unit_selections, rank_selections = _roster_form_data(
+        department_id
+    )
+    form_data = {**form.data, **roster_form_data}
+
+    page = 1
+    if page_arg := request.args.get("page"):
+        page = int(page_arg)
+
+    officers = _roster_query(form_data, department_id).options(
+        selectinload(Officer.face)
     )
 
+    per_page = current_app.config[KEY_OFFICERS_PER_PAGE]
+    # Numbered pages and relevance-ranked searches use OFFSET pagination. Everything
+    # else seeks past the last officer shown, so deep pages cost the same as the first.
+    if page_arg or any(form_data.get(field) for field in TEXT_SEARCH_FIELDS):
+        officers = officers.order_by(*OFFICER_ROSTER_SORT_KEY).paginate(
+            page=page, per_page=per_page, error_out=False
+        )
+        next_page = {"page": officers.next_num}
+        prev_page = {"page": officers.prev_num}
+    else:
+        # Skip the COUNT(*) unless the cached department total is a fair estimate
+        is_filtered = any(
+            value
+            for arg, value in request.args.items()
+            if arg not in ("after", "before", "min_age", "max_age")
+        )
+        try:
+            officers = KeysetPagination(
+                officers,
+                OFFICER_ROSTER_SORT_KEY,
+                officer_roster_key,
+                per_page,
+                after=request.args.get("after"),
+                before=request.args.get("before"),
+                total=None if is_filtered else department.total_documented_officers(),
+            )
+        except ValueError:
+            abort(HTTPStatus.BAD_REQUEST)
+        next_page = {"after": officers.next_cursor}
+        prev_page = {"before": officers.prev_cursor}
+
+    officer_ids = [officer.id for officer in officers.items]
+    face_filepaths = featured_face_filepaths(officer_ids)
+    for officer in officers.items:
+        officer.image = face_filepaths.get(officer.id)
+
+    choices = {
+        "race": RACE_CHOICES,
+        "gender": GENDER_CHOICES,
+        "rank": [(rc, rc) for rc in rank_selections],
+        "unit": [(uc, uc) for uc in unit_selections],
+    }
+
+    next_url = _roster_url("main.list_officer", department_id, form_data, **next_page)
+    prev_url = _roster_url("main.list_officer", department_id, form_data, **prev_page)
+    api_next_url = None
+    if officers.page is None and officers.has_next:
+        api_next_url = _roster_url(
+            "main.api_list_officers", department_id, form_data, **next_page
+        )
+
     return render_template(
         "list_officer.html",
         form=form,
         department=department,
         officers=officers,
+        incident_counts=incident_counts(officer_ids),
         form_data=form_data,
         choices=choices,
         next_url=next_url,
         prev_url=prev_url,
+        api_next_url=api_next_url,
         jsloads=["js/select2.min.js", "js/list_officer.js"],
     )
 
 
+@main.route("/api/departments/<int:department_id>/officers")
+def api_list_officers(department_id: int):
+    """Return a page of a department's officer roster as JSON.
+
+    Takes the same filters as list_officer and is paginated with the `after` and
+    `before` cursors only. Results are always in roster order, even for name
+    searches. Responses carry an ETag so that unchanged pages can be revalidated
+    cheaply.
+    """
+    if not db.session.query(
+        Department.query.filter_by(id=department_id).exists()
+    ).scalar():
+        abort(HTTPStatus.NOT_FOUND)
+
+    form_data, _, _ = _roster_form_data(department_id)
+    # Keyset pagination needs the roster order, not search relevance
+    officers = (
+        _roster_query(form_data, department_id)
+        .order_by(None)
+        .options(selectinload(Officer.face))
+    )
+    try:
+        officers = KeysetPagination(
+            officers,
+            OFFICER_ROSTER_SORT_KEY,
+            officer_roster_key,
+            current_app.config[KEY_OFFICERS_PER_PAGE],
+            after=request.args.get("after"),
+            before=request.args.get("before"),
+        )
+    except ValueError:
+        abort(HTTPStatus.BAD_REQUEST)
+
+    officer_ids = [officer.id for officer in officers.items]
+    face_filepaths = featured_face_filepaths(officer_ids)
+    officer_incident_counts = incident_counts(officer_ids)
+    rows = []
+    for officer in officers.items:
+        filepath = face_filepaths.get(officer.id)
+        race = officer.race_label()
+        rows.append(
+            {
+                "id": officer.id,
+                "name": officer.full_name(),
+                "badge": officer.badge_number(),
+                "rank": officer.job_title(),
+                "unit": officer.unit_description(),
+                "currently_on_force": officer.currently_on_force(),
+                "incidents": officer_incident_counts.get(officer.id, 0),
+                "race": race and race.lower().title(),
+                "gender": officer.gender_label(),
+                "photos": len(officer.face),
+                "thumbnail": filepath and serve_image(filepath),
+                "url": url_for("main.officer_profile", officer_id=officer.id),
+            }
+        )
+
+    next_url = prev_url = None
+    if officers.has_next:
+        next_url = _roster_url(
+            "main.api_list_officers",
+            department_id,
+            form_data,
+            after=officers.next_cursor,
+        )
+    if officers.has_prev:
+        prev_url = _roster_url(
+            "main.api_list_officers",
+            department_id,
+            form_data,
+            before=officers.prev_cursor,
+        )
+
+    response = jsonify(officers=rows, next=next_url, prev=prev_url)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@main.route("/api/departments/<int:department_id>/changes/<string:table_name>")
+def api_department_changes(department_id: int, table_name: str):
+    """Return a page of the changes to a department's officers, assignments,
+    salaries, incidents, links or descriptions as JSON, for mirrors to sync from.
+
+    Changes are listed from the `since` timestamp, or the `after` cursor, onwards.
+    `next` is the URL of the following page if there is one already. The returned
+    `cursor` is where to resume from once the pages have been applied. It lies a safety
+    window behind the last change, so that changes whose transactions committed late
+    are not missed, which means mirrors must apply changes idempotently.
+    """
+    if table_name not in CHANGE_FEED_MODELS:
+        abort(HTTPStatus.NOT_FOUND)
+    if not db.session.query(
+        Department.query.filter_by(id=department_id).exists()
+    ).scalar():
+        abort(HTTPStatus.NOT_FOUND)
+
+    try:
+        after = request.args.get("after")
+        if after is None and request.args.get("since"):
+            after = since_cursor(request.args["since"])
+        changes = DepartmentChanges(table_name, department_id, after=after)
+    except ValueError:
+        abort(HTTPStatus.BAD_REQUEST)
+
+    next_url = None
+    if changes.has_next:
+        next_url = url_for(
+            "main.api_department_changes",
+            department_id=department_id,
+            table_name=table_name,
+            after=changes.next_cursor,
+        )
+    return jsonify(changes=changes.items, cursor=changes.cursor, next=next_url)
+
+
 @main.route("/department/<int:department_id>/ranks")
 def redirect_get_dept_ranks(department_id: int, is_sworn_officer: bool = False):
     flash(FLASH_MSG_PERMANENT_REDIRECT)
@@ -1092,16 +1263,16 @@ def redirect_get_dept_ranks(department_id: int, is_sworn_officer: bool = False):
 @main.route("/ranks")
 def get_dept_ranks(department_id: Optional[int] = None, is_sworn_officer: bool = False):
     if not department_id:
-        department_id = request.args.get("department_id")
+        department_id = request.args.get("department_id", type=int)
     if request.args.get("is_sworn_officer"):
         is_sworn_officer = request.args.get("is_sworn_officer")
 
     if department_id:
-        ranks = Job.query.filter_by(department_id=department_id)
-        if is_sworn_officer:
-            ranks = ranks.filter_by(is_sworn_officer=True)
-        ranks = ranks.order_by(Job.job_title).all()
-        rank_list = [(rank.id, rank.job_title) for rank in ranks]
+        rank_list = [
+            (rank.id, rank.job_title)
+            for rank in department_jobs(department_id)
+            if rank.is_sworn_officer or not is_sworn_officer
+        ]
     else:
         # Not filtering by is_sworn_officer
         ranks = Job.query.all()
@@ -1127,12 +1298,12 @@ def redirect_get_dept_units(department_id: int):
 @main.route("/units")
 def get_dept_units(department_id: Optional[int] = None):
     if not department_id:
-        department_id = request.args.get("department_id")
+        department_id = request.args.get("department_id", type=int)
 
     if department_id:
-        units = Unit.query.filter_by(department_id=department_id)
-        units = units.order_by(Unit.description).all()
-        unit_list = [(unit.id, unit.description) for unit in units]
+        unit_list = [
+            (unit.id, unit.description) for unit in department_units(department_id)
+        ]
     else:
         units = Unit.query.all()
         # Prevent duplicate units
@@ -1179,7 +1350,7 @@ def add_officer():
         form = AddOfficerForm(new_form_data)
         officer = add_officer_profile(form, current_user)
         Department(id=officer.department_id).remove_database_cache_entries(
-            [KEY_DEPT_ALL_OFFICERS, KEY_DEPT_TOTAL_OFFICERS]
+            [KEY_DEPT_ALL_OFFICERS]
         )
         flash(f"New Officer {officer.last_name} added to OpenOversight")
         return redirect(url_for("main.submit_officer_images", officer_id=officer.id))
@@ -1229,9 +1400,6 @@ def edit_officer(officer_id: int):
 
     if form.validate_on_submit():
         officer = edit_officer_profile(officer, form)
-        Department(id=officer.department_id).remove_database_cache_entries(
-            [KEY_DEPT_TOTAL_OFFICERS]
-        )
         flash(f"Officer {officer.last_name} edited")
         return redirect(url_for("main.officer_profile", officer_id=officer.id))
     else:
@@ -1579,38 +1747,9 @@ def redirect_download_dept_officers_csv(department_id: int):
 @main.route(
     "/download/departments/<int:department_id>/officers", methods=[HTTPMethod.GET]
 )
-@limiter.limit("5/minute")
+@limiter.limit("5/minute", exempt_when=serves_rendered_export(KEY_DEPT_ALL_OFFICERS))
 def download_dept_officers_csv(department_id: int):
-    cache_params = (Department(id=department_id), KEY_DEPT_ALL_OFFICERS)
-    officers = get_database_cache_entry(*cache_params)
-    if officers is None:
-        officers = (
-            db.session.query(Officer)
-            .options(joinedload(Officer.assignments).joinedload(Assignment.job))
-            .options(joinedload(Officer.salaries))
-            .filter_by(department_id=department_id)
-            .all()
-        )
-        put_database_cache_entry(*cache_params, officers)
-
-    field_names = [
-        "id",
-        "unique identifier",
-        "last name",
-        "first name",
-        "middle initial",
-        "suffix",
-        "gender",
-        "race",
-        "birth year",
-        "employment date",
-        "badge number",
-        "job title",
-        "most recent salary",
-    ]
-    return make_downloadable_csv(
-        officers, department_id, "Officers", field_names, officer_record_maker
-    )
+    return make_downloadable_csv(department_id, KEY_DEPT_ALL_OFFICERS)
 
 
 @main.route(
@@ -1627,40 +1766,9 @@ def redirect_download_dept_assignments_csv(department_id: int):
 @main.route(
     "/download/departments/<int:department_id>/assignments", methods=[HTTPMethod.GET]
 )
-@limiter.limit("5/minute")
+@limiter.limit("5/minute", exempt_when=serves_rendered_export(KEY_DEPT_ALL_ASSIGNMENTS))
 def download_dept_assignments_csv(department_id: int):
-    cache_params = Department(id=department_id), KEY_DEPT_ALL_ASSIGNMENTS
-    assignments = get_database_cache_entry(*cache_params)
-    if assignments is None:
-        assignments = (
-            db.session.query(Assignment)
-            .join(Assignment.base_officer)
-            .filter(Officer.department_id == department_id)
-            .options(contains_eager(Assignment.base_officer))
-            .options(joinedload(Assignment.unit))
-            .options(joinedload(Assignment.job))
-            .all()
-        )
-        put_database_cache_entry(*cache_params, assignments)
-
-    field_names = [
-        "id",
-        "officer id",
-        "officer unique identifier",
-        "badge number",
-        "job title",
-        "start date",
-        "end date",
-        "unit id",
-        "unit description",
-    ]
-    return make_downloadable_csv(
-        assignments,
-        department_id,
-        "Assignments",
-        field_names,
-        assignment_record_maker,
-    )
+    return make_downloadable_csv(department_id, KEY_DEPT_ALL_ASSIGNMENTS)
 
 
 @main.route(
@@ -1677,32 +1785,9 @@ def redirect_download_incidents_csv(department_id: int):
 @main.route(
     "/download/departments/<int:department_id>/incidents", methods=[HTTPMethod.GET]
 )
-@limiter.limit("5/minute")
+@limiter.limit("5/minute", exempt_when=serves_rendered_export(KEY_DEPT_ALL_INCIDENTS))
 def download_incidents_csv(department_id: int):
-    cache_params = (Department(id=department_id), KEY_DEPT_ALL_INCIDENTS)
-    incidents = get_database_cache_entry(*cache_params)
-    if incidents is None:
-        incidents = Incident.query.filter_by(department_id=department_id).all()
-        put_database_cache_entry(*cache_params, incidents)
-
-    field_names = [
-        "id",
-        "report_num",
-        "date",
-        "time",
-        "description",
-        "location",
-        "licenses",
-        "links",
-        "officers",
-    ]
-    return make_downloadable_csv(
-        incidents,
-        department_id,
-        "Incidents",
-        field_names,
-        incidents_record_maker,
-    )
+    return make_downloadable_csv(department_id, KEY_DEPT_ALL_INCIDENTS)
 
 
 @main.route(
@@ -1719,33 +1804,9 @@ def redirect_download_dept_salaries_csv(department_id: int):
 @main.route(
     "/download/departments/<int:department_id>/salaries", methods=[HTTPMethod.GET]
 )
-@limiter.limit("5/minute")
+@limiter.limit("5/minute", exempt_when=serves_rendered_export(KEY_DEPT_ALL_SALARIES))
 def download_dept_salaries_csv(department_id: int):
-    cache_params = (Department(id=department_id), KEY_DEPT_ALL_SALARIES)
-    salaries = get_database_cache_entry(*cache_params)
-    if salaries is None:
-        salaries = (
-            db.session.query(Salary)
-            .join(Salary.officer)
-            .filter(Officer.department_id == department_id)
-            .options(contains_eager(Salary.officer))
-            .all()
-        )
-        put_database_cache_entry(*cache_params, salaries)
-
-    field_names = [
-        "id",
-        "officer id",
-        "first name",
-        "last name",
-        "salary",
-        "overtime_pay",
-        "year",
-        "is_fiscal_year",
-    ]
-    return make_downloadable_csv(
-        salaries, department_id, "Salaries", field_names, salary_record_maker
-    )
+    return make_downloadable_csv(department_id, KEY_DEPT_ALL_SALARIES)
 
 
 @main.route("/download/department/<int:department_id>/links", methods=[HTTPMethod.GET])
@@ -1758,33 +1819,9 @@ def redirect_download_dept_links_csv(department_id: int):
 
 
 @main.route("/download/departments/<int:department_id>/links", methods=[HTTPMethod.GET])
-@limiter.limit("5/minute")
+@limiter.limit("5/minute", exempt_when=serves_rendered_export(KEY_DEPT_ALL_LINKS))
 def download_dept_links_csv(department_id: int):
-    cache_params = (Department(id=department_id), KEY_DEPT_ALL_LINKS)
-    links = get_database_cache_entry(*cache_params)
-    if links is None:
-        links = (
-            db.session.query(Link)
-            .join(Link.officers)
-            .filter(Officer.department_id == department_id)
-            .options(contains_eager(Link.officers))
-            .all()
-        )
-        put_database_cache_entry(*cache_params, links)
-
-    field_names = [
-        "id",
-        "title",
-        "url",
-        "link_type",
-        "description",
-        "author",
-        "officers",
-        "incidents",
-    ]
-    return make_downloadable_csv(
-        links, department_id, "Links", field_names, links_record_maker
-    )
+    return make_downloadable_csv(department_id, KEY_DEPT_ALL_LINKS)
 
 
 @main.route(
@@ -1801,38 +1838,29 @@ def redirect_download_dept_descriptions_csv(department_id: int):
 @main.route(
     "/download/departments/<int:department_id>/descriptions", methods=[HTTPMethod.GET]
 )
-@limiter.limit("5/minute")
+@limiter.limit("5/minute", exempt_when=serves_rendered_export(KEY_DEPT_ALL_NOTES))
 def download_dept_descriptions_csv(department_id: int):
-    cache_params = (Department(id=department_id), KEY_DEPT_ALL_NOTES)
-    notes = get_database_cache_entry(*cache_params)
-    if notes is None:
-        notes = (
-            db.session.query(Description)
-            .join(Description.officer)
-            .filter(Officer.department_id == department_id)
-            .options(contains_eager(Description.officer))
-            .all()
-        )
-        put_database_cache_entry(*cache_params, notes)
-
-    field_names = [
-        "id",
-        "text_contents",
-        "created_by",
-        "officer_id",
-        "created_at",
-        "last_updated_at",
-    ]
-    return make_downloadable_csv(
-        notes, department_id, "Notes", field_names, descriptions_record_maker
-    )
+    return make_downloadable_csv(department_id, KEY_DEPT_ALL_NOTES)
+
+
+@main.route(
+    "/download/departments/<int:department_id>/archive", methods=[HTTPMethod.GET]
+)
+@limiter.limit("5/minute")
+def download_dept_archive(department_id: int):
+    return make_downloadable_archive(department_id)
+
+
+@main.route("/download/departments/archive", methods=[HTTPMethod.GET])
+@limiter.limit("1/minute")
+def download_all_departments_archive():
+    return make_downloadable_archive()
 
 
 @sitemap_include
 @main.route("/download/all", methods=[HTTPMethod.GET])
 def all_data():
-    departments = Department.query.filter(Department.officers.any())
-    return render_template("departments_all.html", departments=departments)
+    return render_template("departments_all.html", departments=documented_departments())
 
 
 @main.route(
@@ -1975,7 +2003,14 @@ class IncidentApi(ModelView):
         page = int(request.args.get("page", 1))
 
         form = IncidentListForm()
-        incidents = self.model.query
+        incidents = self.model.query.options(
+            *strict_loading_options(Incident),
+            joinedload(Incident.address),
+            joinedload(Incident.creator),
+            joinedload(Incident.department),
+            selectinload(Incident.license_plates),
+            selectinload(Incident.officers),
+        )
 
         dept = None
         if department_id := request.args.get("department_id"):
@@ -2031,6 +2066,17 @@ class IncidentApi(ModelView):
             department=dept,
         )
 
+    def get_load_options(self):
+        return [
+            *strict_loading_options(Incident),
+            joinedload(Incident.address),
+            joinedload(Incident.creator),
+            joinedload(Incident.department),
+            selectinload(Incident.license_plates),
+            selectinload(Incident.links),
+            selectinload(Incident.officers),
+        ]
+
     def get_new_form(self):
         form = self.form()
         if request.args.get("officer_id"):
@@ -3,10 +3,13 @@ import os
 from OpenOversight.app.utils.constants import (
     KEY_APPROVE_REGISTRATIONS,
     KEY_DATABASE_URI,
+    KEY_DB_CACHE_MAX_BYTES,
+    KEY_DB_CACHE_URL,
     KEY_ENV,
     KEY_ENV_DEV,
     KEY_ENV_PROD,
     KEY_ENV_TESTING,
+    KEY_EXPORTS_DIR,
     KEY_MAIL_PASSWORD,
     KEY_MAIL_PORT,
     KEY_MAIL_SERVER,
@@ -17,6 +20,7 @@ from OpenOversight.app.utils.constants import (
     KEY_OO_MAIL_SUBJECT_PREFIX,
     KEY_OO_SERVICE_EMAIL,
     KEY_S3_BUCKET_NAME,
+    KEY_STRICT_LOADING,
     KEY_TIMEZONE,
     MEGABYTE,
 )
@@ -42,6 +46,15 @@ class BaseConfig:
         # DB Settings
         self.SQLALCHEMY_TRACK_MODIFICATIONS = False
         self.SQLALCHEMY_DATABASE_URI = os.environ.get(KEY_DATABASE_URI)
+        # Make relationships that a query did not declare raise instead of lazy loading
+        self.STRICT_LOADING = str_is_true(os.environ.get(KEY_STRICT_LOADING))
+        # Where to cache data computed from the database, see create_database_cache_backend
+        self.DB_CACHE_URL = os.environ.get(KEY_DB_CACHE_URL)
+        self.DB_CACHE_MAX_BYTES = int(
+            os.environ.get(KEY_DB_CACHE_MAX_BYTES, 64 * MEGABYTE)
+        )
+        # Where `flask render-exports` writes the department CSV downloads to serve
+        self.EXPORTS_DIR = os.environ.get(KEY_EXPORTS_DIR)
 
         # Protocol Settings
         self.SITEMAP_URL_SCHEME = "http"
@@ -100,6 +113,7 @@ class TestingConfig(BaseConfig):
         self.NUM_OFFICERS = 120
         self.RATELIMIT_ENABLED = False
         self.SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+        self.STRICT_LOADING = True
 
 
 class ProductionConfig(BaseConfig):
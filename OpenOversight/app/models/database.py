@@ -1,41 +1,69 @@
-import operator
-import re
 import time
 import uuid
+from collections import Counter, defaultdict
 from datetime import date, datetime, timezone
-from typing import List, Optional
+from itertools import chain
+from typing import DefaultDict, Dict, List, Optional, Tuple
 
 from authlib.jose import JoseError, JsonWebToken
-from cachetools import cached
 from flask import current_app
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import CheckConstraint, UniqueConstraint, func
-from sqlalchemy.orm import DeclarativeMeta, declarative_mixin, declared_attr, validates
+from sqlalchemy import (
+    DDL,
+    CheckConstraint,
+    UniqueConstraint,
+    event,
+    func,
+    insert,
+    inspect,
+    select,
+    true,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import (
+    DeclarativeMeta,
+    Session,
+    declarative_mixin,
+    declared_attr,
+    validates,
+)
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy.sql import func as sql_func
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from OpenOversight.app.models.database_cache import (
-    DB_CACHE,
-    model_cache_key,
-    remove_database_cache_entries,
-)
+from OpenOversight.app.models.database_cache import remove_database_cache_entries
 from OpenOversight.app.utils.choices import GENDER_CHOICES, RACE_CHOICES
 from OpenOversight.app.utils.constants import (
     ENCODING_UTF_8,
+    KEY_CHANGED_DEPARTMENT_CHOICES,
+    KEY_CHANGED_DEPARTMENT_EXPORTS,
+    KEY_CURRENT_ASSIGNMENT_OFFICERS,
     KEY_DB_CREATOR,
-    KEY_DEPT_TOTAL_ASSIGNMENTS,
-    KEY_DEPT_TOTAL_INCIDENTS,
-    KEY_DEPT_TOTAL_OFFICERS,
+    KEY_DEPT_ALL_JOBS,
+    KEY_DEPT_ALL_UNITS,
     SIGNATURE_ALGORITHM,
 )
-from OpenOversight.app.validators import state_validator, url_validator
+from OpenOversight.app.validators import (
+    state_validator,
+    url_validator,
+    zip_code_validator,
+)
 
 
 db = SQLAlchemy()
 jwt = JsonWebToken(SIGNATURE_ALGORITHM)
 BaseModel: DeclarativeMeta = db.Model
 
+# The trigram indexes on officer names rely on the pg_trgm extension, so make sure it
+# exists before `create_all` tries to build them. Other dialects skip this.
+event.listen(
+    db.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
 
 officer_links = db.Table(
     "officer_links",
@@ -96,9 +124,12 @@ class TrackUpdates:
         server_default=sql_func.now(),
         unique=False,
     )
+    # Set by the application on insert as well as update, so that every value has
+    # the same precision and the change feed can seek through them
     last_updated_at = db.Column(
         db.DateTime(timezone=True),
         nullable=False,
+        default=datetime.utcnow,
         server_default=sql_func.now(),
         unique=False,
         onupdate=datetime.utcnow,
@@ -133,6 +164,8 @@ class Department(BaseModel, TrackUpdates):
         db.String(100), unique=False, nullable=True
     )
 
+    stats = db.relationship("DepartmentStats", uselist=False, viewonly=True)
+
     __table_args__ = (UniqueConstraint("name", "state", name="departments_name_state"),)
 
     def __repr__(self):
@@ -151,26 +184,14 @@ class Department(BaseModel, TrackUpdates):
     def display_name(self):
         return self.name if not self.state else f"[{self.state}] {self.name}"
 
-    @cached(cache=DB_CACHE, key=model_cache_key(KEY_DEPT_TOTAL_ASSIGNMENTS))
     def total_documented_assignments(self):
-        return (
-            db.session.query(Assignment.id)
-            .join(Officer, Assignment.officer_id == Officer.id)
-            .filter(Officer.department_id == self.id)
-            .count()
-        )
+        return self.stats.assignments if self.stats else 0
 
-    @cached(cache=DB_CACHE, key=model_cache_key(KEY_DEPT_TOTAL_INCIDENTS))
     def total_documented_incidents(self):
-        return (
-            db.session.query(Incident).filter(Incident.department_id == self.id).count()
-        )
+        return self.stats.incidents if self.stats else 0
 
-    @cached(cache=DB_CACHE, key=model_cache_key(KEY_DEPT_TOTAL_OFFICERS))
     def total_documented_officers(self):
-        return (
-            db.session.query(Officer).filter(Officer.department_id == self.id).count()
-        )
+        return self.stats.officers if self.stats else 0
 
     def remove_database_cache_entries(self, update_types: List[str]) -> None:
         """Remove the Department model key from the cache if it exists."""
@@ -221,6 +242,11 @@ class Description(BaseModel, TrackUpdates):
     text_contents = db.Column(db.Text())
     officer_id = db.Column(db.Integer, db.ForeignKey("officers.id", ondelete="CASCADE"))
 
+    __table_args__ = (
+        # The change feed seeks through the table in this order
+        db.Index("ix_descriptions_last_updated_at", "last_updated_at", "id"),
+    )
+
 
 class Officer(BaseModel, TrackUpdates):
     __tablename__ = "officers"
@@ -235,7 +261,26 @@ class Officer(BaseModel, TrackUpdates):
     employment_date = db.Column(db.Date, index=True, unique=False, nullable=True)
     birth_year = db.Column(db.Integer, index=True, unique=False, nullable=True)
     assignments = db.relationship(
-        "Assignment", back_populates="base_officer", cascade_backrefs=False
+        "Assignment",
+        back_populates="base_officer",
+        cascade_backrefs=False,
+        foreign_keys="Assignment.officer_id",
+    )
+    # Denormalized pointer to the most recent assignment, kept up to date by
+    # update_current_assignments whenever assignments are flushed
+    current_assignment_id = db.Column(
+        db.Integer,
+        db.ForeignKey(
+            "assignments.id",
+            name="officers_current_assignment_id_fkey",
+            ondelete="SET NULL",
+            use_alter=True,
+        ),
+        index=True,
+        nullable=True,
+    )
+    current_assignment = db.relationship(
+        "Assignment", foreign_keys=[current_assignment_id], viewonly=True
     )
     face = db.relationship(
         "Face", backref=db.backref("officer", cascade_backrefs=False)
@@ -277,24 +322,72 @@ class Officer(BaseModel, TrackUpdates):
 
     __table_args__ = (
         CheckConstraint("gender in ('M', 'F', 'Other')", name="gender_options"),
+        # GIN trigram indexes let PostgreSQL serve `ILIKE '%...%'` and similarity
+        # searches on these columns without a sequential scan.
+        db.Index(
+            "ix_officers_last_name_trgm",
+            "last_name",
+            postgresql_using="gin",
+            postgresql_ops={"last_name": "gin_trgm_ops"},
+        ),
+        db.Index(
+            "ix_officers_first_name_trgm",
+            "first_name",
+            postgresql_using="gin",
+            postgresql_ops={"first_name": "gin_trgm_ops"},
+        ),
+        db.Index(
+            "ix_officers_unique_internal_identifier_trgm",
+            "unique_internal_identifier",
+            postgresql_using="gin",
+            postgresql_ops={"unique_internal_identifier": "gin_trgm_ops"},
+        ),
+        # Matches the department roster's sort key so it can be paged through by
+        # seeking instead of with OFFSET
+        db.Index(
+            "ix_officers_roster_order",
+            "department_id",
+            func.coalesce(last_name, ""),
+            func.coalesce(first_name, ""),
+            "id",
+        ),
+        # The department change feed seeks through the table in this order
+        db.Index(
+            "ix_officers_department_id_last_updated_at",
+            "department_id",
+            "last_updated_at",
+            "id",
+        ),
     )
 
-    def full_name(self):
-        if self.middle_initial:
+    @staticmethod
+    def format_full_name(first_name, middle_initial, last_name, suffix) -> str:
+        """Format the full name of an officer from the columns that make it up."""
+        if middle_initial:
             middle_initial = (
-                self.middle_initial + "."
-                if len(self.middle_initial) == 1
-                else self.middle_initial
+                middle_initial + "." if len(middle_initial) == 1 else middle_initial
             )
-            if self.suffix:
-                return (
-                    f"{self.first_name} {middle_initial} {self.last_name} {self.suffix}"
-                )
+            if suffix:
+                return f"{first_name} {middle_initial} {last_name} {suffix}"
             else:
-                return f"{self.first_name} {middle_initial} {self.last_name}"
-        if self.suffix:
-            return f"{self.first_name} {self.last_name} {self.suffix}"
-        return f"{self.first_name} {self.last_name}"
+                return f"{first_name} {middle_initial} {last_name}"
+        if suffix:
+            return f"{first_name} {last_name} {suffix}"
+        return f"{first_name} {last_name}"
+
+    @staticmethod
+    def format_repr(officer_id, full_name, unique_internal_identifier) -> str:
+        if unique_internal_identifier:
+            return (
+                f"<Officer ID {officer_id}: {full_name} "
+                f"({unique_internal_identifier})>"
+            )
+        return f"<Officer ID {officer_id}: {full_name}>"
+
+    def full_name(self):
+        return self.format_full_name(
+            self.first_name, self.middle_initial, self.last_name, self.suffix
+        )
 
     def race_label(self):
         if self.race is None:
@@ -313,39 +406,27 @@ class Officer(BaseModel, TrackUpdates):
                 return label
 
     def job_title(self):
-        if self.assignments:
-            return max(
-                self.assignments, key=operator.attrgetter("start_date_or_min")
-            ).job.job_title
+        if self.current_assignment:
+            return self.current_assignment.job.job_title
 
     def unit_description(self):
-        if self.assignments:
-            unit = max(
-                self.assignments, key=operator.attrgetter("start_date_or_min")
-            ).unit
+        if self.current_assignment:
+            unit = self.current_assignment.unit
             return unit.description if unit else None
 
     def badge_number(self):
-        if self.assignments:
-            return max(
-                self.assignments, key=operator.attrgetter("start_date_or_min")
-            ).star_no
+        if self.current_assignment:
+            return self.current_assignment.star_no
 
     def currently_on_force(self):
-        if self.assignments:
-            most_recent = max(
-                self.assignments, key=operator.attrgetter("start_date_or_min")
-            )
-            return "Yes" if most_recent.resign_date is None else "No"
+        if self.current_assignment:
+            return "Yes" if self.current_assignment.resign_date is None else "No"
         return "Uncertain"
 
     def __repr__(self):
-        if self.unique_internal_identifier:
-            return (
-                f"<Officer ID {self.id}: {self.full_name()} "
-                f"({self.unique_internal_identifier})>"
-            )
-        return f"<Officer ID {self.id}: {self.full_name()}>"
+        return self.format_repr(
+            self.id, self.full_name(), self.unique_internal_identifier
+        )
 
 
 class Salary(BaseModel, TrackUpdates):
@@ -364,6 +445,11 @@ class Salary(BaseModel, TrackUpdates):
     year = db.Column(db.Integer, index=True, unique=False, nullable=False)
     is_fiscal_year = db.Column(db.Boolean, index=False, unique=False, nullable=False)
 
+    __table_args__ = (
+        # The change feed seeks through the table in this order
+        db.Index("ix_salaries_last_updated_at", "last_updated_at", "id"),
+    )
+
     def __repr__(self):
         return f"<Salary: ID {self.officer_id} : {self.salary}"
 
@@ -378,6 +464,18 @@ class Salary(BaseModel, TrackUpdates):
         return str(self.year)
 
 
+def normalize_star_no(star_no) -> Optional[str]:
+    """Return a badge number without whitespace or leading zeros and in upper case,
+    so that e.g. "00 12a" and "12A" compare equal.
+    """
+    if star_no is None:
+        return None
+    compact = "".join(str(star_no).split()).upper()
+    if not compact:
+        return None
+    return compact.lstrip("0") or "0"
+
+
 class Assignment(BaseModel, TrackUpdates):
     __tablename__ = "assignments"
 
@@ -387,9 +485,14 @@ class Assignment(BaseModel, TrackUpdates):
         db.ForeignKey(
             "officers.id", name="assignments_officer_id_fkey", ondelete="CASCADE"
         ),
+        index=True,
+    )
+    base_officer = db.relationship(
+        "Officer", back_populates="assignments", foreign_keys=[officer_id]
     )
-    base_officer = db.relationship("Officer", back_populates="assignments")
     star_no = db.Column(db.String(120), index=True, unique=False, nullable=True)
+    # Kept in sync with star_no by validate_star_no, used for badge searches
+    star_no_normalized = db.Column(db.String(120), unique=False, nullable=True)
     job_id = db.Column(
         db.Integer,
         db.ForeignKey("jobs.id", name="assignments_job_id_fkey"),
@@ -405,9 +508,25 @@ class Assignment(BaseModel, TrackUpdates):
     start_date = db.Column(db.Date, index=True, unique=False, nullable=True)
     resign_date = db.Column(db.Date, index=True, unique=False, nullable=True)
 
+    __table_args__ = (
+        # The pattern ops let PostgreSQL use the index for prefix LIKE searches
+        db.Index(
+            "ix_assignments_star_no_normalized",
+            "star_no_normalized",
+            postgresql_ops={"star_no_normalized": "varchar_pattern_ops"},
+        ),
+        # The change feed seeks through the table in this order
+        db.Index("ix_assignments_last_updated_at", "last_updated_at", "id"),
+    )
+
     def __repr__(self):
         return f"<Assignment: ID {self.officer_id} : {self.star_no}>"
 
+    @validates("star_no")
+    def validate_star_no(self, key, star_no):
+        self.star_no_normalized = normalize_star_no(star_no)
+        return star_no
+
     @property
     def start_date_or_min(self):
         return self.start_date or date.min
@@ -417,6 +536,58 @@ class Assignment(BaseModel, TrackUpdates):
         return self.start_date or date.max
 
 
+def update_current_assignments(connection, officer_ids) -> None:
+    """Point each of the given officers at their most recent assignment.
+
+    The most recent assignment is the one with the latest start date, assignments
+    without a start date count as the oldest and ties go to the lowest id.
+    """
+    most_recent_assignment = (
+        select(Assignment.id)
+        .where(Assignment.officer_id == Officer.id)
+        .order_by(
+            Assignment.start_date.is_(None),
+            Assignment.start_date.desc(),
+            Assignment.id,
+        )
+        .limit(1)
+        .scalar_subquery()
+    )
+    connection.execute(
+        update(Officer.__table__)
+        .where(Officer.id.in_(officer_ids))
+        .values(
+            current_assignment_id=most_recent_assignment,
+            # This is bookkeeping, not an edit of the officer
+            last_updated_at=Officer.last_updated_at,
+        )
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _update_flushed_current_assignments(session, flush_context):
+    officer_ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Assignment):
+            officer_ids.add(obj.officer_id)
+            # An assignment moved to another officer changes both officers
+            officer_ids.update(inspect(obj).attrs.officer_id.history.deleted)
+    officer_ids.discard(None)
+    if officer_ids:
+        update_current_assignments(session.connection(), officer_ids)
+        session.info.setdefault(KEY_CURRENT_ASSIGNMENT_OFFICERS, set()).update(
+            officer_ids
+        )
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _expire_stale_current_assignments(session, flush_context):
+    for officer_id in session.info.pop(KEY_CURRENT_ASSIGNMENT_OFFICERS, ()):
+        officer = session.identity_map.get(identity_key(Officer, officer_id))
+        if officer is not None:
+            session.expire(officer, ["current_assignment_id", "current_assignment"])
+
+
 class Unit(BaseModel, TrackUpdates):
     __tablename__ = "unit_types"
 
@@ -436,6 +607,37 @@ class Unit(BaseModel, TrackUpdates):
         return f"Unit: {self.description}"
 
 
+# Cached choice lists that have to be dropped when a model of the given type changes
+DEPARTMENT_CHOICES_CACHE_KEYS = {Job: KEY_DEPT_ALL_JOBS, Unit: KEY_DEPT_ALL_UNITS}
+
+
+@event.listens_for(Session, "after_flush")
+def _track_changed_department_choices(session, flush_context):
+    changed = session.info.setdefault(KEY_CHANGED_DEPARTMENT_CHOICES, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        update_type = DEPARTMENT_CHOICES_CACHE_KEYS.get(type(obj))
+        if update_type is None:
+            continue
+        # A job or unit moved to another department changes both departments
+        history = inspect(obj).attrs.department_id.history
+        for department_id in (obj.department_id, *history.deleted):
+            if department_id is not None:
+                changed.add((department_id, update_type))
+
+
+@event.listens_for(Session, "after_commit")
+def _remove_changed_department_choices(session):
+    for department_id, update_type in session.info.pop(
+        KEY_CHANGED_DEPARTMENT_CHOICES, ()
+    ):
+        remove_database_cache_entries(Department(id=department_id), [update_type])
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_department_choices(session):
+    session.info.pop(KEY_CHANGED_DEPARTMENT_CHOICES, None)
+
+
 class Face(BaseModel, TrackUpdates):
     __tablename__ = "faces"
 
@@ -601,33 +803,35 @@ class Location(BaseModel, TrackUpdates):
     @validates("zip_code")
     def validate_zip_code(self, key, zip_code):
         if zip_code:
-            zip_re = r"^\d{5}$"
-            if not re.match(zip_re, zip_code):
-                raise ValueError("Not a valid zip code")
-            return zip_code
+            return zip_code_validator(zip_code)
 
     @validates("state")
     def validate_state(self, key, state):
         return state_validator(state)
 
-    def __repr__(self):
-        if self.street_name and self.cross_street1 and self.cross_street2:
-            return (
-                f"Intersection of {self.street_name} between {self.cross_street1} "
-                f"and {self.cross_street2}, {self.city} {self.state}"
-            )
-        elif self.street_name and self.cross_street2:
-            return (
-                f"Intersection of {self.street_name} and {self.cross_street2}, "
-                + f"{self.city} {self.state}"
-            )
-        elif self.street_name and self.cross_street1:
+    @staticmethod
+    def format_address(street_name, cross_street1, cross_street2, city, state) -> str:
+        """Format a location from the columns that make it up."""
+        if street_name and cross_street1 and cross_street2:
             return (
-                f"Intersection of {self.street_name} and {self.cross_street1}, "
-                + f"{self.city} {self.state}"
+                f"Intersection of {street_name} between {cross_street1} "
+                f"and {cross_street2}, {city} {state}"
             )
+        elif street_name and cross_street2:
+            return f"Intersection of {street_name} and {cross_street2}, {city} {state}"
+        elif street_name and cross_street1:
+            return f"Intersection of {street_name} and {cross_street1}, {city} {state}"
         else:
-            return f"{self.city} {self.state}"
+            return f"{city} {state}"
+
+    def __repr__(self):
+        return self.format_address(
+            self.street_name,
+            self.cross_street1,
+            self.cross_street2,
+            self.city,
+            self.state,
+        )
 
 
 class LicensePlate(BaseModel, TrackUpdates):
@@ -656,6 +860,11 @@ class Link(BaseModel, TrackUpdates):
     author = db.Column(db.String(255), nullable=True)
     has_content_warning = db.Column(db.Boolean, nullable=False, default=False)
 
+    __table_args__ = (
+        # The change feed seeks through the table in this order
+        db.Index("ix_links_last_updated_at", "last_updated_at", "id"),
+    )
+
     @validates("url")
     def validate_url(self, key, url):
         return url_validator(url)
@@ -678,19 +887,16 @@ class Incident(BaseModel, TrackUpdates):
     license_plates = db.relationship(
         "LicensePlate",
         secondary=incident_license_plates,
-        lazy="subquery",
         backref=db.backref("incidents", cascade_backrefs=False, lazy=True),
     )
     links = db.relationship(
         "Link",
         secondary=incident_links,
-        lazy="subquery",
         backref=db.backref("incidents", cascade_backrefs=False, lazy=True),
     )
     officers = db.relationship(
         "Officer",
         secondary=officer_incidents,
-        lazy="subquery",
         backref=db.backref(
             "incidents",
             cascade_backrefs=False,
@@ -704,6 +910,485 @@ class Incident(BaseModel, TrackUpdates):
         "Department", backref=db.backref("incidents", cascade_backrefs=False), lazy=True
     )
 
+    __table_args__ = (
+        # The department change feed seeks through the table in this order
+        db.Index(
+            "ix_incidents_department_id_last_updated_at",
+            "department_id",
+            "last_updated_at",
+            "id",
+        ),
+    )
+
+
+class DepartmentStats(BaseModel):
+    """Officer, assignment and incident totals of a department, and the generation of
+    its data.
+
+    The totals are moved by the changes of every flush to the officers, assignments
+    and incidents of a department, and recounted by `refresh_department_stats` after
+    bulk statements. The generation is increased by `bump_department_generations`
+    whenever a transaction changes any of the data in the department's CSV exports,
+    which are versioned by it.
+    """
+
+    __tablename__ = "department_stats"
+
+    department_id = db.Column(
+        db.Integer,
+        db.ForeignKey(
+            "departments.id",
+            name="department_stats_department_id_fkey",
+            ondelete="CASCADE",
+        ),
+        primary_key=True,
+    )
+    officers = db.Column(db.Integer, nullable=False, default=0)
+    assignments = db.Column(db.Integer, nullable=False, default=0)
+    incidents = db.Column(db.Integer, nullable=False, default=0)
+    generation = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self):
+        return f"<DepartmentStats Department ID {self.department_id}>"
+
+
+# The totals that DepartmentStats keeps
+DEPARTMENT_STATS_COLUMNS = ("officers", "assignments", "incidents")
+
+
+def department_stats_query(department_ids=None):
+    """Count the officers, assignments and incidents of the given departments, or of
+    all departments, grouped by department.
+    """
+
+    def grouped_count(query, department_id):
+        if department_ids is not None:
+            query = query.where(department_id.in_(department_ids))
+        return query.group_by(department_id).subquery()
+
+    officers = grouped_count(
+        select(Officer.department_id, func.count().label("total")),
+        Officer.department_id,
+    )
+    assignments = grouped_count(
+        select(Officer.department_id, func.count().label("total")).join(
+            Assignment, Assignment.officer_id == Officer.id
+        ),
+        Officer.department_id,
+    )
+    incidents = grouped_count(
+        select(Incident.department_id, func.count().label("total")),
+        Incident.department_id,
+    )
+    query = (
+        select(
+            Department.id.label("department_id"),
+            func.coalesce(officers.c.total, 0).label("officers"),
+            func.coalesce(assignments.c.total, 0).label("assignments"),
+            func.coalesce(incidents.c.total, 0).label("incidents"),
+        )
+        .outerjoin(officers, officers.c.department_id == Department.id)
+        .outerjoin(assignments, assignments.c.department_id == Department.id)
+        .outerjoin(incidents, incidents.c.department_id == Department.id)
+    )
+    if department_ids is not None:
+        query = query.where(Department.id.in_(department_ids))
+    return query
+
+
+def upsert(connection, table):
+    """Return an INSERT into the table that supports ON CONFLICT clauses on the
+    dialect of the connection.
+    """
+    dialect_insert = (
+        postgresql.insert if connection.dialect.name == "postgresql" else sqlite.insert
+    )
+    return dialect_insert(table)
+
+
+def _lock_department_stats(connection, department_ids=None) -> None:
+    """Create the missing stats rows of the given departments, or of all departments,
+    and lock them until the end of the transaction.
+    """
+    # SQLite needs a WHERE clause to parse the ON CONFLICT clause of an INSERT SELECT
+    departments = select(Department.id).where(true())
+    stats = select(DepartmentStats.department_id)
+    if department_ids is not None:
+        departments = departments.where(Department.id.in_(department_ids))
+        stats = stats.where(DepartmentStats.department_id.in_(department_ids))
+    statement = upsert(connection, DepartmentStats.__table__)
+    connection.execute(
+        statement.from_select(
+            ["department_id"], departments.order_by(Department.id)
+        ).on_conflict_do_nothing(index_elements=[DepartmentStats.department_id])
+    )
+    connection.execute(
+        stats.order_by(DepartmentStats.department_id).with_for_update()
+    ).all()
+
+
+def refresh_department_stats(connection, department_ids=None) -> None:
+    """Recount the stats of the given departments, or of all departments.
+
+    The stats rows are locked first. Concurrent transactions that change the same
+    department then recount one after the other, and under READ COMMITTED the later
+    recount sees the rows of the transaction that committed first.
+    """
+    _lock_department_stats(connection, department_ids)
+    rows = [
+        row._asdict()
+        for row in connection.execute(department_stats_query(department_ids))
+    ]
+    if not rows:
+        return
+    statement = upsert(connection, DepartmentStats.__table__)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DepartmentStats.department_id],
+            set_={
+                column: statement.excluded[column]
+                for column in DEPARTMENT_STATS_COLUMNS
+            },
+        ),
+        rows,
+    )
+
+
+def _load_replaced_value(target, value, oldvalue, initiator):
+    """Do nothing, the listener is only there for its active_history."""
+
+
+# Load the value an attribute had when it is replaced, even once it has expired, so
+# the flush history says which department a row was moved away from
+for attribute in (Officer.department_id, Incident.department_id, Assignment.officer_id):
+    event.listen(attribute, "set", _load_replaced_value, active_history=True)
+
+
+def _flushed_values(obj, key: str, new, deleted) -> Tuple[Optional[int], Optional[int]]:
+    """Return the value of an attribute before and after a flush, which is None for
+    an object that did not exist before or does not exist after it.
+    """
+    history = inspect(obj).attrs[key].history
+    value = getattr(obj, key)
+    if obj in new:
+        before = None
+    elif history.has_changes():
+        before = history.deleted[0] if history.deleted else None
+    else:
+        before = value
+    return before, None if obj in deleted else value
+
+
+def _department_stats_deltas(session) -> Dict[int, Counter]:
+    """Return how much the changes of a flush move the stats of each department."""
+    new, deleted = session.new, session.deleted
+    deltas: DefaultDict[Optional[int], Counter] = defaultdict(Counter)
+    officer_departments: Dict[Optional[int], Tuple[Optional[int], Optional[int]]] = {
+        None: (None, None)
+    }
+    assignment_moves = []
+    for obj in chain(new, session.dirty, deleted):
+        if isinstance(obj, (Officer, Incident)):
+            before, after = _flushed_values(obj, "department_id", new, deleted)
+            if isinstance(obj, Officer):
+                officer_departments[obj.id] = (before, after)
+            if before != after:
+                column = "officers" if isinstance(obj, Officer) else "incidents"
+                deltas[before][column] -= 1
+                deltas[after][column] += 1
+        elif isinstance(obj, Assignment):
+            before, after = _flushed_values(obj, "officer_id", new, deleted)
+            if before != after:
+                assignment_moves.append((before, after))
+
+    connection = session.connection()
+    officer_ids = {officer_id for move in assignment_moves for officer_id in move}
+    officer_ids -= officer_departments.keys()
+    if officer_ids:
+        for officer_id, department_id in connection.execute(
+            select(Officer.id, Officer.department_id).where(Officer.id.in_(officer_ids))
+        ):
+            officer_departments[officer_id] = (department_id, department_id)
+    for before, after in assignment_moves:
+        deltas[officer_departments.get(before, (None, None))[0]]["assignments"] -= 1
+        deltas[officer_departments.get(after, (None, None))[1]]["assignments"] += 1
+
+    # The assignments that an officer moved to another department kept go with it
+    moved_officer_ids = [
+        officer_id
+        for officer_id, (before, after) in officer_departments.items()
+        if before != after and before is not None and after is not None
+    ]
+    if moved_officer_ids:
+        arrivals = Counter(after for _, after in assignment_moves)
+        for officer_id, total in connection.execute(
+            select(Assignment.officer_id, func.count())
+            .where(Assignment.officer_id.in_(moved_officer_ids))
+            .group_by(Assignment.officer_id)
+        ):
+            kept = total - arrivals[officer_id]
+            before, after = officer_departments[officer_id]
+            deltas[before]["assignments"] -= kept
+            deltas[after]["assignments"] += kept
+
+    return {
+        department_id: delta
+        for department_id, delta in deltas.items()
+        if department_id is not None and any(delta.values())
+    }
+
+
+@event.listens_for(Session, "after_flush")
+def _update_flushed_department_stats(session, flush_context):
+    deltas = _department_stats_deltas(session)
+    if not deltas:
+        return
+    connection = session.connection()
+    table = DepartmentStats.__table__
+    missing = []
+    # In a fixed order, so that transactions updating the same departments cannot
+    # deadlock
+    for department_id, delta in sorted(deltas.items()):
+        result = connection.execute(
+            update(table)
+            .where(table.c.department_id == department_id)
+            .values(
+                {
+                    column: table.c[column] + delta[column]
+                    for column in DEPARTMENT_STATS_COLUMNS
+                    if delta[column]
+                }
+            )
+        )
+        if result.rowcount == 0:
+            missing.append(department_id)
+    # Departments without stats yet are counted from scratch, which includes the flush
+    if missing:
+        refresh_department_stats(connection, missing)
+
+
+def bump_department_generations(connection, department_ids) -> None:
+    """Increase the data generation of the given departments."""
+    rows = [
+        {"department_id": department_id, "generation": 1}
+        for department_id in connection.scalars(
+            select(Department.id).where(Department.id.in_(department_ids))
+        )
+    ]
+    if not rows:
+        return
+    statement = upsert(connection, DepartmentStats.__table__)
+    connection.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DepartmentStats.department_id],
+            set_={"generation": DepartmentStats.__table__.c.generation + 1},
+        ),
+        rows,
+    )
+
+
+def _track_changed_department_exports(session, department_ids) -> None:
+    department_ids.discard(None)
+    if department_ids:
+        session.info.setdefault(KEY_CHANGED_DEPARTMENT_EXPORTS, set()).update(
+            department_ids
+        )
+
+
+@event.listens_for(Session, "before_flush")
+def _track_changed_department_export_associations(session, flush_context, instances):
+    # Links, locations and license plates belong to departments through association
+    # rows that their removal deletes, so look those up before the flush. New ones are
+    # only associated through officers and incidents, which the flush tracks.
+    link_ids, location_ids, license_plate_ids = set(), set(), set()
+    for obj in chain(session.dirty, session.deleted):
+        if isinstance(obj, Link):
+            link_ids.add(obj.id)
+        elif isinstance(obj, Location):
+            location_ids.add(obj.id)
+        elif isinstance(obj, LicensePlate):
+            license_plate_ids.add(obj.id)
+    queries = []
+    if link_ids:
+        queries += [
+            select(Officer.department_id)
+            .join(officer_links, officer_links.c.officer_id == Officer.id)
+            .where(officer_links.c.link_id.in_(link_ids)),
+            select(Incident.department_id)
+            .join(incident_links, incident_links.c.incident_id == Incident.id)
+            .where(incident_links.c.link_id.in_(link_ids)),
+        ]
+    if location_ids:
+        queries.append(
+            select(Incident.department_id).where(Incident.address_id.in_(location_ids))
+        )
+    if license_plate_ids:
+        queries.append(
+            select(Incident.department_id)
+            .join(
+                incident_license_plates,
+                incident_license_plates.c.incident_id == Incident.id,
+            )
+            .where(incident_license_plates.c.license_plate_id.in_(license_plate_ids))
+        )
+    department_ids = set()
+    for query in queries:
+        department_ids.update(session.connection().scalars(query))
+    _track_changed_department_exports(session, department_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _track_changed_department_export_rows(session, flush_context):
+    department_ids, officer_ids = set(), set()
+    deleted = session.deleted
+    for obj in chain(session.new, session.dirty, deleted):
+        if isinstance(obj, (Officer, Incident, Job, Unit)):
+            ids, key = department_ids, "department_id"
+        elif isinstance(obj, (Assignment, Salary, Description)):
+            ids, key = officer_ids, "officer_id"
+        else:
+            continue
+        if obj in deleted or session.is_modified(obj):
+            history = inspect(obj).attrs[key].history
+            ids.update((getattr(obj, key), *(history.deleted or ())))
+    officer_ids.discard(None)
+    if officer_ids:
+        department_ids.update(
+            session.connection().scalars(
+                select(Officer.department_id).where(Officer.id.in_(officer_ids))
+            )
+        )
+    _track_changed_department_exports(session, department_ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_changed_department_generations(session):
+    session.flush()
+    department_ids = session.info.pop(KEY_CHANGED_DEPARTMENT_EXPORTS, None)
+    if department_ids:
+        bump_department_generations(session.connection(), department_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_department_exports(session):
+    session.info.pop(KEY_CHANGED_DEPARTMENT_EXPORTS, None)
+
+
+# The models whose changes are listed by the change feed, by their table names
+CHANGE_FEED_MODELS = {
+    model.__tablename__: model
+    for model in (Officer, Assignment, Salary, Incident, Link, Description)
+}
+
+
+class Tombstone(BaseModel):
+    """A deleted row of a change feed model, kept so that the change feed can list the
+    deletion.
+
+    The department is the one the row belonged to, so that department feeds can list
+    it. A link deleted from several departments has a tombstone for each.
+    """
+
+    __tablename__ = "tombstones"
+
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    department_id = db.Column(
+        db.Integer,
+        db.ForeignKey(
+            "departments.id", name="tombstones_department_id_fkey", ondelete="CASCADE"
+        ),
+        nullable=True,
+    )
+    deleted_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        default=datetime.utcnow,
+        server_default=sql_func.now(),
+    )
+
+    __table_args__ = (
+        db.Index(
+            "ix_tombstones_department_id_table_name_deleted_at",
+            "department_id",
+            "table_name",
+            "deleted_at",
+            "id",
+        ),
+    )
+
+    def __repr__(self):
+        return f"<Tombstone {self.table_name} ID {self.record_id}>"
+
+
+def add_tombstones(connection, model, records) -> None:
+    """Record the deletion of rows of a change feed model, given as (record id,
+    department id) pairs. Bulk deletes, which skip the flush events, call this.
+    """
+    rows = [
+        {
+            "table_name": model.__tablename__,
+            "record_id": record_id,
+            "department_id": department_id,
+        }
+        for record_id, department_id in records
+    ]
+    if rows:
+        connection.execute(insert(Tombstone.__table__), rows)
+
+
+@event.listens_for(Session, "before_flush")
+def _add_flushed_tombstones(session, flush_context, instances):
+    deleted = [
+        obj
+        for obj in session.deleted
+        if isinstance(obj, tuple(CHANGE_FEED_MODELS.values()))
+    ]
+    if not deleted:
+        return
+    connection = session.connection()
+    with session.no_autoflush:
+        officer_ids = {
+            obj.officer_id
+            for obj in deleted
+            if isinstance(obj, (Assignment, Salary, Description))
+        }
+        link_ids = {obj.id for obj in deleted if isinstance(obj, Link)}
+
+    # Look the departments up before the flush deletes the rows that tie them
+    officer_departments = dict(
+        connection.execute(
+            select(Officer.id, Officer.department_id).where(Officer.id.in_(officer_ids))
+        ).all()
+        if officer_ids
+        else ()
+    )
+    link_departments = {}
+    if link_ids:
+        for link_id, department_id in connection.execute(
+            select(officer_links.c.link_id, Officer.department_id)
+            .join(Officer, Officer.id == officer_links.c.officer_id)
+            .where(officer_links.c.link_id.in_(link_ids))
+            .distinct()
+        ):
+            link_departments.setdefault(link_id, []).append(department_id)
+
+    records = {model: [] for model in CHANGE_FEED_MODELS.values()}
+    with session.no_autoflush:
+        for obj in deleted:
+            if isinstance(obj, (Officer, Incident)):
+                department_ids = [obj.department_id]
+            elif isinstance(obj, Link):
+                department_ids = link_departments.get(obj.id, [None])
+            else:
+                department_ids = [officer_departments.get(obj.officer_id)]
+            records[type(obj)] += [
+                (obj.id, department_id) for department_id in department_ids
+            ]
+    for model, model_records in records.items():
+        add_tombstones(connection, model, model_records)
+
 
 class User(UserMixin, BaseModel):
     __tablename__ = "users"
@@ -1,13 +1,429 @@
-from typing import Any, List
+import math
+import pickle
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, DefaultDict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
 
-from cachetools import TTLCache
+from cachetools import Cache, TTLCache
 from cachetools.keys import hashkey
+from flask import Flask
 from flask_sqlalchemy.model import Model
 
-from OpenOversight.app.utils.constants import HOUR
+from OpenOversight.app.utils.constants import (
+    HOUR,
+    KEY_DB_CACHE_MAX_BYTES,
+    KEY_DB_CACHE_URL,
+    KEY_DEPT_ALL_ASSIGNMENTS,
+    KEY_DEPT_ALL_INCIDENTS,
+    KEY_DEPT_ALL_LINKS,
+    KEY_DEPT_ALL_NOTES,
+    KEY_DEPT_ALL_OFFICERS,
+    KEY_DEPT_ALL_SALARIES,
+    MEGABYTE,
+)
 
 
-DB_CACHE = TTLCache(maxsize=1024, ttl=24 * HOUR)
+DB_CACHE_MAX_BYTES = 64 * MEGABYTE
+DB_CACHE_TTL = 24 * HOUR
+# Entries are charged their serialized size times the weight of their update type,
+# so that the large and rarely downloaded department exports count for more of the
+# budget than the choice lists that every roster page reads
+DB_CACHE_WEIGHTS = {
+    KEY_DEPT_ALL_ASSIGNMENTS: 2,
+    KEY_DEPT_ALL_INCIDENTS: 2,
+    KEY_DEPT_ALL_LINKS: 2,
+    KEY_DEPT_ALL_NOTES: 2,
+    KEY_DEPT_ALL_OFFICERS: 2,
+    KEY_DEPT_ALL_SALARIES: 2,
+}
+# Namespaces the entries of shared backends, which other applications may also use
+SHARED_CACHE_PREFIX = "openoversight:db_cache:"
+
+CACHE_EVICTIONS = "evictions"
+CACHE_HITS = "hits"
+CACHE_INVALIDATIONS = "invalidations"
+CACHE_MISSES = "misses"
+
+
+def key_update_type(key) -> Optional[str]:
+    """Return the update type of a cache key, if it has one."""
+    return key[1] if isinstance(key, tuple) and len(key) > 1 else None
+
+
+def weighted_size(key, payload: bytes) -> int:
+    """Return how many bytes of the cache budget an entry uses."""
+    update_type = key_update_type(key)
+    weight = 1 if update_type is None else DB_CACHE_WEIGHTS.get(update_type, 1)
+    return math.ceil(len(payload) * weight)
+
+
+class CacheEntry(NamedTuple):
+    payload: bytes
+    size: int
+
+
+class CacheKey(NamedTuple):
+    model_id: int
+    update_type: str
+    model: str
+
+
+class CacheStats:
+    """Counts of cache events by update type.
+
+    The counts are kept in memory, so each worker process counts only the requests
+    it served, since it started or since the counts were last reset.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def record(self, update_type: Optional[str], event: str) -> None:
+        self.counts[update_type][event] += 1
+
+    def reset(self) -> None:
+        self.counts: DefaultDict[Optional[str], Counter] = defaultdict(Counter)
+        self.since = datetime.now(timezone.utc)
+
+
+DB_CACHE_STATS = CacheStats()
+
+
+class CacheBackend(MutableMapping):
+    """Mapping that stores the entries of the database cache."""
+
+    @abstractmethod
+    def entry_sizes(self) -> Iterator[Tuple[CacheKey, int]]:
+        """Return the key and serialized size of every entry."""
+
+
+class LocalCache(TTLCache, CacheBackend):
+    """Cache local to the process, which is all a single worker needs.
+
+    Entries are pickled like in the shared backends, so that the cache holds no live
+    objects and knows their size, and the least recently used entries are evicted to
+    keep the total weighted size within the byte budget.
+    """
+
+    def __init__(self, max_bytes: int = DB_CACHE_MAX_BYTES, ttl: int = DB_CACHE_TTL):
+        super().__init__(maxsize=max_bytes, ttl=ttl, getsizeof=lambda entry: entry.size)
+        self._inserting = False
+
+    def __getitem__(self, key) -> Any:
+        return pickle.loads(super().__getitem__(key).payload)
+
+    def __setitem__(self, key, value: Any) -> None:
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        size = weighted_size(key, payload)
+        if size > self.maxsize:
+            # Too large to cache, but an older value must not be served either
+            self.pop(key, None)
+            return
+        # Entries popped while inserting make room for the new one, while those popped
+        # at other times are being cleared
+        self._inserting = True
+        try:
+            super().__setitem__(key, CacheEntry(payload, size))
+        finally:
+            self._inserting = False
+
+    def popitem(self):
+        key, entry = super().popitem()
+        if self._inserting:
+            DB_CACHE_STATS.record(key_update_type(key), CACHE_EVICTIONS)
+        return key, entry
+
+    def entry_sizes(self) -> Iterator[Tuple[CacheKey, int]]:
+        """Return the key and serialized size of every entry."""
+        for key in list(self):
+            # Read the entry without making it the most recently used
+            yield CacheKey(*key), len(Cache.__getitem__(self, key).payload)
+
+
+class SharedCache(CacheBackend, ABC):
+    """Base class for backends that keep a single copy of the cache for every worker.
+
+    Since all workers read the same entries, removing an entry in one worker removes
+    it for all of them. Entries are pickled and stored under their key joined into a
+    string, which is also what iterating over the cache returns.
+    """
+
+    def __init__(self, max_bytes: int = DB_CACHE_MAX_BYTES, ttl: int = DB_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    @staticmethod
+    def _name(key) -> str:
+        return ":".join(str(part) for part in key)
+
+    @staticmethod
+    def _key(name: str) -> CacheKey:
+        model_id, update_type, model = name.split(":")
+        return CacheKey(int(model_id), update_type, model)
+
+    @abstractmethod
+    def _load(self, name: str) -> Optional[bytes]:
+        """Return the payload stored under a name, or None if there is none."""
+
+    @abstractmethod
+    def _exists(self, name: str) -> bool:
+        """Return whether an entry is stored under a name, without reading it."""
+
+    @abstractmethod
+    def _store(self, name: str, payload: bytes, size: int) -> None:
+        """Store a payload under a name, replacing any entry stored there."""
+
+    @abstractmethod
+    def _discard(self, name: str) -> bool:
+        """Remove the entry stored under a name and return whether there was one."""
+
+    @abstractmethod
+    def _names(self) -> Iterator[str]:
+        """Return the names of all entries."""
+
+    @abstractmethod
+    def _sizes(self) -> Iterator[Tuple[str, int]]:
+        """Return the name and payload size of all entries."""
+
+    def entry_sizes(self) -> Iterator[Tuple[CacheKey, int]]:
+        """Return the key and serialized size of every entry."""
+        for name, size in self._sizes():
+            yield self._key(name), size
+
+    def __getitem__(self, key) -> Any:
+        payload = self._load(self._name(key))
+        if payload is None:
+            raise KeyError(key)
+        return pickle.loads(payload)
+
+    def __setitem__(self, key, value: Any) -> None:
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._store(self._name(key), payload, weighted_size(key, payload))
+
+    def __delitem__(self, key) -> None:
+        if not self._discard(self._name(key)):
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self._exists(self._name(key))
+
+    def __iter__(self) -> Iterator[str]:
+        return self._names()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._names())
+
+
+class RedisCache(SharedCache):
+    """Cache stored in a Redis, or Redis-protocol compatible, server.
+
+    The server evicts entries according to its own `maxmemory` settings, so the byte
+    budget is not applied here and its evictions are not counted.
+    """
+
+    def __init__(
+        self,
+        url: str = "",
+        max_bytes: int = DB_CACHE_MAX_BYTES,
+        ttl: int = DB_CACHE_TTL,
+        client=None,
+    ):
+        super().__init__(max_bytes, ttl)
+        if client is None:
+            # Only deployments that use this backend need the redis package
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def _load(self, name: str) -> Optional[bytes]:
+        return self.client.get(SHARED_CACHE_PREFIX + name)
+
+    def _exists(self, name: str) -> bool:
+        return self.client.exists(SHARED_CACHE_PREFIX + name) > 0
+
+    def _store(self, name: str, payload: bytes, size: int) -> None:
+        self.client.set(SHARED_CACHE_PREFIX + name, payload, ex=self.ttl)
+
+    def _discard(self, name: str) -> bool:
+        return self.client.delete(SHARED_CACHE_PREFIX + name) > 0
+
+    def _names(self) -> Iterator[str]:
+        for key in self.client.scan_iter(match=f"{SHARED_CACHE_PREFIX}*"):
+            yield key.decode()[len(SHARED_CACHE_PREFIX) :]
+
+    def _sizes(self) -> Iterator[Tuple[str, int]]:
+        for name in self._names():
+            size = self.client.strlen(SHARED_CACHE_PREFIX + name)
+            # Entries may expire between listing and measuring them
+            if size:
+                yield name, size
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=f"{SHARED_CACHE_PREFIX}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+class SQLiteCache(SharedCache):
+    """Cache stored in a SQLite file that all workers on the host open."""
+
+    def __init__(
+        self, path: str, max_bytes: int = DB_CACHE_MAX_BYTES, ttl: int = DB_CACHE_TTL
+    ):
+        super().__init__(max_bytes, ttl)
+        self.path = path
+        with self._connect() as connection:
+            # Let workers read while another one writes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS db_cache (name TEXT PRIMARY KEY, "
+                "payload BLOB NOT NULL, size INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_db_cache_expires_at "
+                "ON db_cache (expires_at)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per operation is safe to use across forked workers and threads
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _load(self, name: str) -> Optional[bytes]:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT payload FROM db_cache WHERE name = ? AND expires_at > ?",
+                (name, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _exists(self, name: str) -> bool:
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM db_cache WHERE name = ? AND expires_at > ?",
+                (name, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def _store(self, name: str, payload: bytes, size: int) -> None:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("DELETE FROM db_cache WHERE expires_at <= ?", (now,))
+            connection.execute(
+                "INSERT OR REPLACE INTO db_cache (name, payload, size, expires_at) "
+                "VALUES (?, ?, ?, ?)",
+                (name, payload, size, now + self.ttl),
+            )
+            # Keep the most recently stored entries that fit in the budget
+            evicted = connection.execute(
+                "SELECT name FROM (SELECT name, SUM(size) OVER ("
+                "ORDER BY expires_at DESC, name) AS total FROM db_cache) "
+                "WHERE total > ?",
+                (self.max_bytes,),
+            ).fetchall()
+            connection.executemany("DELETE FROM db_cache WHERE name = ?", evicted)
+        for (evicted_name,) in evicted:
+            DB_CACHE_STATS.record(self._key(evicted_name).update_type, CACHE_EVICTIONS)
+
+    def _discard(self, name: str) -> bool:
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "DELETE FROM db_cache WHERE name = ? AND expires_at > ?",
+                (name, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def _names(self) -> Iterator[str]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT name FROM db_cache WHERE expires_at > ?", (time.time(),)
+            ).fetchall()
+        return (name for (name,) in rows)
+
+    def _sizes(self) -> Iterator[Tuple[str, int]]:
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT name, length(payload) FROM db_cache WHERE expires_at > ?",
+                (time.time(),),
+            ).fetchall()
+        return iter(rows)
+
+    def clear(self) -> None:
+        with self._connect() as connection:
+            connection.execute("DELETE FROM db_cache")
+
+
+def create_database_cache_backend(
+    url: Optional[str], max_bytes: int = DB_CACHE_MAX_BYTES
+) -> CacheBackend:
+    """Create the cache backend described by a DB_CACHE_URL.
+
+    An empty URL gives a cache local to the process, `redis://host:port/db` (or
+    `rediss://` and `unix://`) a Redis cache and `sqlite:///path/to/file` a SQLite
+    cache. Use a shared backend when running several workers, so that they do not
+    serve entries that another worker has removed.
+    """
+    if not url:
+        return LocalCache(max_bytes)
+    scheme = urlsplit(url).scheme
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisCache(url, max_bytes)
+    if scheme == "sqlite":
+        return SQLiteCache(url[len("sqlite:///") :], max_bytes)
+    raise ValueError(f"Unsupported {KEY_DB_CACHE_URL}: {url}")
+
+
+class DatabaseCache(MutableMapping):
+    """Cache of data computed from the database, stored in a swappable backend."""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+
+    def __getitem__(self, key) -> Any:
+        return self.backend[key]
+
+    def __setitem__(self, key, value: Any) -> None:
+        self.backend[key] = value
+
+    def __delitem__(self, key) -> None:
+        del self.backend[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.backend
+
+    def __iter__(self) -> Iterator:
+        return iter(self.backend)
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def entry_sizes(self) -> Iterator[Tuple[CacheKey, int]]:
+        return self.backend.entry_sizes()
+
+
+DB_CACHE = DatabaseCache(create_database_cache_backend(None))
+
+
+def init_database_cache(app: Flask) -> None:
+    """Store DB_CACHE in the backend the app is configured to use."""
+    DB_CACHE.backend = create_database_cache_backend(
+        app.config[KEY_DB_CACHE_URL], app.config[KEY_DB_CACHE_MAX_BYTES]
+    )
 
 
 def get_model_cache_key(model: Model, update_type: str):
@@ -35,17 +451,14 @@ def model_cache_key(update_type: str):
 
 def get_database_cache_entry(model: Model, update_type: str) -> Any:
     """Get db.Model entry for key in the cache."""
-    key = get_model_cache_key(model, update_type)
-    if key in DB_CACHE.keys():
-        return DB_CACHE.get(key)
-    else:
-        return None
+    data = DB_CACHE.get(get_model_cache_key(model, update_type))
+    DB_CACHE_STATS.record(update_type, CACHE_MISSES if data is None else CACHE_HITS)
+    return data
 
 
 def has_database_cache_entry(model: Model, update_type: str) -> bool:
     """db.Model key exists in cache."""
-    key = get_model_cache_key(model, update_type)
-    return key in DB_CACHE.keys()
+    return get_model_cache_key(model, update_type) in DB_CACHE
 
 
 def put_database_cache_entry(model: Model, update_type: str, data: Any) -> None:
@@ -57,6 +470,49 @@ def put_database_cache_entry(model: Model, update_type: str, data: Any) -> None:
 def remove_database_cache_entries(model: Model, update_types: List[str]) -> None:
     """Remove db.Model key from cache if it exists."""
     for update_type in update_types:
-        key = get_model_cache_key(model, update_type)
-        if key in DB_CACHE.keys():
-            del DB_CACHE[key]
+        try:
+            del DB_CACHE[get_model_cache_key(model, update_type)]
+        except KeyError:
+            continue
+        DB_CACHE_STATS.record(update_type, CACHE_INVALIDATIONS)
+
+
+class CacheUsage(NamedTuple):
+    entries: Counter
+    bytes: Counter
+
+
+def database_cache_usage() -> Tuple[CacheUsage, CacheUsage]:
+    """Return the number of entries in the cache and their serialized size, by update
+    type and by department id.
+    """
+    by_type = CacheUsage(Counter(), Counter())
+    by_department = CacheUsage(Counter(), Counter())
+    for key, size in DB_CACHE.entry_sizes():
+        by_type.entries[key.update_type] += 1
+        by_type.bytes[key.update_type] += size
+        if key.model == "Department":
+            by_department.entries[key.model_id] += 1
+            by_department.bytes[key.model_id] += size
+    return by_type, by_department
+
+
+def purge_database_cache(department_id: Optional[int] = None) -> int:
+    """Remove the entries of a department, or every entry when no department is
+    given, from the cache and return how many were removed.
+    """
+    keys = [
+        key
+        for key, _ in DB_CACHE.entry_sizes()
+        if department_id is None
+        or (key.model == "Department" and key.model_id == department_id)
+    ]
+    purged = 0
+    for key in keys:
+        try:
+            del DB_CACHE[hashkey(*key)]
+        except KeyError:
+            continue
+        DB_CACHE_STATS.record(key.update_type, CACHE_INVALIDATIONS)
+        purged += 1
+    return purged
@@ -7,11 +7,13 @@ from OpenOversight.app import login_manager
 from OpenOversight.app.models.database import (
     Assignment,
     Incident,
+    Job,
     LicensePlate,
     Link,
     Location,
     Officer,
     Salary,
+    Unit,
     User,
     db,
 )
@@ -22,7 +24,11 @@ from OpenOversight.app.utils.choices import (
     SUFFIX_CHOICES,
 )
 from OpenOversight.app.utils.general import get_or_create, str_is_true
-from OpenOversight.app.validators import state_validator, url_validator
+from OpenOversight.app.validators import (
+    state_validator,
+    url_validator,
+    zip_code_validator,
+)
 
 
 def validate_choice(
@@ -36,13 +42,17 @@ def validate_choice(
     return None
 
 
-def parse_date(date_str: Optional[str]) -> Optional[date]:
+def parse_date(date_str: Optional[Union[str, date]]) -> Optional[date]:
+    if isinstance(date_str, date):
+        return date_str
     if date_str:
         return dateutil.parser.parse(date_str).date()
     return None
 
 
-def parse_time(time_str: Optional[str]) -> Optional[time]:
+def parse_time(time_str: Optional[Union[str, time]]) -> Optional[time]:
+    if isinstance(time_str, time):
+        return time_str
     if time_str:
         return dateutil.parser.parse(time_str).time()
     return None
@@ -60,7 +70,9 @@ def parse_float(value: Optional[Union[str, float]]) -> Optional[float]:
     return None
 
 
-def parse_bool(value: Optional[str]) -> bool:
+def parse_bool(value: Optional[Union[str, bool]]) -> bool:
+    if isinstance(value, bool):
+        return value
     if value:
         return str_is_true(value)
     return False
@@ -72,24 +84,128 @@ def parse_str(value: Optional[str], default: Optional[str] = "") -> Optional[str
     return value.strip() or default
 
 
-def create_officer_from_dict(data: Dict[str, Any], force_id: bool = False) -> Officer:
-    admin_user = User.query.filter_by(is_administrator=True).first()
-
-    officer = Officer(
-        department_id=int(data["department_id"]),
-        last_name=parse_str(data.get("last_name", "")),
-        first_name=parse_str(data.get("first_name", "")),
-        middle_initial=parse_str(data.get("middle_initial", "")),
-        suffix=validate_choice(data.get("suffix", ""), SUFFIX_CHOICES),
-        race=validate_choice(data.get("race"), RACE_CHOICES),
-        gender=validate_choice(data.get("gender"), GENDER_CHOICES),
-        employment_date=parse_date(data.get("employment_date")),
-        birth_year=parse_int(data.get("birth_year")),
-        unique_internal_identifier=parse_str(
+class ImportContext:
+    """What the rows of an import share: the user that creates and updates their
+    records, and the locations, license plates, jobs and units that they got or
+    created so far, by their natural keys.
+    """
+
+    def __init__(self) -> None:
+        self._user_id: Optional[int] = None
+        self.locations: Dict[Tuple, Location] = {}
+        self.license_plates: Dict[Tuple, LicensePlate] = {}
+        self.jobs: Dict[int, Dict[str, int]] = {}
+        self.units: Dict[int, Dict[str, int]] = {}
+
+    @property
+    def user_id(self) -> int:
+        if self._user_id is None:
+            self._user_id = User.query.filter_by(is_administrator=True).first().id
+        return self._user_id
+
+    def get_or_create_location(self, data: Dict[str, Any]) -> Optional[Location]:
+        values = location_values_from_dict(data)
+        if values is None:
+            return None
+        key = tuple(values.values())
+        if key not in self.locations:
+            self.locations[key], _ = get_or_create(db.session, Location, **values)
+        return self.locations[key]
+
+    def get_or_create_license_plate(self, data: Dict[str, Any]) -> LicensePlate:
+        values = license_plate_values_from_dict(data)
+        key = tuple(values.values())
+        if key not in self.license_plates:
+            self.license_plates[key], _ = get_or_create(
+                db.session, LicensePlate, **values
+            )
+        return self.license_plates[key]
+
+    def release(self) -> None:
+        """Forget the locations and license plates after the session was emptied.
+        The jobs and units are kept, since only their ids are stored.
+        """
+        self.locations.clear()
+        self.license_plates.clear()
+
+    def _department_jobs(self, department_id: int) -> Dict[str, int]:
+        if department_id not in self.jobs:
+            self.jobs[department_id] = {
+                job.job_title.strip().lower(): job.id
+                for job in Job.query.filter_by(department_id=department_id)
+            }
+        return self.jobs[department_id]
+
+    def get_or_create_job_id(self, department_id: int, job_title: str) -> int:
+        jobs = self._department_jobs(department_id)
+        job_title = job_title.strip()
+        if job_title.lower() not in jobs:
+            num_existing_ranks = Job.query.filter_by(
+                department_id=department_id
+            ).count()
+            job = Job(
+                job_title=job_title,
+                is_sworn_officer=False,
+                department_id=department_id,
+                order=num_existing_ranks + 1 if num_existing_ranks > 0 else 0,
+            )
+            db.session.add(job)
+            db.session.flush()
+            jobs[job_title.lower()] = job.id
+        return jobs[job_title.lower()]
+
+    def department_unit_ids(self, department_id: int) -> Dict[str, int]:
+        """Return the ids of the units of a department by their descriptions."""
+        if department_id not in self.units:
+            self.units[department_id] = {
+                unit.description.strip().lower(): unit.id
+                for unit in Unit.query.filter_by(department_id=department_id)
+            }
+        return self.units[department_id]
+
+    def get_or_create_unit_id(self, department_id: int, unit_name: str) -> int:
+        units = self.department_unit_ids(department_id)
+        unit_name = unit_name.strip()
+        if unit_name.lower() not in units:
+            unit = Unit(description=unit_name, department_id=department_id)
+            db.session.add(unit)
+            db.session.flush()
+            units[unit_name.lower()] = unit.id
+        return units[unit_name.lower()]
+
+
+def _user_id(context: Optional[ImportContext]) -> int:
+    return (context or ImportContext()).user_id
+
+
+def officer_values_from_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "department_id": int(data["department_id"]),
+        "last_name": parse_str(data.get("last_name", "")),
+        "first_name": parse_str(data.get("first_name", "")),
+        "middle_initial": parse_str(data.get("middle_initial", "")),
+        "suffix": validate_choice(data.get("suffix", ""), SUFFIX_CHOICES),
+        "race": validate_choice(data.get("race"), RACE_CHOICES),
+        "gender": validate_choice(data.get("gender"), GENDER_CHOICES),
+        "employment_date": parse_date(data.get("employment_date")),
+        "birth_year": parse_int(data.get("birth_year")),
+        "unique_internal_identifier": parse_str(
             data.get("unique_internal_identifier"), None
         ),
-        created_by=admin_user.id,
-        last_updated_by=admin_user.id,
+    }
+
+
+def create_officer_from_dict(
+    data: Dict[str, Any],
+    force_id: bool = False,
+    context: Optional[ImportContext] = None,
+) -> Officer:
+    user_id = _user_id(context)
+
+    officer = Officer(
+        **officer_values_from_dict(data),
+        created_by=user_id,
+        last_updated_by=user_id,
     )
     if force_id and data.get("id"):
         officer.id = data["id"]
@@ -99,7 +215,9 @@ def create_officer_from_dict(data: Dict[str, Any], force_id: bool = False) -> Of
     return officer
 
 
-def update_officer_from_dict(data: Dict[str, Any], officer: Officer) -> Officer:
+def update_officer_from_dict(
+    data: Dict[str, Any], officer: Officer, context: Optional[ImportContext] = None
+) -> Officer:
     if "department_id" in data.keys():
         officer.department_id = int(data["department_id"])
     if "last_name" in data.keys():
@@ -122,25 +240,33 @@ def update_officer_from_dict(data: Dict[str, Any], officer: Officer) -> Officer:
         officer.unique_internal_identifier = parse_str(
             data.get("unique_internal_identifier"), None
         )
-    officer.last_updated_by = User.query.filter_by(is_administrator=True).first().id
+    officer.last_updated_by = _user_id(context)
     db.session.flush()
     return officer
 
 
+def assignment_values_from_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "officer_id": int(data["officer_id"]),
+        "star_no": parse_str(data.get("star_no"), None),
+        "job_id": int(data["job_id"]),
+        "unit_id": parse_int(data.get("unit_id")),
+        "start_date": parse_date(data.get("start_date")),
+        "resign_date": parse_date(data.get("resign_date")),
+    }
+
+
 def create_assignment_from_dict(
-    data: Dict[str, Any], force_id: bool = False
+    data: Dict[str, Any],
+    force_id: bool = False,
+    context: Optional[ImportContext] = None,
 ) -> Assignment:
-    admin_user = User.query.filter_by(is_administrator=True).first()
+    user_id = _user_id(context)
 
     assignment = Assignment(
-        officer_id=int(data["officer_id"]),
-        star_no=parse_str(data.get("star_no"), None),
-        job_id=int(data["job_id"]),
-        unit_id=parse_int(data.get("unit_id")),
-        start_date=parse_date(data.get("start_date")),
-        resign_date=parse_date(data.get("resign_date")),
-        created_by=admin_user.id,
-        last_updated_by=admin_user.id,
+        **assignment_values_from_dict(data),
+        created_by=user_id,
+        last_updated_by=user_id,
     )
     if force_id and data.get("id"):
         assignment.id = data["id"]
@@ -150,7 +276,9 @@ def create_assignment_from_dict(
 
 
 def update_assignment_from_dict(
-    data: Dict[str, Any], assignment: Assignment
+    data: Dict[str, Any],
+    assignment: Assignment,
+    context: Optional[ImportContext] = None,
 ) -> Assignment:
     if "officer_id" in data.keys():
         assignment.officer_id = int(data["officer_id"])
@@ -164,23 +292,33 @@ def update_assignment_from_dict(
         assignment.start_date = parse_date(data.get("start_date"))
     if "resign_date" in data.keys():
         assignment.resign_date = parse_date(data.get("resign_date"))
-    assignment.last_updated_by = User.query.filter_by(is_administrator=True).first().id
+    assignment.last_updated_by = _user_id(context)
     db.session.flush()
 
     return assignment
 
 
-def create_salary_from_dict(data: Dict[str, Any], force_id: bool = False) -> Salary:
-    admin_user = User.query.filter_by(is_administrator=True).first()
+def salary_values_from_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "officer_id": int(data["officer_id"]),
+        "salary": float(data["salary"]),
+        "overtime_pay": parse_float(data.get("overtime_pay")),
+        "year": int(data["year"]),
+        "is_fiscal_year": parse_bool(data.get("is_fiscal_year")),
+    }
+
+
+def create_salary_from_dict(
+    data: Dict[str, Any],
+    force_id: bool = False,
+    context: Optional[ImportContext] = None,
+) -> Salary:
+    user_id = _user_id(context)
 
     salary = Salary(
-        officer_id=int(data["officer_id"]),
-        salary=float(data["salary"]),
-        overtime_pay=parse_float(data.get("overtime_pay")),
-        year=int(data["year"]),
-        is_fiscal_year=parse_bool(data.get("is_fiscal_year")),
-        created_by=admin_user.id,
-        last_updated_by=admin_user.id,
+        **salary_values_from_dict(data),
+        created_by=user_id,
+        last_updated_by=user_id,
     )
     if force_id and data.get("id"):
         salary.id = data["id"]
@@ -189,34 +327,46 @@ def create_salary_from_dict(data: Dict[str, Any], force_id: bool = False) -> Sal
     return salary
 
 
-def update_salary_from_dict(data: Dict[str, Any], salary: Salary) -> Salary:
+def update_salary_from_dict(
+    data: Dict[str, Any], salary: Salary, context: Optional[ImportContext] = None
+) -> Salary:
     if "officer_id" in data.keys():
         salary.officer_id = int(data["officer_id"])
     if "salary" in data.keys():
-        salary.salary = int(data["salary"])
+        salary.salary = float(data["salary"])
     if "overtime_pay" in data.keys():
-        salary.overtime_pay = parse_int(data.get("overtime_pay"))
+        salary.overtime_pay = parse_float(data.get("overtime_pay"))
     if "year" in data.keys():
         salary.year = int(data["year"])
     if "is_fiscal_year" in data.keys():
         salary.is_fiscal_year = parse_bool(data.get("is_fiscal_year"))
-    salary.last_updated_by = User.query.filter_by(is_administrator=True).first().id
+    salary.last_updated_by = _user_id(context)
     db.session.flush()
 
     return salary
 
 
-def create_link_from_dict(data: Dict[str, Any], force_id: bool = False) -> Link:
-    admin_user = User.query.filter_by(is_administrator=True).first()
+def link_values_from_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "title": data.get("title", ""),
+        "url": url_validator(data["url"]),
+        "link_type": validate_choice(data.get("link_type"), LINK_CHOICES),
+        "description": parse_str(data.get("description"), None),
+        "author": parse_str(data.get("author"), None),
+    }
+
+
+def create_link_from_dict(
+    data: Dict[str, Any],
+    force_id: bool = False,
+    context: Optional[ImportContext] = None,
+) -> Link:
+    user_id = _user_id(context)
 
     link = Link(
-        title=data.get("title", ""),
-        url=url_validator(data["url"]),
-        link_type=validate_choice(data.get("link_type"), LINK_CHOICES),
-        description=parse_str(data.get("description"), None),
-        author=parse_str(data.get("author"), None),
-        created_by=parse_int(data.get("created_by", admin_user.id)),
-        last_updated_by=parse_int(data.get("created_by", admin_user.id)),
+        **link_values_from_dict(data),
+        created_by=parse_int(data.get("created_by", user_id)),
+        last_updated_by=parse_int(data.get("created_by", user_id)),
     )
 
     if force_id and data.get("id"):
@@ -230,7 +380,9 @@ def create_link_from_dict(data: Dict[str, Any], force_id: bool = False) -> Link:
     return link
 
 
-def update_link_from_dict(data: Dict[str, Any], link: Link) -> Link:
+def update_link_from_dict(
+    data: Dict[str, Any], link: Link, context: Optional[ImportContext] = None
+) -> Link:
     if "title" in data:
         link.title = data.get("title", "")
     if "url" in data:
@@ -245,64 +397,77 @@ def update_link_from_dict(data: Dict[str, Any], link: Link) -> Link:
         link.officers = data.get("officers") or []
     if "incidents" in data:
         link.incidents = data.get("incidents") or []
-    link.last_updated_by = User.query.filter_by(is_administrator=True).first().id
+    link.last_updated_by = _user_id(context)
     db.session.flush()
 
     return link
 
 
+def license_plate_values_from_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    state = parse_str(data.get("state"), None)
+    state_validator(state)
+    return {"number": data["number"], "state": state}
+
+
 def get_or_create_license_plate_from_dict(
     data: Dict[str, Any],
 ) -> Tuple[LicensePlate, bool]:
-    number = data["number"]
-    state = parse_str(data.get("state"), None)
-    state_validator(state)
     return get_or_create(
-        db.session,
-        LicensePlate,
-        number=number,
-        state=state,
+        db.session, LicensePlate, **license_plate_values_from_dict(data)
     )
 
 
+def location_values_from_dict(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the column values of the location in a csv row, or None if it has
+    none.
+    """
+    values = {
+        "street_name": parse_str(data.get("street_name"), None),
+        "cross_street1": parse_str(data.get("cross_street1"), None),
+        "cross_street2": parse_str(data.get("cross_street2"), None),
+        "city": parse_str(data.get("city"), None),
+        "state": state_validator(parse_str(data.get("state"), None)),
+        "zip_code": parse_str(data.get("zip_code"), None),
+    }
+    if not any(values.values()):
+        return None
+    if values["zip_code"]:
+        zip_code_validator(values["zip_code"])
+    return values
+
+
 def get_or_create_location_from_dict(
     data: Dict[str, Any],
 ) -> Tuple[Optional[Location], bool]:
-    street_name = parse_str(data.get("street_name"), None)
-    cross_street1 = parse_str(data.get("cross_street1"), None)
-    cross_street2 = parse_str(data.get("cross_street2"), None)
-    city = parse_str(data.get("city"), None)
-    state = parse_str(data.get("state"), None)
-    state_validator(state)
-    zip_code = parse_str(data.get("zip_code"), None)
-
-    if not any([street_name, cross_street1, cross_street2, city, state, zip_code]):
+    values = location_values_from_dict(data)
+    if values is None:
         return None, False
 
-    return get_or_create(
-        db.session,
-        Location,
-        street_name=street_name,
-        cross_street1=cross_street1,
-        cross_street2=cross_street2,
-        city=city,
-        state=state,
-        zip_code=zip_code,
-    )
+    return get_or_create(db.session, Location, **values)
 
 
-def create_incident_from_dict(data: Dict[str, Any], force_id: bool = False) -> Incident:
-    admin_user = User.query.filter_by(is_administrator=True).first()
+def incident_values_from_dict(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "date": parse_date(data.get("date")),
+        "time": parse_time(data.get("time")),
+        "report_number": parse_str(data.get("report_number"), None),
+        "description": parse_str(data.get("description"), None),
+        "address_id": data.get("address_id"),
+        "department_id": parse_int(data.get("department_id")),
+    }
+
+
+def create_incident_from_dict(
+    data: Dict[str, Any],
+    force_id: bool = False,
+    context: Optional[ImportContext] = None,
+) -> Incident:
+    user_id = _user_id(context)
 
     incident = Incident(
-        date=parse_date(data.get("date")),
-        time=parse_time(data.get("time")),
-        report_number=parse_str(data.get("report_number"), None),
-        description=parse_str(data.get("description"), None),
-        address_id=data.get("address_id"),
-        department_id=parse_int(data.get("department_id")),
-        created_by=parse_int(data.get("created_by", admin_user.id)),
-        last_updated_by=parse_int(data.get("last_updated_by", admin_user.id)),
+        **incident_values_from_dict(data),
+        created_by=parse_int(data.get("created_by", user_id)),
+        last_updated_by=parse_int(data.get("last_updated_by", user_id)),
     )
 
     incident.officers = data.get("officers", [])
@@ -316,7 +481,9 @@ def create_incident_from_dict(data: Dict[str, Any], force_id: bool = False) -> I
     return incident
 
 
-def update_incident_from_dict(data: Dict[str, Any], incident: Incident) -> Incident:
+def update_incident_from_dict(
+    data: Dict[str, Any], incident: Incident, context: Optional[ImportContext] = None
+) -> Incident:
     if "date" in data:
         incident.date = parse_date(data.get("date"))
     if "time" in data:
@@ -328,17 +495,9 @@ def update_incident_from_dict(data: Dict[str, Any], incident: Incident) -> Incid
     if "address_id" in data:
         incident.address_id = data.get("address_id")
     if "department_id" in data:
-        incident.department_id = parse_int(
-            data.get(
-                "department_id", User.query.filter_by(is_administrator=True).first().id
-            )
-        )
+        incident.department_id = parse_int(data["department_id"])
     if "last_updated_by" in data:
-        incident.last_updated_by = parse_int(
-            data.get(
-                "last_updated_by", User.query.filter_by(is_administrator=True).first()
-            ),
-        )
+        incident.last_updated_by = parse_int(data["last_updated_by"])
     if "officers" in data:
         incident.officers = data["officers"] or []
     if "license_plate_objects" in data:
@@ -6,4 +6,106 @@ $(document).ready(function () {
         "placeholder": "Select an option",
         "width": "100%"
     });
+
+    // Keep appending officers from the roster API while the end of the list is in view
+    var $officerList = $("#officer-list");
+    if (!$officerList.data("next-url") || !("IntersectionObserver" in window)) {
+        return;
+    }
+    var placeholder = "/static/images/placeholder.png";
+    var loadMargin = 400;
+    var loading = false;
+    var retryDelay = 1000;
+    var maxRetryDelay = 60000;
+    var $end = $("<div>", {"id": "officer-list-end"}).insertAfter($officerList);
+    var $error = $("<p>", {"class": "text-danger", "role": "alert"})
+        .text("Could not load more officers.")
+        .hide()
+        .insertAfter($end);
+
+    function renderDetail(term, description) {
+        return [$("<dt>").text(term), $("<dd>").text(description || "Unknown")];
+    }
+
+    function renderOfficer(officer) {
+        var $image = $("<img>", {
+            "class": "officer-face img-responsive thumbnail",
+            "src": officer.thumbnail || placeholder,
+            "alt": officer.name
+        });
+        var $heading = $("<h2>").append(
+            $("<a>", {"href": officer.url}).text(officer.name),
+            " ",
+            $("<small>").text(officer.badge || "")
+        );
+        var $details = $("<div>", {"class": "row"}).append(
+            $("<div>", {"class": "col-md-6 col-6"}).append($("<dl>").append(
+                renderDetail("Rank", officer.rank),
+                renderDetail("Unit", officer.unit),
+                renderDetail("Currently on the Force", officer.currently_on_force),
+                renderDetail("Known incidents", String(officer.incidents))
+            )),
+            $("<div>", {"class": "col-md-6 col-6"}).append($("<dl>").append(
+                renderDetail("Race", officer.race),
+                renderDetail("Gender", officer.gender),
+                renderDetail("Number of Photos", String(officer.photos))
+            ))
+        );
+        return $("<li>", {"class": "list-group-item"}).append(
+            $("<div>", {"class": "row"}).append(
+                $("<div>", {"class": "col-md-6 col-12"}).append(
+                    $("<a>", {"href": officer.url}).append($image)
+                ),
+                $("<div>", {"class": "col-md-6 col-12"}).append($heading, $details)
+            )
+        );
+    }
+
+    function endIsInView() {
+        return $end[0].getBoundingClientRect().top < window.innerHeight + loadMargin;
+    }
+
+    function loadNextPage() {
+        var nextUrl = $officerList.data("next-url");
+        if (loading || !nextUrl) {
+            return;
+        }
+        loading = true;
+        $.getJSON(nextUrl).done(function (data) {
+            $officerList.append(data.officers.map(renderOfficer));
+            $officerList.data("next-url", data.next);
+            $error.hide();
+            retryDelay = 1000;
+            loading = false;
+            if (!data.next) {
+                observer.disconnect();
+            } else if (endIsInView()) {
+                loadNextPage();
+            }
+        }).fail(function (jqXHR) {
+            $error.show();
+            if (jqXHR.status >= 400 && jqXHR.status < 500) {
+                // The same request would fail again, so fall back to the page links
+                observer.disconnect();
+                $('nav[aria-label="Page navigation - bottom"]').show();
+                return;
+            }
+            // Try again later, backing off while the server keeps failing
+            setTimeout(function () {
+                loading = false;
+                if (endIsInView()) {
+                    loadNextPage();
+                }
+            }, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, maxRetryDelay);
+        });
+    }
+
+    var observer = new IntersectionObserver(function (entries) {
+        if (entries[0].isIntersecting) {
+            loadNextPage();
+        }
+    }, {"rootMargin": loadMargin + "px"});
+    observer.observe($end[0]);
+    $('nav[aria-label="Page navigation - bottom"]').hide();
 });
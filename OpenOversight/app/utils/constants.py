@@ -4,18 +4,20 @@ import os
 # Cache Key Constants
 KEY_DEPT_ALL_ASSIGNMENTS = "all_department_assignments"
 KEY_DEPT_ALL_INCIDENTS = "all_department_incidents"
+KEY_DEPT_ALL_JOBS = "all_department_jobs"
 KEY_DEPT_ALL_LINKS = "all_department_links"
 KEY_DEPT_ALL_NOTES = "all_department_notes"
 KEY_DEPT_ALL_OFFICERS = "all_department_officers"
 KEY_DEPT_ALL_SALARIES = "all_department_salaries"
-KEY_DEPT_TOTAL_ASSIGNMENTS = "total_department_assignments"
-KEY_DEPT_TOTAL_INCIDENTS = "total_department_incidents"
-KEY_DEPT_TOTAL_OFFICERS = "total_department_officers"
+KEY_DEPT_ALL_UNITS = "all_department_units"
 
 # Config Key Constants
 KEY_ALLOWED_EXTENSIONS = "ALLOWED_EXTENSIONS"
 KEY_APPROVE_REGISTRATIONS = "APPROVE_REGISTRATIONS"
 KEY_DATABASE_URI = "SQLALCHEMY_DATABASE_URI"
+KEY_DB_CACHE_MAX_BYTES = "DB_CACHE_MAX_BYTES"
+KEY_DB_CACHE_URL = "DB_CACHE_URL"
+KEY_EXPORTS_DIR = "EXPORTS_DIR"
 KEY_ENV = "ENV"
 KEY_ENV_DEV = "development"
 KEY_ENV_TESTING = "testing"
@@ -31,9 +33,13 @@ KEY_MAIL_USE_TLS = "MAIL_USE_TLS"
 KEY_MAIL_USERNAME = "MAIL_USERNAME"
 KEY_MAIL_PASSWORD = "MAIL_PASSWORD"
 KEY_S3_BUCKET_NAME = "S3_BUCKET_NAME"
+KEY_STRICT_LOADING = "STRICT_LOADING"
 KEY_TIMEZONE = "TIMEZONE"
 
 # Database Key Constants
+KEY_CHANGED_DEPARTMENT_CHOICES = "changed_department_choices"
+KEY_CHANGED_DEPARTMENT_EXPORTS = "changed_department_exports"
+KEY_CURRENT_ASSIGNMENT_OFFICERS = "current_assignment_officers"
 KEY_DB_CREATOR = "creator"
 
 # DateTime Constants
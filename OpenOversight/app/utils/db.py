@@ -1,16 +1,43 @@
-from typing import Optional
+from typing import Dict, Iterable, List, Optional
 
-from sqlalchemy import func
+from flask import current_app
+from sqlalchemy import func, inspect, select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import contains_eager, joinedload, lazyload, raiseload, selectinload
 
 from OpenOversight.app.models.database import (
     Assignment,
     Department,
+    DepartmentStats,
+    Description,
     Face,
     Image,
+    Incident,
+    Job,
+    Note,
     Officer,
     Unit,
     User,
     db,
+    officer_incidents,
+)
+from OpenOversight.app.models.database_cache import (
+    get_database_cache_entry,
+    put_database_cache_entry,
+)
+from OpenOversight.app.utils.constants import (
+    KEY_DEPT_ALL_JOBS,
+    KEY_DEPT_ALL_UNITS,
+    KEY_STRICT_LOADING,
+)
+
+
+# Officer rosters are sorted by name with the id breaking ties. Names are coalesced so
+# that no part of the key is NULL, which keyset pagination relies on.
+OFFICER_ROSTER_SORT_KEY = (
+    func.coalesce(Officer.last_name, ""),
+    func.coalesce(Officer.first_name, ""),
+    Officer.id,
 )
 
 
@@ -53,6 +80,40 @@ def compute_leaderboard_stats(select_top=25):
     return top_sorters, top_taggers
 
 
+def department_jobs(department_id: int) -> List[Row]:
+    """Return the id, title, order and sworn status of a department's jobs sorted by
+    title. The list is cached until a job of the department changes.
+    """
+    cache_params = (Department(id=department_id), KEY_DEPT_ALL_JOBS)
+    jobs = get_database_cache_entry(*cache_params)
+    if jobs is None:
+        jobs = (
+            db.session.query(Job.id, Job.job_title, Job.order, Job.is_sworn_officer)
+            .filter_by(department_id=department_id)
+            .order_by(Job.job_title)
+            .all()
+        )
+        put_database_cache_entry(*cache_params, jobs)
+    return jobs
+
+
+def department_units(department_id: int) -> List[Row]:
+    """Return the id and description of a department's units sorted by description.
+    The list is cached until a unit of the department changes.
+    """
+    cache_params = (Department(id=department_id), KEY_DEPT_ALL_UNITS)
+    units = get_database_cache_entry(*cache_params)
+    if units is None:
+        units = (
+            db.session.query(Unit.id, Unit.description)
+            .filter_by(department_id=department_id)
+            .order_by(Unit.description)
+            .all()
+        )
+        put_database_cache_entry(*cache_params, units)
+    return units
+
+
 def dept_choices():
     return (
         db.session.query(Department)
@@ -65,6 +126,52 @@ def unsorted_dept_choices():
     return db.session.query(Department).all()
 
 
+def documented_departments() -> List[Row]:
+    """Return the departments that have officers documented, with their stats and a
+    `has_incidents` flag, in a single query.
+    """
+    return (
+        db.session.query(
+            Department, (DepartmentStats.incidents > 0).label("has_incidents")
+        )
+        .join(Department.stats)
+        .filter(DepartmentStats.officers > 0)
+        .options(contains_eager(Department.stats))
+        .order_by(Department.state.asc(), Department.name.asc())
+        .all()
+    )
+
+
+def featured_face_filepaths(officer_ids: Iterable[int]) -> Dict[int, str]:
+    """Return the image filepath of each officer's featured face, falling back to their
+    first face, for officers that have one.
+
+    This is a single query however many officers are given, so list views should use
+    it instead of going through Officer.face.
+    """
+    ranked_faces = (
+        select(
+            Face.officer_id,
+            Image.filepath,
+            func.row_number()
+            .over(
+                partition_by=Face.officer_id,
+                order_by=(Face.featured.desc(), Face.id),
+            )
+            .label("rank"),
+        )
+        .join(Image, Face.img_id == Image.id)
+        .where(Face.officer_id.in_(list(officer_ids)))
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(ranked_faces.c.officer_id, ranked_faces.c.filepath).where(
+            ranked_faces.c.rank == 1
+        )
+    )
+    return dict(rows.all())
+
+
 def get_officer(department_id, star_no, first_name, last_name):
     """
     Return the first officer with the given name and badge combo in the department, if one exists.
@@ -73,16 +180,85 @@ def get_officer(department_id, star_no, first_name, last_name):
     """
     officers = Officer.query.filter_by(
         department_id=department_id, first_name=first_name, last_name=last_name
-    ).all()
+    )
 
     if star_no is None:
-        return officers[0]
-    else:
-        star_no = str(star_no)
-        for assignment in Assignment.query.filter_by(star_no=star_no).all():
-            if assignment.base_officer in officers:
-                return assignment.base_officer
-    return None
+        return officers.all()[0]
+    # Only look at the assignments of the officers with that name
+    return (
+        officers.join(Officer.assignments)
+        .filter(Assignment.star_no == str(star_no))
+        .order_by(Assignment.id)
+        .first()
+    )
+
+
+def incident_counts(officer_ids: Iterable[int]) -> Dict[int, int]:
+    """Return the number of incidents of each of the given officers that has any.
+
+    Counts come from the association table alone, so no incidents are loaded.
+    """
+    rows = db.session.execute(
+        select(officer_incidents.c.officer_id, func.count())
+        .where(officer_incidents.c.officer_id.in_(list(officer_ids)))
+        .group_by(officer_incidents.c.officer_id)
+    )
+    return dict(rows.all())
+
+
+def load_officer_profile(officer_id: int) -> Officer:
+    """Load an officer with everything the officer profile page shows, or abort with
+    a 404 if there is no such officer.
+
+    Each relationship is loaded up front with its own query, so rendering the
+    profile costs the same small number of queries however much data the officer has.
+    """
+    return (
+        Officer.query.filter_by(id=officer_id)
+        .options(
+            joinedload(Officer.department),
+            selectinload(Officer.current_assignment).options(
+                joinedload(Assignment.job), joinedload(Assignment.unit)
+            ),
+            selectinload(Officer.assignments).options(
+                joinedload(Assignment.job), joinedload(Assignment.unit)
+            ),
+            selectinload(Officer.face).joinedload(Face.image),
+            selectinload(Officer.descriptions).joinedload(Description.creator),
+            selectinload(Officer.notes).joinedload(Note.creator),
+            selectinload(Officer.salaries),
+            selectinload(Officer.links),
+            selectinload(Officer.incidents).options(
+                joinedload(Incident.address),
+                joinedload(Incident.creator),
+                joinedload(Incident.department),
+                selectinload(Incident.license_plates),
+                selectinload(Incident.officers),
+                lazyload(Incident.links),
+            ),
+        )
+        .one_or_404()
+    )
+
+
+def officer_roster_key(officer: Officer):
+    """Return the OFFICER_ROSTER_SORT_KEY values of an officer."""
+    return officer.last_name or "", officer.first_name or "", officer.id
+
+
+def strict_loading_options(model) -> list:
+    """Return loader options that make every relationship of the model raise on access
+    when STRICT_LOADING is set, and nothing otherwise.
+
+    Call sites pass these ahead of the options for the relationships they do use,
+    which take precedence, so that any other relationship they touch fails loudly.
+    """
+    if not current_app.config[KEY_STRICT_LOADING]:
+        return []
+    return [
+        raiseload(getattr(model, relationship.key))
+        for relationship in inspect(model).relationships
+    ]
 
 
 def unit_choices(department_id: Optional[int] = None):
@@ -94,3 +270,8 @@ def unit_choices(department_id: Optional[int] = None):
             .all()
         )
     return db.session.query(Unit).order_by(Unit.description.asc()).all()
+
+
+def using_postgresql() -> bool:
+    """Return True if the current session is bound to a PostgreSQL database."""
+    return db.session.get_bind().dialect.name == "postgresql"
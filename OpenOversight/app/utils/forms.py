@@ -1,8 +1,8 @@
 from datetime import datetime
-from typing import Union
+from typing import Optional, Union
 
-from sqlalchemy import or_
-from sqlalchemy.orm import selectinload
+from sqlalchemy import case, func, or_, true
+from sqlalchemy.orm import joinedload, selectinload
 
 from OpenOversight.app.main.forms import (
     AddOfficerForm,
@@ -26,8 +26,10 @@ from OpenOversight.app.models.database import (
     Unit,
     User,
     db,
+    normalize_star_no,
 )
 from OpenOversight.app.utils.choices import GENDER_CHOICES, RACE_CHOICES
+from OpenOversight.app.utils.db import using_postgresql
 
 
 def if_exists_or_none(val: Union[str, None]) -> Union[str, None]:
@@ -274,26 +276,85 @@ def edit_officer_profile(officer, form: EditOfficerForm) -> Officer:
     return officer
 
 
-def filter_by_form(form_data: BrowseForm, officer_query, department_id=None):
-    if form_data.get("last_name"):
-        officer_query = officer_query.filter(
-            Officer.last_name.ilike(f"%%{form_data['last_name']}%%")
+# Free-text officer fields matched with text_search_filter. Results of a search on any
+# of them are ordered by how well they match.
+TEXT_SEARCH_FIELDS = {
+    "last_name": Officer.last_name,
+    "first_name": Officer.first_name,
+    "unique_internal_identifier": Officer.unique_internal_identifier,
+}
+
+
+def text_search_filter(column, value: str):
+    """Match officers whose column contains the value or, on PostgreSQL, is
+    similar enough to it that small misspellings still match.
+
+    Both conditions are served by the column's pg_trgm GIN index. Other databases
+    fall back to a plain case-insensitive substring match.
+    """
+    substring_match = column.ilike(f"%%{value}%%")
+    if using_postgresql():
+        return or_(substring_match, column.op("%")(value))
+    return substring_match
+
+
+def text_search_rank(column, value: str):
+    """Score how closely the column matches the value, higher is better.
+
+    PostgreSQL uses trigram similarity. Other databases rank an exact match above a
+    prefix match above any other match.
+    """
+    if using_postgresql():
+        return func.similarity(column, value)
+    return case(
+        (func.lower(column) == value.lower(), 2),
+        (column.ilike(f"{value}%%"), 1),
+        else_=0,
+    )
+
+
+def badge_search_filter(value: str, department_id: Optional[int] = None):
+    """Match assignments by badge number, ignoring whitespace, case and leading zeros.
+
+    A badge number that some assignment in the department has exactly is matched
+    exactly, anything else is treated as the start of a badge number. Both use the
+    normalized badge index. `*` matches any characters, so `*123*` opts into a
+    substring search which has to scan every badge number.
+    """
+    if "*" in value:
+        first, *rest = ["".join(piece.split()).upper() for piece in value.split("*")]
+        pieces = [first.lstrip("0") or first, *rest]
+        pattern = "%".join(
+            piece.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            for piece in pieces
         )
-    if form_data.get("first_name"):
-        officer_query = officer_query.filter(
-            Officer.first_name.ilike(f"%%{form_data['first_name']}%%")
+        return Assignment.star_no_normalized.like(pattern, escape="\\")
+
+    normalized = normalize_star_no(value)
+    if normalized is None:
+        return true()
+    exact_match = Assignment.star_no_normalized == normalized
+    exact_query = db.session.query(Assignment.id).filter(exact_match)
+    if department_id is not None:
+        exact_query = exact_query.join(Assignment.base_officer).filter(
+            Officer.department_id == department_id
         )
+    if db.session.query(exact_query.exists()).scalar():
+        return exact_match
+    return Assignment.star_no_normalized.startswith(normalized, autoescape=True)
+
+
+def filter_by_form(form_data: BrowseForm, officer_query, department_id=None):
+    search_ranks = []
+    for field, column in TEXT_SEARCH_FIELDS.items():
+        if value := form_data.get(field):
+            officer_query = officer_query.filter(text_search_filter(column, value))
+            search_ranks.append(text_search_rank(column, value))
+
     if not department_id and form_data.get("dept"):
         department_id = form_data["dept"].id
         officer_query = officer_query.filter(Officer.department_id == department_id)
 
-    if form_data.get("unique_internal_identifier"):
-        officer_query = officer_query.filter(
-            Officer.unique_internal_identifier.ilike(
-                f"%%{form_data['unique_internal_identifier']}%%"
-            )
-        )
-
     race_values = [x for x, _ in RACE_CHOICES]
     if form_data.get("race") and all(race in race_values for race in form_data["race"]):
         if "Not Sure" in form_data["race"]:
@@ -348,34 +409,39 @@ def filter_by_form(form_data: BrowseForm, officer_query, department_id=None):
         if "Not Sure" in form_data["unit"]:
             include_null_unit = True
 
-    if (
-        form_data.get("badge")
-        or unit_ids
-        or include_null_unit
-        or job_ids
-        or form_data.get("current_job")
-    ):
+    if form_data.get("current_job"):
+        # Only look at each officer's current assignment, which must still be open
+        officer_query = officer_query.join(Officer.current_assignment).filter(
+            Assignment.resign_date.is_(None)
+        )
+    elif form_data.get("badge") or unit_ids or include_null_unit or job_ids:
         officer_query = officer_query.join(Officer.assignments)
-        if form_data.get("badge"):
-            officer_query = officer_query.filter(
-                Assignment.star_no.like(f"%%{form_data['badge']}%%")
-            )
 
-        if unit_ids or include_null_unit:
-            # Split into 2 expressions because the SQL IN keyword does not match NULLs
-            unit_filters = []
-            if unit_ids:
-                unit_filters.append(Assignment.unit_id.in_(unit_ids))
-            if include_null_unit:
-                unit_filters.append(Assignment.unit_id.is_(None))
-            officer_query = officer_query.filter(or_(*unit_filters))
-
-        if job_ids:
-            officer_query = officer_query.filter(Assignment.job_id.in_(job_ids))
-
-        if form_data.get("current_job"):
-            officer_query = officer_query.filter(Assignment.resign_date.is_(None))
-    officer_query = officer_query.options(selectinload(Officer.assignments)).distinct()
+    if form_data.get("badge"):
+        officer_query = officer_query.filter(
+            badge_search_filter(form_data["badge"], department_id)
+        )
+
+    if unit_ids or include_null_unit:
+        # Split into 2 expressions because the SQL IN keyword does not match NULLs
+        unit_filters = []
+        if unit_ids:
+            unit_filters.append(Assignment.unit_id.in_(unit_ids))
+        if include_null_unit:
+            unit_filters.append(Assignment.unit_id.is_(None))
+        officer_query = officer_query.filter(or_(*unit_filters))
+
+    if job_ids:
+        officer_query = officer_query.filter(Assignment.job_id.in_(job_ids))
+    officer_query = officer_query.options(
+        selectinload(Officer.current_assignment).options(
+            joinedload(Assignment.job), joinedload(Assignment.unit)
+        )
+    ).distinct()
+
+    if search_ranks:
+        # Best matches first, callers' own ordering breaks ties
+        officer_query = officer_query.order_by(sum(search_ranks).desc())
 
     return officer_query
 
@@ -0,0 +1,109 @@
+import base64
+import binascii
+import json
+from typing import Any, Callable, List, Optional, Sequence
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+from OpenOversight.app.utils.constants import ENCODING_UTF_8
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Turn the sort key values of a row into an opaque, URL-safe token."""
+    encoded = base64.urlsafe_b64encode(json.dumps(list(values)).encode(ENCODING_UTF_8))
+    return encoded.decode(ENCODING_UTF_8)
+
+
+def decode_cursor(token: str) -> List[Any]:
+    """Turn a token created by encode_cursor back into sort key values.
+
+    Raises ValueError if the token was not created by encode_cursor.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode(ENCODING_UTF_8)))
+    except (binascii.Error, UnicodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {token}") from e
+    if not isinstance(values, list) or not all(
+        value is None or isinstance(value, (str, int, float, bool)) for value in values
+    ):
+        raise ValueError(f"Invalid cursor: {token}")
+    return values
+
+
+def _decode_key(
+    token: str,
+    sort_key: Sequence[Any],
+    parse_key: Callable[[List[Any]], Sequence[Any]],
+) -> Sequence[Any]:
+    values = decode_cursor(token)
+    if len(values) != len(sort_key):
+        raise ValueError(f"Invalid cursor: {token}")
+    return parse_key(values)
+
+
+class KeysetPagination:
+    """Paginate a query by seeking past the sort key of the last row seen instead
+    of using OFFSET.
+
+    Each page costs a single `LIMIT per_page + 1` query whose cost does not depend on
+    how deep into the results it is, and no COUNT(*) is issued. The sort key has to be
+    unique (end it with a primary key) and every expression in it must be non-null.
+    Pass `after` to get the page following a cursor, or `before` to get the page
+    preceding it. Either raises ValueError if the cursor does not hold a sort key.
+    `total` may be given if the caller knows or can estimate it cheaply.
+    `parse_key` turns the values of a decoded cursor back into sort key values, for
+    keys that are not plain JSON values, and raises ValueError if they are invalid.
+    """
+
+    page = None
+
+    def __init__(
+        self,
+        query: Query,
+        sort_key: Sequence[Any],
+        key_values: Callable[[Any], Sequence[Any]],
+        per_page: int,
+        after: Optional[str] = None,
+        before: Optional[str] = None,
+        total: Optional[int] = None,
+        parse_key: Callable[[List[Any]], Sequence[Any]] = list,
+    ):
+        self.per_page = per_page
+        self.total = total
+        self._key_values = key_values
+
+        key = tuple_(*sort_key)
+        if before is not None:
+            query = query.filter(
+                key < tuple_(*_decode_key(before, sort_key, parse_key))
+            ).order_by(*[expression.desc() for expression in sort_key])
+        else:
+            if after is not None:
+                query = query.filter(
+                    key > tuple_(*_decode_key(after, sort_key, parse_key))
+                )
+            query = query.order_by(*sort_key)
+
+        items = query.limit(per_page + 1).all()
+        has_more = len(items) > per_page
+        items = items[:per_page]
+
+        if before is not None:
+            items.reverse()
+            self.has_prev, self.has_next = has_more, True
+        else:
+            self.has_prev, self.has_next = after is not None, has_more
+        self.items = items
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        if not self.has_next or not self.items:
+            return None
+        return encode_cursor(self._key_values(self.items[-1]))
+
+    @property
+    def prev_cursor(self) -> Optional[str]:
+        if not self.has_prev or not self.items:
+            return None
+        return encode_cursor(self._key_values(self.items[0]))
@@ -1,3 +1,4 @@
+import re
 from urllib.parse import urlparse
 
 from us import states
@@ -18,3 +19,10 @@ def url_validator(url):
         raise ValueError("Not a valid URL")
 
     return url
+
+
+def zip_code_validator(zip_code):
+    if not re.match(r"^\d{5}$", zip_code):
+        raise ValueError("Not a valid zip code")
+
+    return zip_code
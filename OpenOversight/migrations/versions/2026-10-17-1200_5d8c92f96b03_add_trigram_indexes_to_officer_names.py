@@ -0,0 +1,38 @@
+"""add trigram indexes to officer names
+
+Revision ID: 5d8c92f96b03
+Revises: 99c50fc8d294
+Create Date: 2026-10-17 12:00:41.532118
+
+"""
+
+from alembic import op
+
+
+revision = "5d8c92f96b03"
+down_revision = "99c50fc8d294"
+
+TRIGRAM_INDEXES = {
+    "ix_officers_last_name_trgm": "last_name",
+    "ix_officers_first_name_trgm": "first_name",
+    "ix_officers_unique_internal_identifier_trgm": "unique_internal_identifier",
+}
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for index_name, column in TRIGRAM_INDEXES.items():
+        op.create_index(
+            index_name,
+            "officers",
+            [column],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={column: "gin_trgm_ops"},
+        )
+
+
+def downgrade():
+    for index_name in TRIGRAM_INDEXES:
+        op.drop_index(index_name, table_name="officers")
+    # The pg_trgm extension is left in place since other objects may depend on it.
@@ -0,0 +1,32 @@
+"""add officer roster order index
+
+Revision ID: 241c4d633d04
+Revises: 5d8c92f96b03
+Create Date: 2026-10-17 12:30:12.804517
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "241c4d633d04"
+down_revision = "5d8c92f96b03"
+
+
+def upgrade():
+    op.create_index(
+        "ix_officers_roster_order",
+        "officers",
+        [
+            "department_id",
+            sa.text("coalesce(last_name, '')"),
+            sa.text("coalesce(first_name, '')"),
+            "id",
+        ],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_officers_roster_order", table_name="officers")
@@ -0,0 +1,58 @@
+"""add current assignment to officers
+
+Revision ID: d75665f1962a
+Revises: 241c4d633d04
+Create Date: 2026-10-17 13:00:12.804417
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "d75665f1962a"
+down_revision = "241c4d633d04"
+
+
+def upgrade():
+    with op.batch_alter_table("officers", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("current_assignment_id", sa.Integer(), nullable=True)
+        )
+        batch_op.create_index(
+            batch_op.f("ix_officers_current_assignment_id"),
+            ["current_assignment_id"],
+            unique=False,
+        )
+        batch_op.create_foreign_key(
+            "officers_current_assignment_id_fkey",
+            "assignments",
+            ["current_assignment_id"],
+            ["id"],
+            ondelete="SET NULL",
+        )
+
+    op.execute(
+        """
+        UPDATE officers
+        SET current_assignment_id = (
+            SELECT assignments.id
+            FROM assignments
+            WHERE assignments.officer_id = officers.id
+            ORDER BY
+                assignments.start_date IS NULL,
+                assignments.start_date DESC,
+                assignments.id
+            LIMIT 1
+        )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("officers", schema=None) as batch_op:
+        batch_op.drop_constraint(
+            "officers_current_assignment_id_fkey", type_="foreignkey"
+        )
+        batch_op.drop_index(batch_op.f("ix_officers_current_assignment_id"))
+        batch_op.drop_column("current_assignment_id")
@@ -0,0 +1,71 @@
+"""add normalized badge numbers
+
+Revision ID: 49774e6c3729
+Revises: d75665f1962a
+Create Date: 2026-10-17 13:30:27.190564
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "49774e6c3729"
+down_revision = "d75665f1962a"
+
+BATCH_SIZE = 10000
+
+
+def normalize_star_no(star_no):
+    # Copy of OpenOversight.app.models.database.normalize_star_no at this revision
+    compact = "".join(star_no.split()).upper()
+    if not compact:
+        return None
+    return compact.lstrip("0") or "0"
+
+
+def upgrade():
+    with op.batch_alter_table("assignments", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("star_no_normalized", sa.String(length=120), nullable=True)
+        )
+
+    assignments = sa.table(
+        "assignments",
+        sa.column("id", sa.Integer),
+        sa.column("star_no", sa.String),
+        sa.column("star_no_normalized", sa.String),
+    )
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(assignments.c.id, assignments.c.star_no).where(
+            assignments.c.star_no.isnot(None)
+        )
+    ).all()
+    update = (
+        assignments.update()
+        .where(assignments.c.id == sa.bindparam("assignment_id"))
+        .values(star_no_normalized=sa.bindparam("normalized"))
+    )
+    for start in range(0, len(rows), BATCH_SIZE):
+        connection.execute(
+            update,
+            [
+                {"assignment_id": id, "normalized": normalize_star_no(star_no)}
+                for id, star_no in rows[start : start + BATCH_SIZE]
+            ],
+        )
+
+    op.create_index(
+        "ix_assignments_star_no_normalized",
+        "assignments",
+        ["star_no_normalized"],
+        unique=False,
+        postgresql_ops={"star_no_normalized": "varchar_pattern_ops"},
+    )
+
+
+def downgrade():
+    op.drop_index("ix_assignments_star_no_normalized", table_name="assignments")
+    with op.batch_alter_table("assignments", schema=None) as batch_op:
+        batch_op.drop_column("star_no_normalized")
@@ -0,0 +1,63 @@
+"""add department stats
+
+Revision ID: 80fd91405495
+Revises: 49774e6c3729
+Create Date: 2026-10-17 14:00:41.219834
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "80fd91405495"
+down_revision = "49774e6c3729"
+
+
+def upgrade():
+    op.create_table(
+        "department_stats",
+        sa.Column("department_id", sa.Integer(), nullable=False),
+        sa.Column("officers", sa.Integer(), nullable=False),
+        sa.Column("assignments", sa.Integer(), nullable=False),
+        sa.Column("incidents", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["department_id"],
+            ["departments.id"],
+            name="department_stats_department_id_fkey",
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("department_id"),
+    )
+
+    op.execute(
+        """
+        INSERT INTO department_stats (department_id, officers, assignments, incidents)
+        SELECT
+            departments.id,
+            COALESCE(officer_counts.total, 0),
+            COALESCE(assignment_counts.total, 0),
+            COALESCE(incident_counts.total, 0)
+        FROM departments
+        LEFT OUTER JOIN (
+            SELECT department_id, count(*) AS total
+            FROM officers
+            GROUP BY department_id
+        ) AS officer_counts ON officer_counts.department_id = departments.id
+        LEFT OUTER JOIN (
+            SELECT officers.department_id, count(*) AS total
+            FROM officers
+            JOIN assignments ON assignments.officer_id = officers.id
+            GROUP BY officers.department_id
+        ) AS assignment_counts ON assignment_counts.department_id = departments.id
+        LEFT OUTER JOIN (
+            SELECT department_id, count(*) AS total
+            FROM incidents
+            GROUP BY department_id
+        ) AS incident_counts ON incident_counts.department_id = departments.id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("department_stats")
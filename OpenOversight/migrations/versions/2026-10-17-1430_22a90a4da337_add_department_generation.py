@@ -0,0 +1,26 @@
+"""add department generation
+
+Revision ID: 22a90a4da337
+Revises: 80fd91405495
+Create Date: 2026-10-17 14:30:12.504927
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "22a90a4da337"
+down_revision = "80fd91405495"
+
+
+def upgrade():
+    with op.batch_alter_table("department_stats", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("generation", sa.Integer(), nullable=False, server_default="0")
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("department_stats", schema=None) as batch_op:
+        batch_op.drop_column("generation")
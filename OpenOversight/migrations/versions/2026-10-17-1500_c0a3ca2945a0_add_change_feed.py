@@ -0,0 +1,73 @@
+"""add change feed indexes and tombstones
+
+Revision ID: c0a3ca2945a0
+Revises: 22a90a4da337
+Create Date: 2026-10-17 15:00:27.613904
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "c0a3ca2945a0"
+down_revision = "22a90a4da337"
+
+DEPARTMENT_TABLES = ["officers", "incidents"]
+OTHER_TABLES = ["assignments", "salaries", "descriptions", "links"]
+
+
+def upgrade():
+    for table in DEPARTMENT_TABLES:
+        op.create_index(
+            f"ix_{table}_department_id_last_updated_at",
+            table,
+            ["department_id", "last_updated_at", "id"],
+            unique=False,
+        )
+    for table in OTHER_TABLES:
+        op.create_index(
+            f"ix_{table}_last_updated_at",
+            table,
+            ["last_updated_at", "id"],
+            unique=False,
+        )
+
+    op.create_table(
+        "tombstones",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("table_name", sa.String(length=64), nullable=False),
+        sa.Column("record_id", sa.Integer(), nullable=False),
+        sa.Column("department_id", sa.Integer(), nullable=True),
+        sa.Column(
+            "deleted_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(
+            ["department_id"],
+            ["departments.id"],
+            name="tombstones_department_id_fkey",
+            ondelete="CASCADE",
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_tombstones_department_id_table_name_deleted_at",
+        "tombstones",
+        ["department_id", "table_name", "deleted_at", "id"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_tombstones_department_id_table_name_deleted_at", table_name="tombstones"
+    )
+    op.drop_table("tombstones")
+
+    for table in OTHER_TABLES:
+        op.drop_index(f"ix_{table}_last_updated_at", table_name=table)
+    for table in DEPARTMENT_TABLES:
+        op.drop_index(f"ix_{table}_department_id_last_updated_at", table_name=table)
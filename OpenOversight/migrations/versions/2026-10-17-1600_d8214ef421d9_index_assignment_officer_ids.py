@@ -0,0 +1,25 @@
+"""index the officer ids of assignments
+
+Revision ID: d8214ef421d9
+Revises: c0a3ca2945a0
+Create Date: 2026-10-17 16:00:41.270318
+
+"""
+
+from alembic import op
+
+
+revision = "d8214ef421d9"
+down_revision = "c0a3ca2945a0"
+
+
+def upgrade():
+    with op.batch_alter_table("assignments", schema=None) as batch_op:
+        batch_op.create_index(
+            batch_op.f("ix_assignments_officer_id"), ["officer_id"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("assignments", schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f("ix_assignments_officer_id"))
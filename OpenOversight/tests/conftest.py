@@ -38,6 +38,7 @@ from OpenOversight.app.models.database import (
     User,
 )
 from OpenOversight.app.models.database import db as _db
+from OpenOversight.app.models.database_cache import DB_CACHE
 from OpenOversight.app.utils.choices import DEPARTMENT_STATE_CHOICES, SUFFIX_CHOICES
 from OpenOversight.app.utils.constants import (
     ENCODING_UTF_8,
@@ -321,6 +322,8 @@ def session(db):
             # If an error was raised during test, tx is already rolled back
             if tx.is_active:
                 tx.rollback()
+            # Cached entries may describe rows that were just rolled back
+            DB_CACHE.clear()
 
 
 @pytest.fixture
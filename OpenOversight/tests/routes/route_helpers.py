@@ -1,11 +1,13 @@
-from typing import Tuple
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
 
 from flask import url_for
 from flask.testing import FlaskClient
+from sqlalchemy import event
 from werkzeug.test import TestResponse
 
 from OpenOversight.app.auth.forms import LoginForm
-from OpenOversight.app.models.database import User
+from OpenOversight.app.models.database import User, db
 from OpenOversight.tests.constants import (
     AC_USER_EMAIL,
     AC_USER_PASSWORD,
@@ -105,3 +107,18 @@ def process_form_data(form_dict: dict) -> dict:
             new_dict[key] = "y"
 
     return new_dict
+
+
+@contextmanager
+def count_queries() -> Iterator[List[str]]:
+    """Collect the SQL statements executed while the context is active."""
+    statements = []
+
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record_statement)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record_statement)
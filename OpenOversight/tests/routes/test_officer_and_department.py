@@ -1,11 +1,15 @@
 import copy
 import csv
+import gzip
 import json
 import random
 import re
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from html import unescape
 from http import HTTPStatus
-from io import BytesIO
+from io import BytesIO, StringIO
+from operator import attrgetter
+from zipfile import ZipFile
 
 import pytest
 from flask import current_app, url_for
@@ -13,6 +17,7 @@ from mock import MagicMock, patch
 from sqlalchemy.sql.operators import Operators
 from werkzeug.test import TestResponse
 
+from OpenOversight.app.main.downloads import department_csv, render_exports
 from OpenOversight.app.main.forms import (
     AddOfficerForm,
     AddUnitForm,
@@ -36,6 +41,7 @@ from OpenOversight.app.models.database import (
     Image,
     Incident,
     Job,
+    Link,
     Officer,
     Salary,
     Unit,
@@ -47,11 +53,15 @@ from OpenOversight.app.models.database_cache import (
 from OpenOversight.app.utils.choices import GENDER_CHOICES, RACE_CHOICES
 from OpenOversight.app.utils.constants import (
     ENCODING_UTF_8,
+    KEY_DEPT_ALL_INCIDENTS,
     KEY_DEPT_ALL_LINKS,
     KEY_DEPT_ALL_SALARIES,
+    KEY_EXPORTS_DIR,
+    KEY_OFFICERS_PER_PAGE,
 )
 from OpenOversight.app.utils.db import unit_choices
 from OpenOversight.app.utils.forms import add_new_assignment
+from OpenOversight.app.utils.pagination import encode_cursor
 from OpenOversight.tests.conftest import (
     AC_DEPT,
     RANK_CHOICES_1,
@@ -60,6 +70,7 @@ from OpenOversight.tests.conftest import (
 )
 from OpenOversight.tests.constants import INVALID_ID
 from OpenOversight.tests.routes.route_helpers import (
+    count_queries,
     login_ac,
     login_admin,
     login_user,
@@ -67,6 +78,9 @@ from OpenOversight.tests.routes.route_helpers import (
 )
 
 
+OFFICER_PROFILE_QUERY_BUDGET = 14
+
+
 @pytest.mark.parametrize(
     "route",
     [
@@ -126,6 +140,35 @@ def test_user_can_access_officer_profile(client, session):
         assert "Officer Detail" in rv.data.decode(ENCODING_UTF_8)
 
 
+def test_officer_profile_query_budget(client, session):
+    with current_app.test_request_context():
+        login_admin(client)
+        officer = (
+            Officer.query.filter(
+                Officer.incidents.any(),
+                Officer.links.any(),
+                Officer.salaries.any(),
+                Officer.assignments.any(),
+            )
+            .order_by(Officer.id)
+            .first()
+        )
+        url = url_for("main.officer_profile", officer_id=officer.id)
+
+        with count_queries() as statements:
+            rv = client.get(url)
+        assert rv.status_code == HTTPStatus.OK
+        assert len(statements) <= OFFICER_PROFILE_QUERY_BUDGET, statements
+
+        # More related rows do not mean more queries
+        for incident in Incident.query.filter(~Incident.officers.any(id=officer.id)):
+            incident.officers.append(officer)
+        session.commit()
+        with count_queries() as more_statements:
+            client.get(url)
+        assert len(more_statements) == len(statements)
+
+
 def test_invalid_officer_id_officer_list(client, session):
     with current_app.test_request_context():
         rv = client.get(url_for("main.list_officer", department_id=INVALID_ID))
@@ -139,6 +182,254 @@ def test_user_can_access_officer_list(client, session):
         assert "Officers" in rv.data.decode(ENCODING_UTF_8)
 
 
+def _officer_list_page(client, url):
+    """Return the officer ids on a roster page and its next and previous links."""
+    html = client.get(url).data.decode(ENCODING_UTF_8)
+    officer_ids = re.findall(r'href="/officers/(\d+)"\s+id="officer-profile', html)
+    next_link = re.search(r'<li class="next">\s*<a [^>]*href="([^"]+)"', html)
+    prev_link = re.search(
+        r'<li class="page-item previous">\s*<a [^>]*href="([^"]+)"', html
+    )
+    return (
+        [int(officer_id) for officer_id in officer_ids],
+        next_link and unescape(next_link.group(1)),
+        prev_link and unescape(prev_link.group(1)),
+    )
+
+
+def test_officer_list_cursor_pagination_visits_every_officer(
+    client, session, department
+):
+    with current_app.test_request_context():
+        seen, pages = [], []
+        url = url_for("main.list_officer", department_id=department.id)
+        while url:
+            officer_ids, url, _ = _officer_list_page(client, url)
+            assert not url or "after=" in url
+            seen += officer_ids
+            pages.append(officer_ids)
+
+        expected = Officer.query.filter_by(department_id=department.id).count()
+        assert len(seen) == len(set(seen)) == expected
+        assert len(pages) > 1
+
+        # Walking backwards from the second page returns to the first one
+        second_page_url = _officer_list_page(
+            client, url_for("main.list_officer", department_id=department.id)
+        )[1]
+        _, _, prev_url = _officer_list_page(client, second_page_url)
+        assert "before=" in prev_url
+        assert _officer_list_page(client, prev_url)[0] == pages[0]
+
+
+def test_officer_list_page_numbers_still_work(client, session, department):
+    with current_app.test_request_context():
+        rv = client.get(
+            url_for("main.list_officer", department_id=department.id, page=2)
+        )
+        html = rv.data.decode(ENCODING_UTF_8)
+        per_page = current_app.config[KEY_OFFICERS_PER_PAGE]
+
+        assert f"Showing {per_page + 1}-{2 * per_page} of" in html
+        assert "page=3" in html
+        assert "after=" not in html
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "bogus",
+        encode_cursor([]),
+        encode_cursor(["Smith", "John"]),
+        encode_cursor([["Smith"], "John", 1]),
+    ],
+)
+def test_officer_list_rejects_invalid_cursor(client, session, department, cursor):
+    with current_app.test_request_context():
+        rv = client.get(
+            url_for("main.list_officer", department_id=department.id, after=cursor)
+        )
+        assert rv.status_code == HTTPStatus.BAD_REQUEST
+
+
+def test_officer_api_pages_match_roster(client, session, department):
+    with current_app.test_request_context():
+        html_ids, _, _ = _officer_list_page(
+            client, url_for("main.list_officer", department_id=department.id)
+        )
+        seen, url = [], url_for("main.api_list_officers", department_id=department.id)
+        while url:
+            data = client.get(url).json
+            seen += [officer["id"] for officer in data["officers"]]
+            url = data["next"]
+
+        expected = Officer.query.filter_by(department_id=department.id).count()
+        assert len(seen) == len(set(seen)) == expected
+        assert seen[: len(html_ids)] == html_ids
+
+        officer = session.get(Officer, seen[0])
+        row = client.get(
+            url_for("main.api_list_officers", department_id=department.id)
+        ).json["officers"][0]
+        assert row["name"] == officer.full_name()
+        assert row["badge"] == officer.badge_number()
+        assert row["rank"] == officer.job_title()
+        assert row["currently_on_force"] == officer.currently_on_force()
+        assert row["gender"] == officer.gender_label()
+        assert row["photos"] == len(officer.face)
+
+
+def test_officer_api_revalidates_with_etag(client, session, department):
+    with current_app.test_request_context():
+        url = url_for("main.api_list_officers", department_id=department.id)
+        rv = client.get(url)
+        assert rv.status_code == HTTPStatus.OK
+        assert rv.headers["ETag"]
+
+        rv = client.get(url, headers={"If-None-Match": rv.headers["ETag"]})
+        assert rv.status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_officer_api_errors(client, session, department):
+    with current_app.test_request_context():
+        rv = client.get(url_for("main.api_list_officers", department_id=999999))
+        assert rv.status_code == HTTPStatus.NOT_FOUND
+
+        rv = client.get(
+            url_for(
+                "main.api_list_officers", department_id=department.id, before="bogus"
+            )
+        )
+        assert rv.status_code == HTTPStatus.BAD_REQUEST
+
+
+def _change_feed(client, department_id, table_name, **args):
+    """Follow a change feed through all of its pages."""
+    changes = []
+    url = url_for(
+        "main.api_department_changes",
+        department_id=department_id,
+        table_name=table_name,
+        **args,
+    )
+    while url:
+        data = client.get(url).json
+        changes += data["changes"]
+        url, cursor = data["next"], data["cursor"]
+    return changes, cursor
+
+
+def test_change_feed_lists_department_rows(client, session, department, monkeypatch):
+    monkeypatch.setattr("OpenOversight.app.main.changes.CHANGES_PER_PAGE", 7)
+    with current_app.test_request_context():
+        changes, cursor = _change_feed(client, department.id, "officers")
+
+        officer_ids = {
+            officer.id
+            for officer in Officer.query.filter_by(department_id=department.id)
+        }
+        changed_at = [change["changed_at"] for change in changes]
+        assert changed_at == sorted(changed_at)
+        assert len(changes) == len(officer_ids)
+        assert {change["id"] for change in changes} == officer_ids
+        assert all(
+            change["record"]["department_id"] == department.id for change in changes
+        )
+        assert cursor is not None
+
+        salaries, _ = _change_feed(client, department.id, "salaries")
+        assert {change["id"] for change in salaries} == {
+            salary.id
+            for salary in Salary.query.join(Salary.officer).filter(
+                Officer.department_id == department.id
+            )
+        }
+
+
+def test_change_feed_resumes_from_cursor(client, session, department):
+    with current_app.test_request_context():
+        _, officers_cursor = _change_feed(client, department.id, "officers")
+        _, salaries_cursor = _change_feed(client, department.id, "salaries")
+
+        officer = Officer.query.filter_by(department_id=department.id).first()
+        officer.first_name = "Renamed"
+        salary = Salary.query.filter_by(officer_id=officer.id).first()
+        salary_id = salary.id
+        session.delete(salary)
+        session.commit()
+
+        # The changes shortly before the cursor are listed again, before the new ones
+        changes, _ = _change_feed(
+            client, department.id, "officers", after=officers_cursor
+        )
+        assert (changes[-1]["id"], changes[-1]["deleted"]) == (officer.id, False)
+        assert changes[-1]["record"]["first_name"] == "Renamed"
+
+        changes, _ = _change_feed(
+            client, department.id, "salaries", after=salaries_cursor
+        )
+        assert (changes[-1]["id"], changes[-1]["deleted"]) == (salary_id, True)
+        assert changes[-1]["record"] is None
+
+        since = changes[-1]["changed_at"]
+        changes, _ = _change_feed(client, department.id, "salaries", since=since)
+        assert [change["id"] for change in changes] == [salary_id]
+
+
+def test_change_feed_lists_changes_committed_late(client, session, department):
+    """Test that resuming lists a change stamped before the last change listed, like
+    one whose transaction flushed before the feed was read and committed after.
+    """
+    with current_app.test_request_context():
+        changes, cursor = _change_feed(client, department.id, "officers")
+
+        officer = session.get(Officer, changes[0]["id"])
+        officer.first_name = "Committed late"
+        officer.last_updated_at = datetime.fromisoformat(
+            changes[-1]["changed_at"]
+        ) - timedelta(seconds=1)
+        session.commit()
+
+        changes, _ = _change_feed(client, department.id, "officers", after=cursor)
+        assert any(
+            change["id"] == officer.id
+            and change["record"]["first_name"] == "Committed late"
+            for change in changes
+        )
+
+
+def test_change_feed_errors(client, session, department):
+    with current_app.test_request_context():
+        rv = client.get(
+            url_for(
+                "main.api_department_changes",
+                department_id=999999,
+                table_name="officers",
+            )
+        )
+        assert rv.status_code == HTTPStatus.NOT_FOUND
+
+        rv = client.get(
+            url_for(
+                "main.api_department_changes",
+                department_id=department.id,
+                table_name="users",
+            )
+        )
+        assert rv.status_code == HTTPStatus.NOT_FOUND
+
+        for args in ({"after": "bogus"}, {"since": "yesterday"}):
+            rv = client.get(
+                url_for(
+                    "main.api_department_changes",
+                    department_id=department.id,
+                    table_name="officers",
+                    **args,
+                )
+            )
+            assert rv.status_code == HTTPStatus.BAD_REQUEST
+
+
 @pytest.mark.parametrize(
     "filter_func, has_placeholder",
     [
@@ -1761,6 +2052,7 @@ def test_officer_csv(client, session, department, faker):
             follow_redirects=True,
         )
         assert "New Officer FVkcjigWUeUyA added" in rv.data.decode(ENCODING_UTF_8)
+        job_title = job.job_title
 
         # dump officer csv
         rv = client.get(
@@ -1775,7 +2067,7 @@ def test_officer_csv(client, session, department, faker):
         ]
         assert len(added_lines) == 1
         assert form.first_name.data == added_lines[0]["first name"]
-        assert job.job_title == added_lines[0]["job title"]
+        assert job_title == added_lines[0]["job title"]
         assert form.star_no.data == added_lines[0]["badge number"]
 
 
@@ -1792,6 +2084,9 @@ def test_assignments_csv(client, session, department):
             star_no="9181", job_title=job, start_date=date(2020, 6, 16)
         )
         add_new_assignment(officer.id, form, user)
+        officer_id = officer.id
+        unique_internal_identifier = officer.unique_internal_identifier
+        job_title = job.job_title
         rv = client.get(
             url_for("main.download_dept_assignments_csv", department_id=department.id),
             follow_redirects=True,
@@ -1803,20 +2098,16 @@ def test_assignments_csv(client, session, department):
                 session.get(Officer, int(row["officer id"])).department_id
                 == department.id
             )
-        lines = [row for row in all_rows if int(row["officer id"]) == officer.id]
+        lines = [row for row in all_rows if int(row["officer id"]) == officer_id]
         assert len(lines) == 2
-        assert (
-            lines[0]["officer unique identifier"] == officer.unique_internal_identifier
-        )
-        assert (
-            lines[1]["officer unique identifier"] == officer.unique_internal_identifier
-        )
+        assert lines[0]["officer unique identifier"] == unique_internal_identifier
+        assert lines[1]["officer unique identifier"] == unique_internal_identifier
         new_assignment = [
             row for row in lines if row["badge number"] == form.star_no.data
         ]
         assert len(new_assignment) == 1
         assert new_assignment[0]["start date"] == str(form.start_date.data)
-        assert new_assignment[0]["job title"] == job.job_title
+        assert new_assignment[0]["job title"] == job_title
 
 
 def test_incidents_csv(client, session, department, faker):
@@ -1868,6 +2159,154 @@ def test_incidents_csv(client, session, department, faker):
         assert form.description.data in csv[0]
 
 
+@pytest.mark.parametrize(
+    "endpoint",
+    [
+        "main.download_dept_officers_csv",
+        "main.download_dept_assignments_csv",
+        "main.download_incidents_csv",
+        "main.download_dept_salaries_csv",
+        "main.download_dept_links_csv",
+        "main.download_dept_descriptions_csv",
+    ],
+)
+def test_csv_downloads_are_streamed(endpoint, client, session, monkeypatch):
+    monkeypatch.setattr("OpenOversight.app.main.downloads.CSV_CHUNK_SIZE", 1)
+    with current_app.test_request_context():
+        department = Department.query.first()
+
+        rv = client.get(url_for(endpoint, department_id=department.id))
+
+        assert rv.status_code == HTTPStatus.OK
+        assert rv.is_streamed
+        chunks = list(rv.response)
+        # Each row comes in its own chunk, the first with the header, plus an empty
+        # last one
+        csv_data = b"".join(chunks).decode(ENCODING_UTF_8)
+        rows = list(csv.DictReader(StringIO(csv_data, newline="")))
+        assert len(chunks) == len(rows) + 1
+
+
+def test_csv_downloads_serve_rendered_exports(client, session, tmp_path, monkeypatch):
+    monkeypatch.setitem(current_app.config, KEY_EXPORTS_DIR, str(tmp_path))
+    accept_gzip = {"Accept-Encoding": "gzip"}
+    with current_app.test_request_context():
+        department = Department.query.first()
+        url = url_for("main.download_dept_officers_csv", department_id=department.id)
+        csv_data = client.get(url, headers=accept_gzip).data
+
+        render_exports([department.id])
+        rv = client.get(url, headers=accept_gzip)
+        assert rv.status_code == HTTPStatus.OK
+        assert rv.content_encoding == "gzip"
+        assert rv.content_length == len(rv.data)
+        assert gzip.decompress(rv.data) == csv_data
+        assert "attachment" in rv.headers["Content-Disposition"]
+
+        etag = rv.headers["ETag"]
+        rv = client.get(url, headers={**accept_gzip, "If-None-Match": etag})
+        assert rv.status_code == HTTPStatus.NOT_MODIFIED
+        rv = client.get(url, headers={**accept_gzip, "Range": "bytes=0-9"})
+        assert rv.status_code == HTTPStatus.PARTIAL_CONTENT
+        assert len(rv.data) == 10
+
+        # Clients that do not accept gzip get the CSV built on demand
+        rv = client.get(url)
+        assert rv.content_encoding is None
+        assert rv.data == csv_data
+
+        # So do requests for departments whose data changed since it was rendered
+        officer = Officer.query.filter_by(department_id=department.id).first()
+        officer.first_name = "Renamed"
+        session.commit()
+        rv = client.get(url, headers=accept_gzip)
+        assert rv.status_code == HTTPStatus.OK
+        assert rv.content_encoding is None
+
+
+def test_department_archive(client, session):
+    with current_app.test_request_context():
+        department = Department.query.first()
+        dept_name = department.name.replace(" ", "_")
+
+        rv = client.get(
+            url_for("main.download_dept_archive", department_id=department.id)
+        )
+
+        assert rv.status_code == HTTPStatus.OK
+        assert rv.mimetype == "application/zip"
+        assert rv.is_streamed
+        archive = ZipFile(BytesIO(rv.data))
+        assert len(archive.namelist()) == 6
+        officers_csv = client.get(
+            url_for("main.download_dept_officers_csv", department_id=department.id)
+        ).data
+        assert archive.read(f"{dept_name}_Officers.csv") == officers_csv
+
+
+def test_all_departments_archive(client, session):
+    with current_app.test_request_context():
+        rv = client.get(url_for("main.download_all_departments_archive"))
+
+        assert rv.status_code == HTTPStatus.OK
+        names = ZipFile(BytesIO(rv.data)).namelist()
+        folders = {name.split("/")[0] for name in names}
+        department = Department.query.first()
+        assert f"{department.id}_{department.name.replace(' ', '_')}" in folders
+        assert len(names) == 6 * len(folders)
+
+
+def test_links_csv_lists_department_officers(client, session):
+    with current_app.test_request_context():
+        department, other_department = Department.query.limit(2).all()
+        officer = Officer.query.filter_by(department_id=department.id).first()
+        other_officer = Officer.query.filter_by(
+            department_id=other_department.id
+        ).first()
+        link = Link(
+            title="Shared link",
+            url="https://example.org/shared",
+            link_type="link",
+            officers=[officer, other_officer],
+        )
+        session.add(link)
+        session.commit()
+        link_id, officer_id = link.id, officer.id
+
+        rv = client.get(
+            url_for("main.download_dept_links_csv", department_id=department.id)
+        )
+
+        rows = list(csv.DictReader(rv.data.decode(ENCODING_UTF_8).split("\n")))
+        assert [row["officers"] for row in rows if row["id"] == str(link_id)] == [
+            f"[{officer_id}]"
+        ]
+
+
+def test_incidents_csv_describes_related_rows(session):
+    by_id = attrgetter("id")
+    department = Department.query.first()
+    expected = {}
+    for incident in Incident.query.filter_by(department_id=department.id):
+        expected[str(incident.id)] = {
+            "location": str(incident.address) if incident.address else "",
+            "licenses": " ".join(
+                str(plate) for plate in sorted(incident.license_plates, key=by_id)
+            ),
+            "links": " ".join(str(link) for link in sorted(incident.links, key=by_id)),
+            "officers": " ".join(
+                str(officer) for officer in sorted(incident.officers, key=by_id)
+            ),
+        }
+    assert any(all(values.values()) for values in expected.values())
+
+    csv_data = department_csv(department.id, KEY_DEPT_ALL_INCIDENTS)
+    rows = csv.DictReader(StringIO(csv_data.decode(ENCODING_UTF_8)))
+    assert {
+        row["id"]: {field: row[field] for field in expected[row["id"]]} for row in rows
+    } == expected
+
+
 def test_browse_filtering_filters_bad(client, session):
     with current_app.test_request_context():
         race_list = ["BLACK", "WHITE"]
@@ -2772,8 +3211,7 @@ def test_admin_can_delete_link_from_officer_profile(client, session):
         # Officer from department with id AC_DEPT and some links
         officer = (
             Officer.query.filter_by(department_id=AC_DEPT)
-            .outerjoin(Officer.links)
-            .filter(Officer.links is not None)
+            .filter(Officer.links.any())
             .first()
         )
         cache_params = (Department(id=officer.department_id), KEY_DEPT_ALL_LINKS)
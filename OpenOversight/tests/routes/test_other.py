@@ -4,9 +4,10 @@ from http import HTTPStatus
 import pytest
 from flask import current_app, url_for
 
+from OpenOversight.app.models.database import Department, Officer
 from OpenOversight.app.utils.constants import ENCODING_UTF_8, KEY_TIMEZONE
 from OpenOversight.tests.constants import GENERAL_USER_USERNAME
-from OpenOversight.tests.routes.route_helpers import login_user
+from OpenOversight.tests.routes.route_helpers import count_queries, login_user
 
 
 @pytest.mark.parametrize(
@@ -89,3 +90,33 @@ def test_timezone_setting_empty_string(client):
         assert rv.status_code == HTTPStatus.OK
         with client.session_transaction() as session:
             assert session[KEY_TIMEZONE] == current_app.config.get(KEY_TIMEZONE)
+
+
+@pytest.mark.parametrize(
+    "endpoint, incidents_endpoint",
+    [
+        ("main.browse", "main.incident_api"),
+        ("main.all_data", "main.download_incidents_csv"),
+    ],
+)
+def test_department_listings_use_one_query(
+    endpoint, incidents_endpoint, client, session
+):
+    with current_app.test_request_context():
+        department = Department(name="Quiet PD", short_name="QPD", state="IL")
+        session.add(department)
+        session.flush()
+        session.add(Officer(department_id=department.id, last_name="Quiet"))
+        session.commit()
+
+        with count_queries() as statements:
+            rv = client.get(url_for(endpoint))
+        assert rv.status_code == HTTPStatus.OK
+        assert len(statements) == 1, statements
+
+        page = rv.data.decode(ENCODING_UTF_8)
+        for listed in Department.query.filter(Department.officers.any()):
+            url = url_for(incidents_endpoint, department_id=listed.id)
+            assert (f'href="{url}"' in page or f"href={url}>" in page) == bool(
+                listed.incidents
+            )
@@ -592,8 +592,7 @@ def test_redirect_link(client, session, source_route, target_route):
         login_admin(client)
         officer = (
             Officer.query.filter_by(department_id=AC_DEPT)
-            .outerjoin(Officer.links)
-            .filter(Officer.links is not None)
+            .filter(Officer.links.any())
             .first()
         )
         resp_no_redirect = client.get(
@@ -1,4 +1,5 @@
 import csv
+import gzip
 import operator
 import os
 import random
@@ -9,6 +10,8 @@ from datetime import date, time
 import pandas as pd
 import pytest
 from click.testing import CliRunner
+from flask import current_app
+from sqlalchemy import update
 from sqlalchemy.orm.exc import MultipleResultsFound
 
 from OpenOversight.app.commands import (
@@ -17,19 +20,28 @@ from OpenOversight.app.commands import (
     advanced_csv_import,
     bulk_add_officers,
     create_officer_from_row,
+    refresh_department_stats_command,
+    render_exports_command,
 )
+from OpenOversight.app.main.downloads import department_csv, export_path
 from OpenOversight.app.models.database import (
     Assignment,
     Department,
+    DepartmentStats,
     Incident,
     Job,
+    LicensePlate,
     Link,
+    Location,
     Officer,
     Salary,
+    Tombstone,
     Unit,
     User,
 )
+from OpenOversight.app.models.database_imports import ImportContext
 from OpenOversight.app.utils.choices import DEPARTMENT_STATE_CHOICES
+from OpenOversight.app.utils.constants import KEY_DEPT_ALL_SALARIES, KEY_EXPORTS_DIR
 from OpenOversight.app.utils.db import get_officer
 from OpenOversight.tests.conftest import (
     AC_DEPT,
@@ -39,6 +51,7 @@ from OpenOversight.tests.conftest import (
     generate_officer,
 )
 from OpenOversight.tests.constants import FILE_MODE_WRITE, GENERAL_USER_EMAIL
+from OpenOversight.tests.routes.route_helpers import count_queries
 
 
 def run_command_print_output(cli, args=None, **kwargs):
@@ -630,6 +643,37 @@ def test_bulk_add_officers__duplicate_name(session, department, csv_path):
     assert isinstance(result.exception, MultipleResultsFound)
 
 
+def test_bulk_add_officers__matches_without_query_per_row(
+    session, department, csv_path
+):
+    user = User.query.filter_by(email=GENERAL_USER_EMAIL).first()
+    officers = [generate_officer(department, user, True) for _ in range(3)]
+    session.add_all(officers)
+    session.commit()
+    rows = [
+        {
+            "department_id": department.id,
+            "first_name": officer.first_name,
+            "last_name": officer.last_name,
+            "unique_internal_identifier": officer.unique_internal_identifier,
+        }
+        for officer in officers
+    ]
+
+    def count_import_queries(csv_rows):
+        with open(csv_path, FILE_MODE_WRITE) as f:
+            csv_writer = csv.DictWriter(f, fieldnames=list(csv_rows[0].keys()))
+            csv_writer.writeheader()
+            csv_writer.writerows(csv_rows)
+        with count_queries() as statements:
+            result = run_command_print_output(bulk_add_officers, [csv_path])
+        assert result.exception is None
+        return len(statements)
+
+    # the officers of the department are indexed once, not looked up per row
+    assert count_import_queries(rows[:1]) == count_import_queries(rows)
+
+
 def test_bulk_add_officers__write_static_null_field(
     session, department, csv_path, monkeypatch
 ):
@@ -837,7 +881,10 @@ def test_bulk_add_officers__no_create_flag(
     assert officer.gender == officer_gender_updated
 
 
-def test_advanced_csv_import__success(session, department, test_csv_dir):
+@pytest.mark.parametrize(
+    "import_flags", [[], ["--bulk"], ["--workers", "2"], ["--bulk", "--workers", "2"]]
+)
+def test_advanced_csv_import__success(session, department, test_csv_dir, import_flags):
     user = User.query.filter_by(email=GENERAL_USER_EMAIL).first()
     # make sure department name aligns with the csv files
     assert department.name == SPRINGFIELD_PD.name
@@ -915,6 +962,7 @@ def test_advanced_csv_import__success(session, department, test_csv_dir):
             os.path.join(test_csv_dir, "links.csv"),
             "--incidents-csv",
             os.path.join(test_csv_dir, "incidents.csv"),
+            *import_flags,
         ],
     )
 
@@ -1048,7 +1096,8 @@ def _create_csv(data, path, csv_file_name):
     return csv_path
 
 
-def test_advanced_csv_import__force_create(session, department, tmp_path):
+@pytest.mark.parametrize("import_flags", [[], ["--bulk"]])
+def test_advanced_csv_import__force_create(session, department, tmp_path, import_flags):
     user = User.query.filter_by(email=GENERAL_USER_EMAIL).first()
     tmp_path = str(tmp_path)
 
@@ -1149,6 +1198,7 @@ def test_advanced_csv_import__force_create(session, department, tmp_path):
             "--links-csv",
             links_csv,
             "--force-create",
+            *import_flags,
         ],
     )
 
@@ -1178,7 +1228,10 @@ def test_advanced_csv_import__force_create(session, department, tmp_path):
     assert cop1.links[0] == link
 
 
-def test_advanced_csv_import__overwrite_assignments(session, department, tmp_path):
+@pytest.mark.parametrize("import_flags", [[], ["--bulk"]])
+def test_advanced_csv_import__overwrite_assignments(
+    session, department, tmp_path, import_flags
+):
     tmp_path = str(tmp_path)
     user = User.query.filter_by(email=GENERAL_USER_EMAIL).first()
 
@@ -1268,6 +1321,7 @@ def test_advanced_csv_import__overwrite_assignments(session, department, tmp_pat
             "--assignments-csv",
             assignments_csv,
             "--overwrite-assignments",
+            *import_flags,
         ],
     )
 
@@ -1280,6 +1334,12 @@ def test_advanced_csv_import__overwrite_assignments(session, department, tmp_pat
     assert len(cop1.assignments) == 1
     assert cop1.assignments[0].star_no == b1
 
+    # the replaced assignment is listed as deleted by the change feed
+    assert [
+        (tombstone.record_id, tombstone.department_id)
+        for tombstone in Tombstone.query.filter_by(table_name="assignments")
+    ] == [(a1_id, department.id)]
+
     cop2 = session.get(Officer, cop2_id)
     assert len(cop2.assignments) == 1
     assert cop2.assignments[0] == session.get(Assignment, a2_id)
@@ -1290,6 +1350,330 @@ def test_advanced_csv_import__overwrite_assignments(session, department, tmp_pat
     assert cop3.assignments[0].job.job_title == "Police Officer"
 
 
+@pytest.mark.parametrize("import_flags", [[], ["--bulk"]])
+def test_advanced_csv_import__shared_lookups(
+    session, department, tmp_path, import_flags
+):
+    officer = Officer.query.filter_by(department_id=department.id).first()
+    assignments_data = [
+        {
+            "id": "",
+            "officer_id": officer.id,
+            "job_title": job_title,
+            "unit_name": unit_name,
+        }
+        for job_title, unit_name in (
+            ("Chief Inspector", "Night Watch"),
+            (" chief inspector", "night watch "),
+        )
+    ]
+    assignments_csv = _create_csv(assignments_data, tmp_path, "assignments.csv")
+    incidents_data = [
+        {
+            "id": f"#{n}",
+            "department_name": department.name,
+            "department_state": department.state,
+            "street_name": "Shared Street",
+            "city": "Chicago",
+            "state": "IL",
+            "license_plates": "SHARED1_IL",
+        }
+        for n in range(3)
+    ]
+    incidents_csv = _create_csv(incidents_data, tmp_path, "incidents.csv")
+
+    result = run_command_print_output(
+        advanced_csv_import,
+        [
+            department.name,
+            department.state,
+            "--assignments-csv",
+            assignments_csv,
+            "--incidents-csv",
+            incidents_csv,
+            *import_flags,
+        ],
+    )
+
+    assert result.exception is None
+    assert (
+        Job.query.filter_by(
+            department_id=department.id, job_title="Chief Inspector"
+        ).count()
+        == 1
+    )
+    assert (
+        Unit.query.filter_by(
+            department_id=department.id, description="Night Watch"
+        ).count()
+        == 1
+    )
+    assert Location.query.filter_by(street_name="Shared Street").count() == 1
+    assert LicensePlate.query.filter_by(number="SHARED1").count() == 1
+    incidents = Incident.query.filter(
+        Incident.address.has(street_name="Shared Street")
+    ).all()
+    assert len(incidents) == 3
+    assert all(
+        [plate.number for plate in incident.license_plates] == ["SHARED1"]
+        for incident in incidents
+    )
+
+
+@pytest.mark.parametrize("import_flags", [[], ["--bulk"], ["--workers", "2"]])
+def test_advanced_csv_import__invalid_rows(session, department, tmp_path, import_flags):
+    officers_data = [
+        {
+            "id": "#1",
+            "department_name": department.name,
+            "department_state": department.state,
+            "last_name": "Valid",
+            "birth_year": "1970",
+            "employment_date": "2010-01-01",
+        },
+        {
+            "id": "#2",
+            "department_name": department.name,
+            "department_state": department.state,
+            "last_name": "Invalid",
+            "birth_year": "nineteen seventy",
+            "employment_date": "2010-01-01",
+        },
+        {
+            "id": "not a number",
+            "department_name": department.name,
+            "department_state": department.state,
+            "last_name": "Invalid",
+            "birth_year": "1970",
+            "employment_date": "someday",
+        },
+    ]
+    officers_csv = _create_csv(officers_data, tmp_path, "officers.csv")
+
+    result = run_command_print_output(
+        advanced_csv_import,
+        [
+            department.name,
+            department.state,
+            "--officers-csv",
+            officers_csv,
+            *import_flags,
+        ],
+    )
+
+    # all invalid rows are reported together, and nothing is imported
+    assert result.exception is not None
+    message = str(result.exception)
+    assert "Found 2 invalid row(s) in officers csv" in message
+    assert "line 3: birth_year:" in message
+    assert "line 4: id:" in message
+    assert "employment_date:" in message
+    assert Officer.query.filter_by(last_name="Valid").count() == 0
+
+
+@pytest.mark.parametrize("import_flags", [[], ["--bulk"]])
+def test_advanced_csv_import__invalid_references(
+    session, department, department_without_officers, tmp_path, import_flags
+):
+    user = User.query.filter_by(email=GENERAL_USER_EMAIL).first()
+    officer = generate_officer(department, user)
+    session.add(officer)
+    session.add(department_without_officers)
+    session.flush()
+    unit = Unit(department_id=department_without_officers.id, created_by=user.id)
+    session.add(unit)
+    session.flush()
+    assignment_count = Assignment.query.filter_by(officer_id=officer.id).count()
+
+    assignments_data = [
+        {"id": "", "officer_id": 999999, "job_title": RANK_CHOICES_1[1]},
+        {"id": "", "officer_id": officer.id, "job_title": RANK_CHOICES_1[1]},
+        {
+            "id": "",
+            "officer_id": officer.id,
+            "job_title": RANK_CHOICES_1[1],
+            "unit_id": unit.id,
+        },
+    ]
+    assignments_csv = _create_csv(assignments_data, tmp_path, "assignments.csv")
+
+    result = run_command_print_output(
+        advanced_csv_import,
+        [department.name, "--assignments-csv", assignments_csv, *import_flags],
+    )
+
+    # rows referring to unknown officers or units are reported like invalid values
+    assert result.exception is not None
+    message = str(result.exception)
+    assert "Found 2 invalid row(s) in assignments csv" in message
+    assert "line 2: Officer with id 999999 does not exist" in message
+    assert f"line 4: unit_id: unit {unit.id} does not exist" in message
+    assert Assignment.query.filter_by(officer_id=officer.id).count() == assignment_count
+
+
+@pytest.mark.parametrize("import_flags", [[], ["--bulk"]])
+def test_advanced_csv_import__update_salary_keeps_cents(
+    session, department, tmp_path, import_flags
+):
+    user = User.query.filter_by(email=GENERAL_USER_EMAIL).first()
+    officer = generate_officer(department, user)
+    session.add(officer)
+    session.flush()
+    salary = Salary(
+        officer_id=officer.id,
+        salary=30000,
+        overtime_pay=100,
+        year=2018,
+        is_fiscal_year=False,
+        created_by=user.id,
+    )
+    session.add(salary)
+    session.flush()
+
+    salaries_data = [
+        {
+            "id": salary.id,
+            "officer_id": officer.id,
+            "salary": "31000.55",
+            "overtime_pay": "120.25",
+            "year": 2018,
+            "is_fiscal_year": "False",
+        }
+    ]
+    salaries_csv = _create_csv(salaries_data, tmp_path, "salaries.csv")
+    result = run_command_print_output(
+        advanced_csv_import,
+        [department.name, "--salaries-csv", salaries_csv, *import_flags],
+    )
+
+    # updated salaries are not truncated to whole numbers, just like new ones
+    assert result.exception is None
+    session.refresh(salary)
+    assert salary.salary == 31000.55
+    assert salary.overtime_pay == 120.25
+
+
+def test_advanced_csv_import__resume_chunked(session, department, tmp_path):
+    officers_data = [
+        {
+            "id": f"#{n}",
+            "department_name": department.name,
+            "department_state": department.state,
+            "last_name": "Chunked",
+            "first_name": f"Officer{n}",
+        }
+        for n in range(3)
+    ]
+    officers_csv = _create_csv(officers_data, tmp_path, "officers.csv")
+    assignments_data = [
+        {"id": "", "officer_id": officer_id, "job_title": "Chunked Title"}
+        for officer_id in ("#0", "#1", "#unknown")
+    ]
+    assignments_csv = _create_csv(assignments_data, tmp_path, "assignments.csv")
+    checkpoint = os.path.join(str(tmp_path), "checkpoint.json")
+    import_args = [
+        department.name,
+        department.state,
+        "--officers-csv",
+        officers_csv,
+        "--assignments-csv",
+        assignments_csv,
+        "--chunk-size",
+        "1",
+        "--checkpoint",
+        checkpoint,
+    ]
+
+    result = run_command_print_output(advanced_csv_import, import_args)
+
+    # the officers were committed before the assignments failed
+    assert result.exception is not None
+    assert "Officer with id #unknown does not exist" in str(result.exception)
+    assert os.path.exists(checkpoint)
+    assert Officer.query.filter_by(last_name="Chunked").count() == 3
+
+    assignments_data[2]["officer_id"] = "#2"
+    _create_csv(assignments_data, tmp_path, "assignments.csv")
+    result = run_command_print_output(advanced_csv_import, [*import_args, "--resume"])
+
+    assert result.exception is None
+    assert not os.path.exists(checkpoint)
+    officers = Officer.query.filter_by(last_name="Chunked").all()
+    assert len(officers) == 3
+    assert all(
+        [assignment.job.job_title for assignment in officer.assignments]
+        == ["Chunked Title"]
+        for officer in officers
+    )
+
+
+def test_advanced_csv_import__existing_checkpoint(session, department, tmp_path):
+    checkpoint = os.path.join(str(tmp_path), "checkpoint.json")
+    with open(checkpoint, FILE_MODE_WRITE) as f:
+        f.write("{}")
+
+    result = run_command_print_output(
+        advanced_csv_import,
+        [
+            department.name,
+            department.state,
+            "--chunk-size",
+            "10",
+            "--checkpoint",
+            checkpoint,
+        ],
+    )
+
+    assert result.exception is not None
+    assert "use --resume to continue that import" in str(result.exception)
+
+
+def test_import_context_reuses_lookups(session, department):
+    context = ImportContext()
+    location_data = {"street_name": "Context Street", "city": "Chicago", "state": "IL"}
+    plate_data = {"number": "CTX1", "state": "IL"}
+
+    assert context.user_id == User.query.filter_by(is_administrator=True).first().id
+    location = context.get_or_create_location(location_data)
+    assert context.get_or_create_location(dict(location_data)) is location
+    assert context.get_or_create_location({"street_name": ""}) is None
+    plate = context.get_or_create_license_plate(plate_data)
+    assert context.get_or_create_license_plate(dict(plate_data)) is plate
+    job_id = context.get_or_create_job_id(department.id, "Context Rank")
+    assert context.get_or_create_job_id(department.id, " context rank ") == job_id
+    unit_id = context.get_or_create_unit_id(department.id, "Context Unit")
+    assert context.department_unit_ids(department.id)["context unit"] == unit_id
+
+
+def test_advanced_csv_import__bulk_duplicate_id(session, department, tmp_path):
+    officer = Officer.query.filter_by(department_id=department.id).first()
+    officers_data = [
+        {
+            "id": officer.id,
+            "department_name": department.name,
+            "department_state": department.state,
+            "first_name": first_name,
+        }
+        for first_name in ("John", "Jane")
+    ]
+    officers_csv = _create_csv(officers_data, tmp_path, "officers.csv")
+
+    result = run_command_print_output(
+        advanced_csv_import,
+        [
+            department.name,
+            department.state,
+            "--officers-csv",
+            officers_csv,
+            "--bulk",
+        ],
+    )
+
+    # rows are merged with one statement, so each can only be listed once
+    assert result.exception is not None
+    assert "more than once" in str(result.exception)
+
+
 def test_advanced_csv_import__extra_fields_officers(session, department, tmp_path):
     # create csv with invalid field 'name'
     officers_data = [
@@ -1374,8 +1758,9 @@ def test_advanced_csv_import__wrong_department(session, department, tmp_path):
     assert result.exit_code != 0
 
 
+@pytest.mark.parametrize("import_flags", [[], ["--bulk"]])
 def test_advanced_csv_import__update_officer_different_department(
-    session, department, tmp_path
+    session, department, tmp_path, import_flags
 ):
     user = User.query.filter_by(email=GENERAL_USER_EMAIL).first()
     # set up data
@@ -1410,7 +1795,7 @@ def test_advanced_csv_import__update_officer_different_department(
     # run command
     result = run_command_print_output(
         advanced_csv_import,
-        [str(department.name), "--officers-csv", officers_csv],
+        [str(department.name), "--officers-csv", officers_csv, *import_flags],
     )
 
     # command fails because the officer is assigned to a different department
@@ -1419,8 +1804,9 @@ def test_advanced_csv_import__update_officer_different_department(
     assert result.exit_code != 0
 
 
+@pytest.mark.parametrize("import_flags", [[], ["--bulk"]])
 def test_advanced_csv_import__unit_other_department(
-    session, department, department_without_officers, tmp_path
+    session, department, department_without_officers, tmp_path, import_flags
 ):
     user = User.query.filter_by(email=GENERAL_USER_EMAIL).first()
     # set up data
@@ -1445,7 +1831,7 @@ def test_advanced_csv_import__unit_other_department(
     assignments_csv = _create_csv(assignments_data, tmp_path, "assignments.csv")
     result = run_command_print_output(
         advanced_csv_import,
-        [department.name, "--assignments-csv", assignments_csv],
+        [department.name, "--assignments-csv", assignments_csv, *import_flags],
     )
 
     # command fails because the unit does not belong to the department
@@ -1476,3 +1862,58 @@ def test_create_officer_from_row_adds_new_officer_and_normalizes_gender(
         assert lookup_officer is not None
         # Was the gender properly normalized?
         assert lookup_officer.gender == "F"
+
+
+def test_render_exports(session, department, tmp_path, monkeypatch):
+    monkeypatch.setitem(current_app.config, KEY_EXPORTS_DIR, str(tmp_path))
+    department_count = Department.query.count()
+
+    result = run_command_print_output(render_exports_command)
+    assert result.exit_code == 0
+    assert f"exports of {department_count} departments" in result.output
+    files = sorted(os.listdir(tmp_path / str(department.id)))
+    assert len(files) == 6
+
+    # Departments whose data did not change are not rendered again
+    result = run_command_print_output(render_exports_command)
+    assert "exports of 0 departments" in result.output
+
+    officer = Officer.query.filter_by(department_id=department.id).first()
+    session.add(Salary(officer=officer, salary=100, year=2020, is_fiscal_year=False))
+    session.commit()
+    result = run_command_print_output(render_exports_command)
+    assert "exports of 1 departments" in result.output
+    new_files = sorted(os.listdir(tmp_path / str(department.id)))
+    assert len(new_files) == 6
+    assert not set(files) & set(new_files)
+
+    salaries_path = export_path(
+        department.id, KEY_DEPT_ALL_SALARIES, department.stats.generation
+    )
+    with gzip.open(salaries_path) as salaries_file:
+        assert salaries_file.read() == department_csv(
+            department.id, KEY_DEPT_ALL_SALARIES
+        )
+
+
+def test_render_exports_requires_exports_dir(session, monkeypatch):
+    monkeypatch.setitem(current_app.config, KEY_EXPORTS_DIR, None)
+    result = run_command_print_output(render_exports_command)
+    assert result.exit_code != 0
+    assert KEY_EXPORTS_DIR in result.output
+
+
+def test_refresh_department_stats(session, department):
+    officer_count = Officer.query.filter_by(department_id=department.id).count()
+    session.execute(
+        update(DepartmentStats)
+        .where(DepartmentStats.department_id == department.id)
+        .values(officers=0)
+    )
+
+    result = run_command_print_output(
+        refresh_department_stats_command, ["--department-id", str(department.id)]
+    )
+    assert result.exit_code == 0
+    stats = session.get(DepartmentStats, department.id, populate_existing=True)
+    assert stats.officers == officer_count
@@ -1,7 +1,11 @@
+import fnmatch
+import pickle
 import random
+import time
 from datetime import date
 from http import HTTPStatus
 
+import pytest
 from flask import current_app, url_for
 
 from OpenOversight.app.main.forms import (
@@ -12,26 +16,43 @@ from OpenOversight.app.main.forms import (
     LinkForm,
     LocationForm,
 )
-from OpenOversight.app.models.database import Department, Incident, Job, Officer
+from OpenOversight.app.models.database import Department, Incident, Job, Officer, Unit
 from OpenOversight.app.models.database_cache import (
+    CACHE_EVICTIONS,
+    CACHE_HITS,
+    CACHE_INVALIDATIONS,
+    CACHE_MISSES,
     DB_CACHE,
+    DB_CACHE_STATS,
+    CacheKey,
+    LocalCache,
+    RedisCache,
+    SQLiteCache,
+    create_database_cache_backend,
+    database_cache_usage,
     get_database_cache_entry,
     get_model_cache_key,
     has_database_cache_entry,
+    purge_database_cache,
     put_database_cache_entry,
+    remove_database_cache_entries,
+    weighted_size,
 )
 from OpenOversight.app.utils.choices import GENDER_CHOICES, RACE_CHOICES, STATE_CHOICES
 from OpenOversight.app.utils.constants import (
     ENCODING_UTF_8,
     KEY_DEPT_ALL_ASSIGNMENTS,
     KEY_DEPT_ALL_INCIDENTS,
+    KEY_DEPT_ALL_JOBS,
     KEY_DEPT_ALL_OFFICERS,
-    KEY_DEPT_TOTAL_ASSIGNMENTS,
-    KEY_DEPT_TOTAL_INCIDENTS,
-    KEY_DEPT_TOTAL_OFFICERS,
+    KEY_DEPT_ALL_UNITS,
+)
+from OpenOversight.app.utils.db import department_jobs, department_units, unit_choices
+from OpenOversight.tests.routes.route_helpers import (
+    login_ac,
+    login_admin,
+    process_form_data,
 )
-from OpenOversight.app.utils.db import unit_choices
-from OpenOversight.tests.routes.route_helpers import login_admin, process_form_data
 
 
 def test_get_database_cache_entry(faker):
@@ -71,15 +92,12 @@ def test_documented_assignments(mockdata, client, faker):
     with current_app.test_request_context():
         login_admin(client)
         department = Department.query.first()
-        department.total_documented_assignments()
-        department.total_documented_incidents()
-        department.total_documented_officers()
+        assignments = department.total_documented_assignments()
+        incidents = department.total_documented_incidents()
+        officers = department.total_documented_officers()
         put_database_cache_entry(department, KEY_DEPT_ALL_ASSIGNMENTS, 1)
 
         assert has_database_cache_entry(department, KEY_DEPT_ALL_ASSIGNMENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_ASSIGNMENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_INCIDENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_OFFICERS) is True
 
         officer = Officer.query.first()
         job = Job.query.filter_by(
@@ -100,25 +118,22 @@ def test_documented_assignments(mockdata, client, faker):
         )
 
         assert "Added new assignment" in rv.data.decode(ENCODING_UTF_8)
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_ASSIGNMENTS) is False
         assert has_database_cache_entry(department, KEY_DEPT_ALL_ASSIGNMENTS) is False
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_INCIDENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_OFFICERS) is True
+        assert department.total_documented_assignments() == assignments + 1
+        assert department.total_documented_incidents() == incidents
+        assert department.total_documented_officers() == officers
 
 
 def test_documented_incidents(mockdata, client, faker):
     with current_app.test_request_context():
         login_admin(client)
         department = Department.query.first()
-        department.total_documented_assignments()
-        department.total_documented_incidents()
-        department.total_documented_officers()
+        assignments = department.total_documented_assignments()
+        incidents = department.total_documented_incidents()
+        officers = department.total_documented_officers()
         put_database_cache_entry(department, KEY_DEPT_ALL_INCIDENTS, 1)
 
         assert has_database_cache_entry(department, KEY_DEPT_ALL_INCIDENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_ASSIGNMENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_INCIDENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_OFFICERS) is True
 
         test_date = faker.date_time()
 
@@ -153,24 +168,21 @@ def test_documented_incidents(mockdata, client, faker):
         assert rv.status_code == HTTPStatus.OK
         assert "created" in rv.data.decode(ENCODING_UTF_8)
         assert has_database_cache_entry(department, KEY_DEPT_ALL_INCIDENTS) is False
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_ASSIGNMENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_INCIDENTS) is False
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_OFFICERS) is True
+        assert department.total_documented_assignments() == assignments
+        assert department.total_documented_incidents() == incidents + 1
+        assert department.total_documented_officers() == officers
 
 
 def test_documented_officers(mockdata, client, faker):
     with current_app.test_request_context():
         login_admin(client)
         department = Department.query.first()
-        department.total_documented_assignments()
-        department.total_documented_incidents()
-        department.total_documented_officers()
+        assignments = department.total_documented_assignments()
+        incidents = department.total_documented_incidents()
+        officers = department.total_documented_officers()
         put_database_cache_entry(department, KEY_DEPT_ALL_OFFICERS, 1)
 
         assert has_database_cache_entry(department, KEY_DEPT_ALL_OFFICERS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_ASSIGNMENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_INCIDENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_OFFICERS) is True
 
         links = [
             LinkForm(url=faker.url(), link_type="link").data,
@@ -200,6 +212,269 @@ def test_documented_officers(mockdata, client, faker):
 
         assert f"New Officer {last_name} added" in rv.data.decode(ENCODING_UTF_8)
         assert has_database_cache_entry(department, KEY_DEPT_ALL_OFFICERS) is False
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_ASSIGNMENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_INCIDENTS) is True
-        assert has_database_cache_entry(department, KEY_DEPT_TOTAL_OFFICERS) is False
+        assert department.total_documented_assignments() == assignments + 1
+        assert department.total_documented_incidents() == incidents
+        assert department.total_documented_officers() == officers + 1
+
+
+def test_department_choices(mockdata, session):
+    """Test that cached job and unit choices are dropped when jobs or units change."""
+    department = Department.query.first()
+
+    jobs = department_jobs(department.id)
+    units = department_units(department.id)
+    assert department_jobs(department.id) == jobs
+    assert department_units(department.id) == units
+
+    session.add(Job(job_title="Cadet", order=99, department_id=department.id))
+    session.commit()
+    assert has_database_cache_entry(department, KEY_DEPT_ALL_JOBS) is False
+    assert has_database_cache_entry(department, KEY_DEPT_ALL_UNITS) is True
+    assert "Cadet" in [job.job_title for job in department_jobs(department.id)]
+
+    unit = Unit.query.filter_by(department_id=department.id).first()
+    unit.description = "Renamed Unit"
+    session.commit()
+    assert has_database_cache_entry(department, KEY_DEPT_ALL_UNITS) is False
+    assert "Renamed Unit" in [
+        unit.description for unit in department_units(department.id)
+    ]
+
+
+class FakeRedis:
+    """Stand-in for the part of the redis client RedisCache uses, whose instances
+    share storage the way clients of one server do.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def get(self, name):
+        value, expires_at = self.server.get(name, (None, None))
+        return value if expires_at is None or expires_at > time.time() else None
+
+    def exists(self, *names):
+        return sum(self.get(name) is not None for name in names)
+
+    def set(self, name, value, ex=None):
+        self.server[name] = (value, time.time() + ex if ex is not None else None)
+
+    def delete(self, *names):
+        # Like redis, accept the bytes that scan_iter returns
+        names = [name.decode() if isinstance(name, bytes) else name for name in names]
+        return sum(self.server.pop(name, None) is not None for name in names)
+
+    def strlen(self, name):
+        value = self.get(name)
+        return len(value) if value is not None else 0
+
+    def scan_iter(self, match="*"):
+        return iter(
+            [name.encode() for name in self.server if fnmatch.fnmatch(name, match)]
+        )
+
+
+@pytest.mark.parametrize(
+    "make_backend",
+    [
+        lambda tmp_path, server: SQLiteCache(str(tmp_path / "db_cache.sqlite")),
+        lambda tmp_path, server: RedisCache(client=FakeRedis(server)),
+    ],
+    ids=["sqlite", "redis"],
+)
+def test_shared_cache_backends(make_backend, tmp_path, monkeypatch):
+    """Test that workers using a shared backend see each other's writes and removals."""
+    server = {}
+    worker, other_worker = (
+        make_backend(tmp_path, server),
+        make_backend(tmp_path, server),
+    )
+    department = Department(id=1)
+    key = get_model_cache_key(department, KEY_DEPT_ALL_OFFICERS)
+
+    worker[key] = [("Officer", 1)]
+    assert other_worker[key] == [("Officer", 1)]
+    assert key in other_worker
+    # Checking for an entry does not read its payload
+    monkeypatch.setattr(other_worker, "_load", None)
+    assert key in other_worker
+    monkeypatch.undo()
+    assert list(other_worker) == ["1:all_department_officers:Department"]
+    assert list(other_worker.entry_sizes()) == [
+        (
+            CacheKey(1, KEY_DEPT_ALL_OFFICERS, "Department"),
+            len(pickle.dumps([("Officer", 1)], pickle.HIGHEST_PROTOCOL)),
+        )
+    ]
+
+    del other_worker[key]
+    assert key not in worker
+    assert worker.get(key) is None
+    with pytest.raises(KeyError):
+        del worker[key]
+
+    worker[key] = 1
+    other_worker.clear()
+    assert len(worker) == 0
+
+
+def test_expired_shared_cache_entries(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "db_cache.sqlite"), ttl=-1)
+    cache[get_model_cache_key(Department(id=1), KEY_DEPT_ALL_OFFICERS)] = 1
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize(
+    "make_cache",
+    [
+        lambda tmp_path, max_bytes: LocalCache(max_bytes),
+        lambda tmp_path, max_bytes: SQLiteCache(
+            str(tmp_path / "db_cache.sqlite"), max_bytes
+        ),
+    ],
+    ids=["local", "sqlite"],
+)
+def test_cache_byte_budget(make_cache, tmp_path):
+    """Test that caches evict the oldest entries to stay within their byte budget."""
+    DB_CACHE_STATS.reset()
+    payload = b"x" * 1000
+    pickled = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+    jobs_keys = [
+        get_model_cache_key(Department(id=i), KEY_DEPT_ALL_JOBS) for i in range(3)
+    ]
+    officers_key = get_model_cache_key(Department(id=1), KEY_DEPT_ALL_OFFICERS)
+    # Exports are charged more than choice lists of the same size
+    assert weighted_size(officers_key, pickled) > weighted_size(jobs_keys[0], pickled)
+    cache = make_cache(tmp_path, 3 * weighted_size(jobs_keys[0], pickled))
+
+    for key in jobs_keys:
+        cache[key] = payload
+        time.sleep(0.01)
+    assert all(key in cache for key in jobs_keys)
+
+    cache[officers_key] = payload
+    assert cache[officers_key] == payload
+    assert [key in cache for key in jobs_keys] == [False, False, True]
+    assert DB_CACHE_STATS.counts[KEY_DEPT_ALL_JOBS][CACHE_EVICTIONS] == 2
+
+    # Clearing the cache is not an eviction
+    cache.clear()
+    assert DB_CACHE_STATS.counts[KEY_DEPT_ALL_JOBS][CACHE_EVICTIONS] == 2
+    cache[officers_key] = payload
+
+    # Entries larger than the whole budget are not kept
+    cache[officers_key] = payload * 10
+    assert officers_key not in cache
+
+
+def test_downloads_cache_csv_bytes(mockdata, client):
+    with current_app.test_request_context():
+        department = Department.query.first()
+
+        rv = client.get(
+            url_for("main.download_dept_officers_csv", department_id=department.id)
+        )
+
+        assert rv.status_code == HTTPStatus.OK
+        # The CSV is cached once it has been streamed in full
+        csv_bytes = rv.data
+        assert get_database_cache_entry(department, KEY_DEPT_ALL_OFFICERS) == csv_bytes
+
+
+def test_create_database_cache_backend(tmp_path):
+    assert isinstance(create_database_cache_backend(None), LocalCache)
+    assert isinstance(
+        create_database_cache_backend(f"sqlite:///{tmp_path}/db_cache.sqlite"),
+        SQLiteCache,
+    )
+    with pytest.raises(ValueError):
+        create_database_cache_backend("memcached://localhost")
+
+
+def test_database_cache_uses_configured_backend(tmp_path):
+    backend = DB_CACHE.backend
+    try:
+        DB_CACHE.backend = SQLiteCache(str(tmp_path / "db_cache.sqlite"))
+        department = Department(id=1)
+        put_database_cache_entry(department, KEY_DEPT_ALL_OFFICERS, 1)
+        assert get_database_cache_entry(department, KEY_DEPT_ALL_OFFICERS) == 1
+        remove_database_cache_entries(department, [KEY_DEPT_ALL_OFFICERS])
+        assert has_database_cache_entry(department, KEY_DEPT_ALL_OFFICERS) is False
+    finally:
+        DB_CACHE.backend = backend
+
+
+def test_database_cache_stats(session):
+    DB_CACHE_STATS.reset()
+    department = Department(id=1)
+
+    assert get_database_cache_entry(department, KEY_DEPT_ALL_JOBS) is None
+    put_database_cache_entry(department, KEY_DEPT_ALL_JOBS, [1, 2])
+    assert get_database_cache_entry(department, KEY_DEPT_ALL_JOBS) == [1, 2]
+    put_database_cache_entry(Department(id=2), KEY_DEPT_ALL_UNITS, [3])
+    remove_database_cache_entries(department, [KEY_DEPT_ALL_JOBS, KEY_DEPT_ALL_UNITS])
+
+    assert DB_CACHE_STATS.counts[KEY_DEPT_ALL_JOBS] == {
+        CACHE_HITS: 1,
+        CACHE_MISSES: 1,
+        CACHE_INVALIDATIONS: 1,
+    }
+    # Removing an entry that is not cached is not an invalidation
+    assert DB_CACHE_STATS.counts[KEY_DEPT_ALL_UNITS] == {}
+
+    usage_by_type, usage_by_department = database_cache_usage()
+    assert usage_by_type.entries == {KEY_DEPT_ALL_UNITS: 1}
+    assert usage_by_department.entries == {2: 1}
+    assert usage_by_department.bytes[2] == len(
+        pickle.dumps([3], pickle.HIGHEST_PROTOCOL)
+    )
+
+
+def test_purge_database_cache(session):
+    for department_id in (1, 2):
+        put_database_cache_entry(Department(id=department_id), KEY_DEPT_ALL_JOBS, 1)
+        put_database_cache_entry(Department(id=department_id), KEY_DEPT_ALL_UNITS, 1)
+
+    assert purge_database_cache(1) == 2
+    assert not has_database_cache_entry(Department(id=1), KEY_DEPT_ALL_JOBS)
+    assert has_database_cache_entry(Department(id=2), KEY_DEPT_ALL_JOBS)
+    assert purge_database_cache() == 2
+    assert len(DB_CACHE) == 0
+
+
+def test_cache_panel_requires_admin(mockdata, client):
+    with current_app.test_request_context():
+        login_ac(client)
+
+        rv = client.get(url_for("main.cache_panel"))
+        assert rv.status_code == HTTPStatus.FORBIDDEN
+        rv = client.post(url_for("main.purge_cache"))
+        assert rv.status_code == HTTPStatus.FORBIDDEN
+
+
+def test_cache_panel_warm_and_purge(mockdata, client):
+    with current_app.test_request_context():
+        login_admin(client)
+        department = Department.query.first()
+
+        rv = client.post(
+            url_for("main.warm_cache"),
+            data={"department_id": department.id},
+            follow_redirects=True,
+        )
+        assert rv.status_code == HTTPStatus.OK
+        for update_type in (KEY_DEPT_ALL_JOBS, KEY_DEPT_ALL_OFFICERS):
+            assert has_database_cache_entry(department, update_type)
+
+        rv = client.get(url_for("main.cache_panel"))
+        assert rv.status_code == HTTPStatus.OK
+        assert KEY_DEPT_ALL_INCIDENTS in rv.data.decode(ENCODING_UTF_8)
+
+        rv = client.post(
+            url_for("main.purge_cache"),
+            data={"department_id": department.id},
+            follow_redirects=True,
+        )
+        assert rv.status_code == HTTPStatus.OK
+        assert "Removed 8 cache entries" in rv.data.decode(ENCODING_UTF_8)
+        assert not has_database_cache_entry(department, KEY_DEPT_ALL_OFFICERS)
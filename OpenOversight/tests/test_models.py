@@ -10,6 +10,7 @@ from sqlalchemy.exc import IntegrityError
 from OpenOversight.app.models.database import (
     Assignment,
     Department,
+    DepartmentStats,
     Face,
     Image,
     Incident,
@@ -19,8 +20,11 @@ from OpenOversight.app.models.database import (
     Location,
     Officer,
     Salary,
+    Tombstone,
     Unit,
     User,
+    department_stats_query,
+    refresh_department_stats,
 )
 from OpenOversight.app.utils.choices import STATE_CHOICES
 from OpenOversight.tests.conftest import SPRINGFIELD_PD
@@ -629,6 +633,180 @@ def test_officer_incident_sort_order(mockdata, session):
     assert officer.incidents == sorted_incidents
 
 
+def test_officer_current_assignment_tracks_assignments(mockdata, session):
+    department = Department.query.filter_by(name=SPRINGFIELD_PD.name).one()
+    job = Job.query.filter_by(department_id=department.id).first()
+    officer = Officer(department_id=department.id, first_name="Tim", last_name="Q")
+    session.add(officer)
+    session.commit()
+    assert officer.current_assignment is None
+    assert officer.currently_on_force() == "Uncertain"
+
+    undated = Assignment(officer_id=officer.id, job_id=job.id, star_no="1")
+    older = Assignment(
+        officer_id=officer.id,
+        job_id=job.id,
+        star_no="2",
+        start_date=datetime.date(2010, 1, 1),
+        resign_date=datetime.date(2015, 1, 1),
+    )
+    newer = Assignment(
+        officer_id=officer.id,
+        job_id=job.id,
+        star_no="3",
+        start_date=datetime.date(2015, 1, 1),
+    )
+    session.add_all([undated, older, newer])
+    session.commit()
+    assert officer.current_assignment == newer
+    assert officer.badge_number() == "3"
+    assert officer.job_title() == job.job_title
+    assert officer.currently_on_force() == "Yes"
+
+    newer.start_date = datetime.date(2005, 1, 1)
+    session.commit()
+    assert officer.current_assignment == older
+    assert officer.currently_on_force() == "No"
+
+    session.delete(older)
+    session.commit()
+    assert officer.current_assignment == newer
+
+    other_officer = Officer.query.filter(Officer.id != officer.id).first()
+    newer.officer_id = other_officer.id
+    session.commit()
+    assert officer.current_assignment == undated
+    assert other_officer.current_assignment == max(
+        other_officer.assignments, key=lambda a: a.start_date or datetime.date.min
+    )
+
+
+def test_department_stats_track_changes(mockdata, session):
+    def assert_stats_are_current():
+        stats = {
+            row.department_id: (row.officers, row.assignments, row.incidents)
+            for row in DepartmentStats.query.populate_existing()
+        }
+        for row in session.execute(department_stats_query()):
+            assert stats.get(row.department_id, (0, 0, 0)) == (
+                row.officers,
+                row.assignments,
+                row.incidents,
+            )
+
+    assert_stats_are_current()
+
+    officer = Officer.query.filter(Officer.assignments.any()).first()
+    new_department = Department(name="Stats PD", short_name="SPD", state="IL")
+    session.add(new_department)
+    session.flush()
+    officer.department_id = new_department.id
+    session.add(Incident(department_id=new_department.id, officers=[officer]))
+    session.commit()
+    assert new_department.total_documented_officers() == 1
+    assert new_department.total_documented_assignments() == len(officer.assignments)
+    assert new_department.total_documented_incidents() == 1
+    assert_stats_are_current()
+
+    session.delete(officer.assignments[0])
+    session.commit()
+    assert_stats_are_current()
+
+    # The commit expired the assignment, which is still moved away from its officer
+    other_officer = Officer.query.filter(
+        Officer.department_id != new_department.id, Officer.assignments.any()
+    ).first()
+    assignment = other_officer.assignments[0]
+    session.commit()
+    assignment.officer_id = officer.id
+    session.commit()
+    assert_stats_are_current()
+
+    session.delete(Incident.query.filter_by(department_id=new_department.id).one())
+    session.commit()
+    assert_stats_are_current()
+
+    # Departments without stats are recounted
+    session.query(DepartmentStats).delete()
+    session.add(Officer(department_id=new_department.id, first_name="Another"))
+    session.commit()
+    assert new_department.total_documented_officers() == 2
+    assert new_department.total_documented_assignments() == len(officer.assignments)
+
+    session.query(DepartmentStats).delete()
+    refresh_department_stats(session.connection())
+    assert_stats_are_current()
+
+
+def test_department_generation_tracks_export_changes(mockdata, session):
+    def generations():
+        return {
+            row.department_id: row.generation
+            for row in DepartmentStats.query.populate_existing()
+        }
+
+    officer = Officer.query.filter(Officer.links.any()).first()
+    department_id = officer.department_id
+    other_ids = {
+        department.id
+        for department in Department.query.filter(Department.id != department_id)
+    }
+
+    def assert_only_department_bumped(before):
+        after = generations()
+        assert after[department_id] == before.get(department_id, 0) + 1
+        assert {id: after.get(id) for id in other_ids} == {
+            id: before.get(id) for id in other_ids
+        }
+
+    before = generations()
+    session.add(Salary(officer=officer, salary=100, year=2020, is_fiscal_year=False))
+    session.commit()
+    assert_only_department_bumped(before)
+
+    before = generations()
+    link = officer.links[0]
+    link.title = "Renamed link"
+    session.commit()
+    assert_only_department_bumped(before)
+
+    before = generations()
+    session.delete(link)
+    session.commit()
+    assert_only_department_bumped(before)
+
+    before = generations()
+    Job.query.filter_by(department_id=department_id).first().job_title = "Renamed"
+    session.commit()
+    assert_only_department_bumped(before)
+
+    # Reading data does not change it
+    before = generations()
+    officer.first_name = officer.first_name
+    session.commit()
+    assert generations() == before
+
+
+def test_tombstones_record_deleted_rows(mockdata, session):
+    officer = Officer.query.filter(
+        Officer.links.any(), Officer.assignments.any()
+    ).first()
+    assignment, link = officer.assignments[0], officer.links[0]
+    link_departments = {linked.department_id for linked in link.officers}
+    assignment_id, link_id = assignment.id, link.id
+
+    session.delete(assignment)
+    session.delete(link)
+    session.commit()
+
+    assert {
+        (tombstone.table_name, tombstone.record_id, tombstone.department_id)
+        for tombstone in Tombstone.query
+    } == {("assignments", assignment_id, officer.department_id)} | {
+        ("links", link_id, department_id) for department_id in link_departments
+    }
+
+
 def test_user_confirmed_constraint(mockdata, session, faker):
     email = faker.company_email()
 
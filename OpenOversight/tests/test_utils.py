@@ -4,16 +4,36 @@ import pytest
 from flask import current_app
 from flask_login import current_user
 from mock import MagicMock, Mock, patch
-
-from OpenOversight.app.models.database import Department, Image, Officer, Unit
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import joinedload
+
+from OpenOversight.app.models.database import (
+    Department,
+    Face,
+    Image,
+    Incident,
+    Officer,
+    Unit,
+    normalize_star_no,
+)
 from OpenOversight.app.utils.cloud import (
     compute_hash,
     crop_image,
     save_image_to_s3_and_db,
     upload_file_to_s3,
 )
-from OpenOversight.app.utils.db import unit_choices
-from OpenOversight.app.utils.forms import filter_by_form, grab_officers
+from OpenOversight.app.utils.db import (
+    featured_face_filepaths,
+    incident_counts,
+    strict_loading_options,
+    unit_choices,
+)
+from OpenOversight.app.utils.forms import (
+    filter_by_form,
+    grab_officers,
+    text_search_filter,
+)
 from OpenOversight.app.utils.general import allowed_file, validate_redirect_url
 from OpenOversight.tests.routes.route_helpers import login_user
 
@@ -97,6 +117,29 @@ def test_filter_by_name(mockdata):
         assert "J" in element.last_name
 
 
+def test_filter_by_name_ranks_exact_matches_first(mockdata):
+    department = Department.query.first()
+    officer = Officer.query.filter_by(department_id=department.id).first()
+    results = grab_officers(
+        {"last_name": officer.last_name[:-1], "dept": department}
+    ).all()
+    assert officer in results
+
+    results = grab_officers({"last_name": officer.last_name, "dept": department}).all()
+    exact_matches = [o.last_name == officer.last_name for o in results]
+    assert exact_matches == sorted(exact_matches, reverse=True)
+
+
+def test_text_search_filter_uses_trigram_similarity_on_postgresql(mockdata):
+    with patch(
+        "OpenOversight.app.utils.forms.using_postgresql", MagicMock(return_value=True)
+    ):
+        clause = text_search_filter(Officer.last_name, "Tinkel")
+    compiled = str(clause.compile(dialect=postgresql.dialect()))
+    assert "ILIKE" in compiled
+    assert "officers.last_name %%" in compiled
+
+
 def test_filters_do_not_exclude_officers_without_assignments(mockdata):
     department = Department.query.first()
     results = grab_officers({"name": "S", "dept": department})
@@ -112,8 +155,37 @@ def test_filter_by_badge_no(mockdata):
     department = Department.query.first()
     results = grab_officers({"badge": "12", "dept": department})
     for element in results.all():
-        assignment = element.assignments[0]
-        assert "12" in str(assignment.star_no)
+        assert any(
+            assignment.star_no_normalized.startswith("12")
+            for assignment in element.assignments
+        )
+
+
+def test_filter_by_badge_no_matches_complete_badges_exactly(mockdata, session):
+    officer = Officer.query.filter(Officer.assignments.any()).first()
+    other_officer = Officer.query.filter(
+        Officer.assignments.any(), Officer.id != officer.id
+    ).first()
+    officer.assignments[0].star_no = "00 98765"
+    other_officer.assignments[0].star_no = "987654"
+    session.commit()
+
+    results = filter_by_form({"badge": "98765"}, Officer.query).all()
+    assert results == [officer]
+
+    results = filter_by_form({"badge": "9876"}, Officer.query).all()
+    assert set(results) == {officer, other_officer}
+
+    results = filter_by_form({"badge": "*876*"}, Officer.query).all()
+    assert {officer, other_officer} <= set(results)
+
+
+def test_normalize_star_no():
+    assert normalize_star_no(" 00 12a ") == "12A"
+    assert normalize_star_no(123) == "123"
+    assert normalize_star_no("000") == "0"
+    assert normalize_star_no("   ") is None
+    assert normalize_star_no(None) is None
 
 
 def test_filter_by_full_unique_internal_identifier_returns_officers(mockdata):
@@ -298,6 +370,57 @@ def test_crop_image_calls_save_image_to_s3_and_db_with_user_id(mockdata, client)
             assert current_user.id in save_image_to_s3_and_db.call_args[0]
 
 
+def test_featured_face_filepaths(mockdata, session):
+    officers = Officer.query.filter(Officer.face.any()).limit(3).all()
+    no_face_officer = Officer.query.filter(~Officer.face.any()).first()
+    featured_officer = officers[0]
+    featured_face = Face(
+        officer_id=featured_officer.id,
+        img_id=Image.query.filter(~Image.faces.any()).first().id,
+        featured=True,
+    )
+    session.add(featured_face)
+    session.commit()
+
+    filepaths = featured_face_filepaths(
+        [officer.id for officer in officers] + [no_face_officer.id]
+    )
+
+    assert filepaths[featured_officer.id] == featured_face.image.filepath
+    for officer in officers[1:]:
+        first_face = min(officer.face, key=lambda face: face.id)
+        assert filepaths[officer.id] == first_face.image.filepath
+    assert no_face_officer.id not in filepaths
+
+
+def test_incident_counts(mockdata):
+    officers = Officer.query.all()
+
+    counts = incident_counts(officer.id for officer in officers)
+
+    assert counts
+    for officer in officers:
+        assert counts.get(officer.id, 0) == len(officer.incidents)
+
+
+def test_strict_loading_raises_for_undeclared_relationships(mockdata, session):
+    session.expire_all()
+    incident = (
+        Incident.query.options(
+            *strict_loading_options(Incident), joinedload(Incident.address)
+        )
+        .populate_existing()
+        .first()
+    )
+
+    assert incident.address is not None
+    with pytest.raises(InvalidRequestError):
+        assert incident.links
+
+    with patch.dict(current_app.config, {"STRICT_LOADING": False}):
+        assert strict_loading_options(Incident) == []
+
+
 @pytest.mark.parametrize(
     "units, has_officers_with_unit, has_officers_with_no_unit",
     [
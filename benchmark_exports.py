@@ -0,0 +1,378 @@
+"""Compare the department CSV exports, built from column projections, with building
+them from ORM instances the way they used to be.
+
+The benchmark department is created in a transaction that is rolled back afterwards,
+so the database is left as it was.
+"""
+
+import argparse
+import csv
+import io
+import time
+import tracemalloc
+import uuid
+from datetime import date
+from functools import partial
+
+from sqlalchemy import insert, select, text, update
+from sqlalchemy.orm import contains_eager, joinedload, selectinload
+
+from OpenOversight.app import create_app
+from OpenOversight.app.main.downloads import (
+    CSV_BATCH_SIZE,
+    CSV_CHUNK_SIZE,
+    DEPARTMENT_CSV_EXPORTS,
+    check_output,
+    csv_chunks,
+)
+from OpenOversight.app.models.database import (
+    Assignment,
+    Department,
+    Description,
+    Incident,
+    Job,
+    Link,
+    Officer,
+    Salary,
+    db,
+    officer_incidents,
+    officer_links,
+)
+from OpenOversight.app.utils.constants import (
+    KEY_DEPT_ALL_ASSIGNMENTS,
+    KEY_DEPT_ALL_INCIDENTS,
+    KEY_DEPT_ALL_LINKS,
+    KEY_DEPT_ALL_NOTES,
+    KEY_DEPT_ALL_OFFICERS,
+    KEY_DEPT_ALL_SALARIES,
+    KEY_ENV_DEV,
+)
+
+
+app = create_app(KEY_ENV_DEV)
+ctx = app.app_context()
+ctx.push()
+# Keep the development config from logging every statement of the benchmark
+db.engine.echo = False
+
+
+########################################################################################
+# Exports built from ORM instances
+########################################################################################
+
+
+def orm_officer_record(officer):
+    assignment = officer.current_assignment
+    salary = max(officer.salaries, key=lambda s: s.year) if officer.salaries else None
+    return {
+        "id": officer.id,
+        "unique identifier": officer.unique_internal_identifier,
+        "last name": officer.last_name,
+        "first name": officer.first_name,
+        "middle initial": officer.middle_initial,
+        "suffix": officer.suffix,
+        "gender": check_output(officer.gender),
+        "race": check_output(officer.race),
+        "birth year": officer.birth_year,
+        "employment date": officer.employment_date,
+        "badge number": assignment and assignment.star_no,
+        "job title": assignment
+        and assignment.job
+        and check_output(assignment.job.job_title),
+        "most recent salary": salary and salary.salary,
+    }
+
+
+def orm_assignment_record(assignment):
+    return {
+        "id": assignment.id,
+        "officer id": assignment.officer_id,
+        "officer unique identifier": assignment.base_officer.unique_internal_identifier,
+        "badge number": assignment.star_no,
+        "job title": assignment.job and check_output(assignment.job.job_title),
+        "start date": assignment.start_date,
+        "end date": assignment.resign_date,
+        "unit id": assignment.unit and assignment.unit.id,
+        "unit description": assignment.unit and assignment.unit.description,
+    }
+
+
+def orm_incident_record(incident):
+    return {
+        "id": incident.id,
+        "report_num": incident.report_number,
+        "date": incident.date,
+        "time": incident.time,
+        "description": incident.description,
+        "location": incident.address,
+        "licenses": " ".join(map(str, incident.license_plates)),
+        "links": " ".join(map(str, incident.links)),
+        "officers": " ".join(map(str, incident.officers)),
+    }
+
+
+def orm_salary_record(salary):
+    return {
+        "id": salary.id,
+        "officer id": salary.officer_id,
+        "first name": salary.officer.first_name,
+        "last name": salary.officer.last_name,
+        "salary": salary.salary,
+        "overtime_pay": salary.overtime_pay,
+        "year": salary.year,
+        "is_fiscal_year": salary.is_fiscal_year,
+    }
+
+
+def orm_link_record(link):
+    return {
+        "id": link.id,
+        "title": link.title,
+        "url": link.url,
+        "link_type": link.link_type,
+        "description": link.description,
+        "author": link.author,
+        "officers": [officer.id for officer in link.officers],
+        "incidents": [incident.id for incident in link.incidents],
+    }
+
+
+def orm_description_record(description):
+    return {
+        "id": description.id,
+        "text_contents": description.text_contents,
+        "created_by": description.created_by,
+        "officer_id": description.officer_id,
+        "created_at": description.created_at,
+        "last_updated_at": description.last_updated_at,
+    }
+
+
+def orm_exports(department_id):
+    in_department = Officer.department_id == department_id
+    return {
+        KEY_DEPT_ALL_OFFICERS: (
+            db.session.query(Officer)
+            .options(joinedload(Officer.current_assignment).joinedload(Assignment.job))
+            .options(selectinload(Officer.salaries))
+            .filter(in_department),
+            orm_officer_record,
+        ),
+        KEY_DEPT_ALL_ASSIGNMENTS: (
+            db.session.query(Assignment)
+            .join(Assignment.base_officer)
+            .filter(in_department)
+            .options(contains_eager(Assignment.base_officer))
+            .options(joinedload(Assignment.unit), joinedload(Assignment.job)),
+            orm_assignment_record,
+        ),
+        KEY_DEPT_ALL_INCIDENTS: (
+            db.session.query(Incident)
+            .options(
+                joinedload(Incident.address),
+                selectinload(Incident.license_plates),
+                selectinload(Incident.links),
+                selectinload(Incident.officers),
+            )
+            .filter_by(department_id=department_id),
+            orm_incident_record,
+        ),
+        KEY_DEPT_ALL_SALARIES: (
+            db.session.query(Salary)
+            .join(Salary.officer)
+            .filter(in_department)
+            .options(contains_eager(Salary.officer)),
+            orm_salary_record,
+        ),
+        KEY_DEPT_ALL_LINKS: (
+            db.session.query(Link)
+            .filter(Link.officers.any(in_department))
+            .options(selectinload(Link.officers.and_(in_department))),
+            orm_link_record,
+        ),
+        KEY_DEPT_ALL_NOTES: (
+            db.session.query(Description)
+            .join(Description.officer)
+            .filter(in_department)
+            .options(contains_eager(Description.officer)),
+            orm_description_record,
+        ),
+    }
+
+
+def orm_csv_chunks(update_type, department_id):
+    query, record_maker = orm_exports(department_id)[update_type]
+    csv_output = io.StringIO()
+    csv_writer = csv.DictWriter(
+        csv_output, fieldnames=DEPARTMENT_CSV_EXPORTS[update_type].field_names
+    )
+    csv_writer.writeheader()
+    for entity in query.yield_per(CSV_BATCH_SIZE):
+        csv_writer.writerow(record_maker(entity))
+        if csv_output.tell() >= CSV_CHUNK_SIZE:
+            yield csv_output.getvalue().encode()
+            csv_output.seek(0)
+            csv_output.truncate()
+    yield csv_output.getvalue().encode()
+    # Let the instances go, as the session of a download request would
+    db.session.expunge_all()
+
+
+########################################################################################
+# Benchmark
+########################################################################################
+
+
+def populate(num_officers):
+    department_id = db.session.scalar(
+        insert(Department)
+        .values(name="Benchmark Department", short_name="BENCH", state="IL")
+        .returning(Department.id)
+    )
+    job_id = db.session.scalar(
+        insert(Job)
+        .values(job_title="Police Officer", order=1, department_id=department_id)
+        .returning(Job.id)
+    )
+    db.session.execute(
+        insert(Officer),
+        [
+            {
+                "first_name": f"FIRST{n}",
+                "last_name": f"LAST{n}",
+                "middle_initial": "Q" if n % 3 else None,
+                "gender": "F" if n % 2 else "M",
+                "race": "Not Sure",
+                "birth_year": 1950 + n % 50,
+                "employment_date": date(2000 + n % 20, 1, 1),
+                "department_id": department_id,
+                "unique_internal_identifier": str(uuid.uuid4()),
+            }
+            for n in range(num_officers)
+        ],
+    )
+    officer_ids = db.session.scalars(
+        select(Officer.id).filter_by(department_id=department_id)
+    ).all()
+    db.session.execute(
+        insert(Assignment),
+        [
+            {"officer_id": id, "job_id": job_id, "star_no": str(id)}
+            for id in officer_ids
+        ],
+    )
+    db.session.execute(
+        update(Officer)
+        .where(Officer.department_id == department_id)
+        .values(
+            current_assignment_id=select(Assignment.id)
+            .where(Assignment.officer_id == Officer.id)
+            .scalar_subquery()
+        ),
+        execution_options={"synchronize_session": False},
+    )
+    db.session.execute(
+        insert(Salary),
+        [
+            {
+                "officer_id": id,
+                "salary": 50000 + year,
+                "year": year,
+                "is_fiscal_year": False,
+            }
+            for id in officer_ids
+            for year in (2021, 2022)
+        ],
+    )
+    db.session.execute(
+        insert(Description),
+        [
+            {"officer_id": id, "text_contents": f"Description of officer {id}"}
+            for id in officer_ids[::10]
+        ],
+    )
+    db.session.execute(
+        insert(Link),
+        [
+            {
+                "title": "Benchmark",
+                "url": f"https://example.org/{n}",
+                "link_type": "link",
+            }
+            for n in range(len(officer_ids) // 10)
+        ],
+    )
+    link_ids = db.session.scalars(select(Link.id).filter_by(title="Benchmark")).all()
+    db.session.execute(
+        insert(officer_links),
+        [
+            {"officer_id": id, "link_id": link_ids[n // 10]}
+            for n, id in enumerate(officer_ids[: len(link_ids) * 10])
+        ],
+    )
+    db.session.execute(
+        insert(Incident),
+        [
+            {"department_id": department_id, "report_number": str(n)}
+            for n in range(len(officer_ids) // 100)
+        ],
+    )
+    incident_ids = db.session.scalars(
+        select(Incident.id).filter_by(department_id=department_id)
+    ).all()
+    db.session.execute(
+        insert(officer_incidents),
+        [
+            {"officer_id": id, "incident_id": incident_ids[n // 100]}
+            for n, id in enumerate(officer_ids[: len(incident_ids) * 100])
+        ],
+    )
+    # Plan the exports with statistics that include the new rows, as a live database
+    # would have
+    db.session.execute(text("ANALYZE"))
+    return department_id
+
+
+def measure(make_chunks):
+    """Return the number of CSV rows, the seconds taken to write them and the peak
+    memory used doing so, which is traced in a separate run as tracing is slow.
+    """
+    start = time.perf_counter()
+    rows = sum(chunk.count(b"\n") for chunk in make_chunks()) - 1
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in make_chunks():
+        pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, seconds, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n",
+        "--officers",
+        type=int,
+        default=100000,
+        help="number of officers in the benchmark department",
+    )
+    args = parser.parse_args()
+
+    print(f"[*] Populating a department with {args.officers} officers...")
+    department_id = populate(args.officers)
+    try:
+        print(f"{'export':<28}{'path':<8}{'rows':>9}{'rows/s':>12}{'peak MiB':>10}")
+        for update_type, export in DEPARTMENT_CSV_EXPORTS.items():
+            for path, make_chunks in (
+                ("orm", partial(orm_csv_chunks, update_type, department_id)),
+                ("core", partial(csv_chunks, export, department_id)),
+            ):
+                rows, seconds, peak = measure(make_chunks)
+                print(
+                    f"{update_type:<28}{path:<8}{rows:>9}"
+                    f"{rows / seconds:>12.0f}{peak / 2**20:>10.1f}"
+                )
+    finally:
+        db.session.rollback()